@@ -2,17 +2,41 @@
 .. include:: ../README.md
 """
 
-# Transport
-from . import transport
+import importlib
 
-# Accounts
-# from . import accounts
+# Los submódulos y la pila HTTP (requests) se importan la primera vez que se accede a ellos, así
+# `import arriva_api` es casi instantáneo
 
-# Common
-from .rest_adapter import RestAdapter
-#from . import exceptions
-from . import known_servers
+_LAZY = {
+    # Transport
+    "transport": (".transport", None),
+    # Accounts
+    # "accounts": (".accounts", None),
+    # Common
+    "exceptions": (".exceptions", None),
+    "known_servers": (".known_servers", None),
+    "RestAdapter": (".rest_adapter", "RestAdapter"),
+    "DiskCache": (".http_cache", "DiskCache"),
+    "metrics": (".metrics", None),
+    "MetricsCollector": (".metrics", "MetricsCollector"),
+}
 
 
 #__all__ = ["transport", "accounts", "exceptions"]
-__all__ = ["transport"]
+__all__ = ["transport", "exceptions"]
+
+
+def __getattr__(name: str):
+    try:
+        module_name, attribute = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = importlib.import_module(module_name, __name__)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,229 @@
+import aiohttp
+import asyncio
+import inspect
+import json
+import logging
+from typing import Callable
+
+from .exceptions import *
+from .rest_adapter import _unwrap_results
+from .throttling import Backoff, CircuitBreaker, CircuitOpenError, TokenBucket
+
+# What a request through `AsyncRestAdapter` can fail with, for callers that skip the failed requests of a batch
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, TPGalWSException, CircuitOpenError)
+
+
+class AsyncRestAdapter():
+    """
+    asyncio version of `arriva_api.rest_adapter.RestAdapter`, built on aiohttp. Same semantics as `RestAdapter._do`:
+    401 re-authentication through `authentication_function`, results key unwrapping and the TPGalWS* exceptions
+
+    :param url: Base url of the rest service. The known ones are in known_servers.py
+
+    :param token: The token used to authenticate to endpoints that are for logged in users
+
+    :param token_type: The said token's type. In my tests it's always been `Bearer`, so that's the default
+
+    :param logger: If your app has a logger, pass it in here
+
+    :param authentication_function: A Callable (or coroutine function) which must return the token to be used. It will be called when 401 occurs to set the token to its returned value and try again the request
+
+    :param max_auth_recursion_level: The maximum number of times an authentication using `authentication_function` can be tried
+
+    :param max_concurrency: Maximum number of requests in flight at the same time through this adapter
+
+    :param limit_per_host: Maximum number of pooled connections to the same host
+
+    :param keep_alive: Whether to reuse connections between requests
+
+    :param timeout: Total timeout in seconds for each request. None waits forever
+
+    :param rate_limiter: An optional `arriva_api.throttling.TokenBucket`, which can be shared with a `RestAdapter`
+
+    :param retry: An optional `arriva_api.throttling.Backoff` policy to retry network errors and 429/5xx responses
+
+    :param circuit_breaker: An optional `arriva_api.throttling.CircuitBreaker` that fails fast with `CircuitOpenError` while the API is down
+
+    The aiohttp session is created on first use inside the running event loop, and again when the adapter is used
+    from another loop (e.g. a second `asyncio.run`), since a session can't outlive its loop. Call `await close()`
+    or use it as an async context manager to release the connections.
+    """
+
+    def __init__(self, url: str, token: str = None, token_type: str = "Bearer", logger: logging.Logger = None, authentication_function: Callable = None, max_auth_recursion_level: int = 1, max_concurrency: int = 20, limit_per_host: int = 10, keep_alive: bool = True, timeout: float = 30, rate_limiter: TokenBucket = None, retry: Backoff = None, circuit_breaker: CircuitBreaker = None):
+        self.url = url
+        self.token = token
+        self.token_type = token_type
+        self._logger = logger or logging.getLogger(__name__)
+        self._authentication_function = authentication_function
+        self.max_auth_recursion_level = max_auth_recursion_level
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the pooled session, creating it (and the concurrency semaphore) in the running loop if needed
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is not loop:
+            # It belongs to a loop that has finished (or another thread's loop), where it can no longer be closed
+            self._logger.debug(msg="Event loop changed, opening a new session")
+            self._session = None
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             limit_per_host=self.limit_per_host,
+                                             force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        """
+        Close the pooled connections. The adapter can still be used afterwards, it'll open a new session
+        """
+
+        session, self._session = self._session, None
+        if session is not None and self._loop is asyncio.get_running_loop():
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _authenticate(self):
+        token = self._authentication_function()
+        if inspect.isawaitable(token):
+            token = await token
+        self.token = token
+
+    async def _send(self, http_method: str, full_url: str, headers: dict, ep_params: dict = None, data: dict = None) -> tuple[aiohttp.ClientResponse, bytes]:
+        """
+        Send a request through the rate limiter and circuit breaker, retrying according to `retry`.
+        Returns the response and its body, read so that it's still available once the connection is released
+        """
+
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            response, content = await self._send_attempts(http_method, full_url, headers, ep_params, data)
+        except BaseException:
+            # Also when cancelled, so that a trial request doesn't leave the circuit half-open for good
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            if response.status == 429 or response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response, content
+
+    async def _send_attempts(self, http_method: str, full_url: str, headers: dict, ep_params: dict, data: dict) -> tuple[aiohttp.ClientResponse, bytes]:
+        """
+        The attempts of `_send`: the first one and, for the methods `retry` allows, its retries
+        """
+
+        session = self._get_session()
+        max_retries = self.retry.max_retries if self.retry is not None and self.retry.retries(http_method) else 0
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+
+            try:
+                async with self._semaphore:
+                    async with session.request(method=http_method, url=full_url, headers=headers, params=ep_params, json=data) as response:
+                        content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= max_retries:
+                    self._logger.error(msg=(str(e)))
+                    raise e
+                delay = self.retry.delay(attempt)
+                self._logger.debug(msg=f"Retrying in {delay:.2f}s after {e!r}")
+            else:
+                if attempt >= max_retries or response.status not in self.retry.statuses:
+                    return response, content
+                delay = self.retry.delay(attempt, response.headers.get("Retry-After"))
+                self._logger.debug(msg=f"Retrying in {delay:.2f}s after status_code={response.status}")
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _do(self, http_method: str, endpoint: str, ep_params: dict = None, data: dict = None, load_json: bool = True, results_only: bool = True, _auth_recursion_level: int = 0) -> dict:
+        """
+        Make an HTTP request
+
+        :param http_method: The method to use for the request, e.g. GET or POST
+
+        :param endpoint: The endpoint to which the request should be made. This will be appended to self.url
+
+        :param ep_params: The request parameters
+
+        :param data: The request data (It'll be parsed into json)
+
+        :return: The results key from the JSON response of the api (already parsed)
+        """
+
+        full_url = self.url + endpoint
+        headers = {"Authorization": f"{self.token_type} {self.token}"}
+        log_line_pre = f"method={http_method}, url={full_url}, params={ep_params}, data={data}"
+
+        self._logger.debug(msg=log_line_pre)
+        response, content = await self._send(http_method, full_url, headers, ep_params, data)
+
+        if response.status == 401 and self._authentication_function and (_auth_recursion_level < self.max_auth_recursion_level):
+            await self._authenticate()
+            self._logger.debug(msg="Retrying request after authentication")
+            return await self._do(http_method, endpoint, ep_params, data, load_json=load_json, results_only=results_only, _auth_recursion_level=_auth_recursion_level+1)
+        if load_json:
+            try:
+                data_out = json.loads(content)
+            except ValueError as e:
+                if content == b'':
+                    raise TPGalWSBlankResponse(response) from e
+                raise TPGalWSBadJsonException(response) from e
+        else:
+            data_out = response
+            results_only = False  # It is not a dict, so it wouldn't work
+
+        is_success = 299 >= response.status >= 200  # 200 to 299 is OK
+        log_line = f"{log_line_pre}, success={is_success}, status_code={response.status}, message={response.reason}"
+        if is_success:
+            self._logger.debug(msg=log_line)
+            return _unwrap_results(data_out) if results_only else data_out
+        self._logger.error(msg=log_line)
+        raise TPGalWSAppException(response)
+
+    async def get(self, endpoint: str, ep_params: dict = None, **kwargs) -> dict:
+        """
+        Make an HTTP GET request
+        """
+
+        return await self._do(http_method='GET', endpoint=endpoint, ep_params=ep_params, **kwargs)
+
+    async def post(self, endpoint: str, ep_params: dict = None, data: dict = None, **kwargs) -> dict:
+        """
+        Make an HTTP POST request
+        """
+
+        return await self._do(http_method='POST', endpoint=endpoint, ep_params=ep_params, data=data, **kwargs)
+
+    async def patch(self, endpoint: str, ep_params: dict = None, data: dict = None, **kwargs) -> dict:
+        """
+        Make an HTTP PATCH request
+        """
+
+        return await self._do(http_method='PATCH', endpoint=endpoint, ep_params=ep_params, data=data, **kwargs)
@@ -0,0 +1,49 @@
+"""
+Las excepciones que lanzan los adaptadores REST (`arriva_api.rest_adapter.RestAdapter` y
+`arriva_api.async_rest_adapter.AsyncRestAdapter`) cuando una llamada a la API falla
+"""
+
+__all__ = ["TPGalWSException", "TPGalWSAppException", "TPGalWSBlankResponse", "TPGalWSBadJsonException"]
+
+
+class TPGalWSException(Exception):
+    """
+    Base de todas las excepciones de la API. Tiene la respuesta que la provocó
+
+    :param response: La respuesta (de requests o de aiohttp)
+    """
+
+    def __init__(self, response, message: str = None):
+        self.response = response
+        """
+        La respuesta que provocó la excepción
+        """
+
+        super().__init__(message or self._describe(response))
+
+    @staticmethod
+    def _describe(response) -> str:
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+        return f"{status} {getattr(response, 'reason', '')} ({getattr(response, 'url', '')})".strip()
+
+    @property
+    def status_code(self) -> int:
+        return getattr(self.response, "status_code", None) or getattr(self.response, "status", None)
+
+
+class TPGalWSAppException(TPGalWSException):
+    """
+    La API respondió con un código de estado que no es 2xx
+    """
+
+
+class TPGalWSBlankResponse(TPGalWSException):
+    """
+    La API respondió sin cuerpo cuando se esperaba JSON
+    """
+
+
+class TPGalWSBadJsonException(TPGalWSException):
+    """
+    La API respondió con un cuerpo que no es JSON válido
+    """
@@ -0,0 +1,210 @@
+"""
+Persistent on-disk cache for `arriva_api.rest_adapter.RestAdapter` responses
+"""
+
+from fnmatch import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import BinaryIO, Iterable, Iterator
+
+DEFAULT_TTLS = {
+    "/superparadas/index/*": 24 * 3600,
+    "/lineas/index.json": 24 * 3600,
+    "/lineas/view/*": 24 * 3600,
+    "/expediciones/view/*": 24 * 3600,
+    "/buscador/precio/*": 7 * 24 * 3600,
+    "/comunicaciones/*": 5 * 60,
+}
+"""
+Seconds each endpoint pattern is served from disk without asking the server. These are the endpoints whose data
+rarely changes: the stop catalog, the line index, rates and communications
+"""
+
+
+class CacheEntry():
+    """
+    A cached response: its body plus what's needed to revalidate it
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "stored_at")
+
+    def __init__(self, body: bytes, etag: str = None, last_modified: str = None, stored_at: float = None):
+        self.body = body
+        """
+        The raw response body
+        """
+
+        self.etag = etag
+        """
+        The `ETag` header sent by the server, if any
+        """
+
+        self.last_modified = last_modified
+        """
+        The `Last-Modified` header sent by the server, if any
+        """
+
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        """
+        When the response was downloaded or last revalidated (Unix time, so it's comparable between processes)
+        """
+
+    def conditional_headers(self) -> dict:
+        """
+        Headers to ask the server whether this response is still valid
+        """
+
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class DiskCache():
+    """
+    Stores responses as files in `directory`, keyed by method, endpoint and params.
+
+    A response is served straight from disk while it's younger than its endpoint's TTL. Once it expires, it's
+    revalidated with a conditional request (`If-None-Match`/`If-Modified-Since`) when the server sent an ETag or a
+    Last-Modified header, and downloaded again otherwise.
+
+    Files are written to a temporary name and atomically renamed, so several worker processes on the same host can
+    share a directory: readers always see either the old or the new complete response.
+
+    :param directory: Where to store the responses. It'll be created if it doesn't exist
+
+    :param ttls: Mapping of endpoint patterns (`fnmatch` style, e.g. `/lineas/view/*`) to seconds. The first matching pattern wins
+
+    :param default_ttl: Seconds for endpoints that don't match any pattern. None means they aren't cached at all
+    """
+
+    def __init__(self, directory: str, ttls: dict = None, default_ttl: float = None):
+        self.directory = directory
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def ttl(self, endpoint: str) -> float:
+        """
+        The TTL for an endpoint, or None if it shouldn't be cached
+        """
+
+        for pattern, ttl in self.ttls.items():
+            if fnmatch(endpoint, pattern):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def key(http_method: str, endpoint: str, ep_params: dict = None, scope: str = "") -> str:
+        """
+        The cache key for a request. The params are sorted, so their order doesn't matter
+
+        :param scope: What else the response depends on besides the endpoint, e.g. the base URL and credentials of
+        the adapter, so adapters for different servers or users can share a directory without reading each other's
+        entries. It's hashed along with the rest, so it isn't stored in clear
+        """
+
+        params = sorted((str(k), str(v)) for k, v in (ep_params or {}).items())
+        return hashlib.sha256(json.dumps([http_method.upper(), scope, endpoint, params]).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def open(self, key: str) -> tuple[CacheEntry, BinaryIO]:
+        """
+        Opens an entry to read its body in chunks. Returns the entry (without body) and the file positioned at the
+        body, which the caller must close, or None if it isn't cached (or the file is unreadable)
+        """
+
+        try:
+            f = open(self._path(key), "rb")
+        except OSError:
+            return None
+        try:
+            meta = json.loads(f.readline())
+            return CacheEntry(body=None, etag=meta.get("etag"), last_modified=meta.get("last_modified"), stored_at=meta["stored_at"]), f
+        except (OSError, ValueError, KeyError):
+            f.close()
+            return None
+
+    def load(self, key: str) -> CacheEntry:
+        """
+        Reads an entry, or returns None if it isn't cached (or the file is unreadable)
+        """
+
+        opened = self.open(key)
+        if opened is None:
+            return None
+        entry, f = opened
+        with f:
+            try:
+                entry.body = f.read()
+            except OSError:
+                return None
+        return entry
+
+    def store(self, key: str, entry: CacheEntry):
+        """
+        Writes an entry atomically
+        """
+
+        for _ in self.store_chunks(key, (entry.body,), entry.etag, entry.last_modified, entry.stored_at):
+            pass
+
+    def store_chunks(self, key: str, chunks: Iterable[bytes], etag: str = None, last_modified: str = None, stored_at: float = None) -> Iterator[bytes]:
+        """
+        Writes an entry whose body arrives in chunks, yielding each chunk after writing it. The entry only replaces
+        the previous one once every chunk has been consumed; if the caller stops early, nothing is stored
+        """
+
+        meta = json.dumps({"etag": etag, "last_modified": last_modified, "stored_at": stored_at if stored_at is not None else time.time()})
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(meta.encode() + b"\n")
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def is_fresh(self, endpoint: str, entry: CacheEntry) -> bool:
+        """
+        Whether an entry can be served without asking the server
+        """
+
+        ttl = self.ttl(endpoint)
+        return ttl is not None and time.time() - entry.stored_at < ttl
+
+    def invalidate(self, key: str):
+        """
+        Removes an entry
+        """
+
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """
+        Removes every entry. Files still being written (by this or another process) are left alone
+        """
+
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue
+            try:
+                os.unlink(self._path(name))
+            except OSError:
+                pass
@@ -0,0 +1,210 @@
+"""
+Incremental parsing of large JSON documents: yields the items of one array inside the document as the bytes arrive,
+so neither the whole body nor the whole parsed tree have to be held in memory
+"""
+
+import codecs
+import json
+import re
+from typing import Iterable, Iterator
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+_SEPARATORS = re.compile(r"[ \t\n\r,]*")
+
+
+class _Reader():
+    """
+    A growing text buffer fed from an iterable of byte (or str) chunks
+    """
+
+    def __init__(self, chunks: Iterable):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.eof = False
+
+    def more(self) -> bool:
+        """
+        Appends the next chunk to the buffer. Returns False once there's nothing left
+        """
+
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self._decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def drain(self):
+        """
+        Consumes the chunks left without keeping them, so that the source is read to the end (e.g. to release the
+        connection or finish writing a cache entry)
+        """
+
+        for _ in self._chunks:
+            pass
+        self.eof = True
+
+    def discard(self, position: int):
+        """
+        Drops what's already been consumed
+        """
+
+        self.buffer = self.buffer[position:]
+
+
+def _find_array(reader: _Reader, path: tuple, root_array_ok: bool, wrapper: str = None) -> int:
+    """
+    Scans until the opening bracket of the array at `path` and returns the buffer position right after it. If the
+    document has a top-level `wrapper` key, `path` is followed from its value instead
+    """
+
+    position = 0
+    stack = []  # Containers we're in, "{" or "["
+    matched = 0  # How many keys of the path we're inside of
+    base = 0  # 1 while inside the wrapper
+    in_string = escape = expect_key = False
+    key_start = None
+    last_key = None
+    want_container = None  # After a matched key, the container that must follow
+    want_wrapper = False  # After the wrapper key
+
+    while True:
+        if position >= len(reader.buffer):
+            # Keep a key that's being read
+            keep = key_start if key_start is not None else position
+            reader.discard(keep)
+            position -= keep
+            if key_start is not None:
+                key_start = 0
+            if not reader.more():
+                raise ValueError(f"JSON array at {path} not found")
+            continue
+
+        char = reader.buffer[position]
+        position += 1
+
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                if key_start is not None:
+                    last_key = json.loads(reader.buffer[key_start:position])
+                    key_start = None
+            continue
+
+        if char in _WHITESPACE:
+            continue
+
+        if want_wrapper:
+            want_wrapper = False
+            if char == "[" and not path:
+                return position
+            if char == "{":
+                stack.append(char)
+                base = 1
+                expect_key = True
+                continue
+
+        if want_container is not None:
+            if char != want_container:
+                raise ValueError(f"JSON value at {path[:matched]} is not {'an array' if want_container == '[' else 'an object'}")
+            want_container = None
+            if char == "[":
+                return position
+            stack.append(char)
+            expect_key = True
+            continue
+
+        if not stack:
+            if char == "[" and (not path or root_array_ok):
+                return position
+            if char != "{" or not (path or wrapper):
+                raise ValueError("JSON document doesn't have the expected structure")
+            stack.append(char)
+            expect_key = True
+        elif char == '"':
+            in_string = True
+            if expect_key and stack[-1] == "{" and len(stack) == base + matched + 1:
+                key_start = position - 1
+        elif char == ":":
+            expect_key = False
+            if len(stack) == base + matched + 1:
+                if matched < len(path) and last_key == path[matched]:
+                    matched += 1
+                    want_container = "[" if matched == len(path) else "{"
+                elif wrapper is not None and base == 0 and matched == 0 and last_key == wrapper:
+                    want_wrapper = True
+            last_key = None
+        elif char == ",":
+            expect_key = stack[-1] == "{"
+        elif char in "{[":
+            stack.append(char)
+            expect_key = char == "{"
+        elif char in "}]":
+            stack.pop()
+            if len(stack) < base + matched:
+                raise ValueError(f"JSON array at {path} not found")
+            if base and len(stack) == base and not matched:
+                base = 0  # The wrapper ended without the array, keep looking at the top level
+
+
+def iter_array_items(chunks: Iterable, path: tuple = (), root_array_ok: bool = False, wrapper: str = None) -> Iterator:
+    """
+    Yields, one by one and already parsed, the items of the JSON array found following the object keys in `path`
+
+    :param chunks: The document as an iterable of bytes (UTF-8) or str chunks, e.g. `response.iter_content()`
+
+    :param path: Keys leading to the array, e.g. `("paradas",)` for `{"paradas": [...]}`. Empty for a top-level array
+
+    :param root_array_ok: If the document itself is an array, yield its items even though `path` isn't empty (like `RestAdapter` does with the results key)
+
+    :param wrapper: A top-level key that, when present, contains the object `path` starts from (like the results key `RestAdapter` unwraps). With an empty `path`, its value is the array
+    """
+
+    reader = _Reader(chunks)
+    position = _find_array(reader, tuple(path), root_array_ok, wrapper)
+    decoder = json.JSONDecoder()
+
+    while True:
+        buffer = reader.buffer
+        position = _SEPARATORS.match(buffer, position).end()
+        if position >= len(buffer):
+            reader.discard(position)
+            position = 0
+            if not reader.more():
+                raise ValueError("Unexpected end of JSON array")
+            continue
+
+        char = buffer[position]
+        if char == "]":
+            reader.drain()
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            end = None
+        # A scalar that isn't followed by a delimiter may be cut (e.g. the number 1.5 out of 1.5e3)
+        if end is not None and char not in '{["' and not reader.eof and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+            end = None
+        if end is None:
+            if reader.eof:
+                raise ValueError("Unexpected end of JSON array")
+            reader.discard(position)
+            position = 0
+            reader.more()
+            continue
+
+        yield item
+        position = end
+        # Keep the buffer small
+        if position > 65536:
+            reader.discard(position)
+            position = 0
@@ -0,0 +1,263 @@
+"""
+Instrumentation hooks for `arriva_api.rest_adapter.RestAdapter`, plus an in-memory collector that exports its metrics
+in the Prometheus text format.
+
+The adapter calls its `hooks` at each step of a request. They are None by default, which costs a single attribute
+check per step. Subclass `Hooks` to plug in tracing or another metrics library, or use `MetricsCollector`:
+
+``` python
+from arriva_api import transport
+from arriva_api.metrics import MetricsCollector
+
+metrics = transport._rest_adapter.hooks = MetricsCollector()
+transport.stops.search_stops("Santiago")
+print(metrics.to_prometheus())
+```
+"""
+
+from bisect import bisect_left
+import re
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""
+Upper bounds in seconds of the request latency and parse time histograms
+"""
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+"""
+Upper bounds in bytes of the payload size histogram
+"""
+
+_IDS = re.compile(r"(?<=/)[0-9]+(?=[/.]|$)")
+
+_CACHE_LAYERS = {"disk": frozenset({"hit", "miss", "revalidated"}), "shared": frozenset({"memo", "coalesced", "fetched"})}
+_CACHE_MISSES = frozenset({"miss", "fetched"})
+
+
+def endpoint_template(endpoint: str) -> str:
+    """
+    The endpoint with its numeric ids replaced by `{id}`, e.g. `/buscador/precio/{id}/{id}.json`, so that metrics
+    have one series per endpoint instead of one per stop or bus
+    """
+
+    return _IDS.sub("{id}", endpoint)
+
+
+def escape_label_value(value) -> str:
+    """
+    A Prometheus label value with its backslashes, double quotes and line feeds escaped
+    """
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Hooks():
+    """
+    Instrumentation interface of `RestAdapter`. Every method is a no-op, override the ones you need. They're called
+    from the thread making the request, so implementations must be thread-safe and fast
+
+    `endpoint` is always the raw endpoint, e.g. `/buscador/precio/15004/15018.json` (see `endpoint_template`)
+    """
+
+    def request_started(self, method: str, endpoint: str):
+        """
+        Called before each attempt is sent. Whatever it returns (e.g. a tracing span) is passed to `request_finished`
+        """
+
+        return None
+
+    def request_finished(self, context, method: str, endpoint: str, status: int, seconds: float, size: int, error: BaseException = None):
+        """
+        Called after each attempt, including the ones that will be retried
+
+        :param status: The response status code, None if the request failed without a response
+        :param seconds: Time until the response headers (or the body, when it isn't streamed) arrived
+        :param size: Bytes of the body if known, otherwise None
+        :param error: The exception if the request failed without a response
+        """
+
+    def parsed(self, method: str, endpoint: str, seconds: float):
+        """
+        Called after a JSON body is parsed
+        """
+
+    def cache_event(self, method: str, endpoint: str, event: str):
+        """
+        Called when a response is looked up in a cache. `event` is `hit`, `miss` or `revalidated` for the disk cache.
+        For shared GETs (see `RestAdapter.get`) it's `memo` when the response came from the memo, `coalesced` when it
+        was shared with a request in flight and `fetched` when neither, so the request goes on (to the disk cache, if
+        any, and the API)
+        """
+
+    def retried(self, method: str, endpoint: str, attempt: int, reason: str):
+        """
+        Called before a retry. `reason` is the status code or the exception class name
+        """
+
+    def authenticated(self, method: str, endpoint: str):
+        """
+        Called when a 401 made the adapter call its `authentication_function`
+        """
+
+
+class _Histogram():
+    """
+    Counts of observations per bucket, with their sum
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """
+        Pairs (upper bound, observations less than or equal to it), ending with `+Inf`
+        """
+
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class MetricsCollector(Hooks):
+    """
+    Hooks that keep, per method and endpoint template: request counts by status, latency, payload size and parse
+    time histograms, cache events, retries and authentications. Thread-safe
+
+    :param latency_buckets: Bounds of the latency and parse time histograms, in seconds
+    :param size_buckets: Bounds of the payload size histogram, in bytes
+    """
+
+    def __init__(self, latency_buckets: tuple = LATENCY_BUCKETS, size_buckets: tuple = SIZE_BUCKETS):
+        self.latency_buckets = tuple(latency_buckets)
+        self.size_buckets = tuple(size_buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything collected so far
+        """
+
+        with self._lock:
+            self.requests = {}
+            """
+            Attempts per (method, endpoint template, status). The status is `error` if there was no response
+            """
+
+            self.latency = {}
+            self.sizes = {}
+            self.parse_time = {}
+            self.cache_events = {}
+            """
+            Cache lookups per (method, endpoint template, event)
+            """
+
+            self.retries = {}
+            """
+            Retries per (method, endpoint template, reason)
+            """
+
+            self.authentications = {}
+            """
+            Authentications per (method, endpoint template)
+            """
+
+    def _count(self, counter: dict, key: tuple):
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+    def _observe(self, histograms: dict, buckets: tuple, key: tuple, value: float):
+        with self._lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def request_finished(self, context, method: str, endpoint: str, status: int, seconds: float, size: int, error: BaseException = None):
+        template = endpoint_template(endpoint)
+        self._count(self.requests, (method, template, "error" if status is None else str(status)))
+        self._observe(self.latency, self.latency_buckets, (method, template), seconds)
+        if size is not None:
+            self._observe(self.sizes, self.size_buckets, (method, template), size)
+
+    def parsed(self, method: str, endpoint: str, seconds: float):
+        self._observe(self.parse_time, self.latency_buckets, (method, endpoint_template(endpoint)), seconds)
+
+    def cache_event(self, method: str, endpoint: str, event: str):
+        self._count(self.cache_events, (method, endpoint_template(endpoint), event))
+
+    def retried(self, method: str, endpoint: str, attempt: int, reason: str):
+        self._count(self.retries, (method, endpoint_template(endpoint), reason))
+
+    def authenticated(self, method: str, endpoint: str):
+        self._count(self.authentications, (method, endpoint_template(endpoint)))
+
+    def cache_hit_rate(self, layer: str = None) -> float:
+        """
+        Fraction of cache lookups that were answered by the cache, or None if there weren't any
+
+        :param layer: `disk` for the disk cache (`hit` and `revalidated` out of those plus `miss`), `shared` for the
+            memo and coalescing (`memo` and `coalesced` out of those plus `fetched`). By default both: each layer a
+            request goes through counts as one lookup
+        """
+
+        events = _CACHE_LAYERS[layer] if layer is not None else _CACHE_LAYERS["disk"] | _CACHE_LAYERS["shared"]
+        with self._lock:
+            counts = [(event, count) for (_, _, event), count in self.cache_events.items() if event in events]
+        total = sum(count for _, count in counts)
+        misses = sum(count for event, count in counts if event in _CACHE_MISSES)
+        return None if total == 0 else (total - misses) / total
+
+    def to_prometheus(self, prefix: str = "arriva") -> str:
+        """
+        The metrics in the Prometheus text exposition format
+        """
+
+        def labels(method: str, endpoint: str, **extra) -> str:
+            pairs = {"method": method, "endpoint": endpoint, **extra}
+            return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in pairs.items()) + "}"
+
+        lines = []
+
+        def counter(name: str, help: str, values: dict, extra_label: str = None):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for key, value in sorted(values.items()):
+                extra = {extra_label: key[2]} if extra_label else {}
+                lines.append(f"{prefix}_{name}{labels(key[0], key[1], **extra)} {value}")
+
+        def histogram(name: str, help: str, values: dict):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for (method, endpoint), value in sorted(values.items()):
+                for bound, count in value.cumulative():
+                    lines.append(f"{prefix}_{name}_bucket{labels(method, endpoint, le=bound)} {count}")
+                lines.append(f"{prefix}_{name}_sum{labels(method, endpoint)} {value.sum}")
+                lines.append(f"{prefix}_{name}_count{labels(method, endpoint)} {value.count}")
+
+        with self._lock:
+            counter("http_requests_total", "Requests sent to the API, by response status", self.requests, "status")
+            histogram("http_request_duration_seconds", "Time until the API responded", self.latency)
+            histogram("http_response_size_bytes", "Size of the response bodies", self.sizes)
+            histogram("json_parse_duration_seconds", "Time spent parsing JSON responses", self.parse_time)
+            counter("cache_events_total", "Cache lookups, by result", self.cache_events, "event")
+            counter("http_retries_total", "Requests retried, by reason", self.retries, "reason")
+            lines.append(f"# HELP {prefix}_authentications_total Re-authentications after a 401")
+            lines.append(f"# TYPE {prefix}_authentications_total counter")
+            for (method, endpoint), value in sorted(self.authentications.items()):
+                lines.append(f"{prefix}_authentications_total{labels(method, endpoint)} {value}")
+        return "\n".join(lines) + "\n"
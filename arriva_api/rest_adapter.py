@@ -1,9 +1,46 @@
 import requests
+from requests.adapters import HTTPAdapter
+import json
 from json import JSONDecodeError
 import logging
-from typing import Callable
+from collections import OrderedDict
+import threading
+import time
+from typing import Callable, Iterator
 
 from .exceptions import *
+from .http_cache import CacheEntry, DiskCache
+from .json_stream import iter_array_items
+from .metrics import Hooks
+from .throttling import Backoff, CircuitBreaker, CircuitOpenError, TokenBucket
+
+# What a request through `RestAdapter` can fail with, for callers that skip the failed requests of a batch
+REQUEST_ERRORS = (requests.exceptions.RequestException, TPGalWSException, CircuitOpenError)
+
+
+def _unwrap_results(data_out):
+    """
+    Returns the results key of a parsed response, or the whole response if it doesn't have one
+    """
+
+    try:
+        # In XenteNovaQr the results key doesn't exist
+        return data_out.get("results", data_out)
+    except AttributeError:
+        return data_out  # For XenteNovaQR Account.get_qrs(), the API returns a list
+
+
+class _InFlight():
+    """
+    A GET being made by one thread, which other threads asking for the same thing wait for
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
 
 class RestAdapter():
@@ -21,17 +58,175 @@ class RestAdapter():
     :param authentication_function: A Callable which must return the token to be used. It will be called when 401 occurs to set the token to its returned value and try again the request
 
     :param max_auth_recursion_level: The maximum number of times an authentication using `authentication_function` can be tried
+
+    :param pool_connections: The number of per-host connection pools to keep cached
+
+    :param pool_maxsize: The maximum number of connections kept alive in each host's pool
+
+    :param pool_block: Whether to wait for a free connection when a host's pool is full instead of opening a throwaway one
+
+    :param keep_alive: Whether to reuse connections between requests. Setting it to False sends `Connection: close`
+
+    :param timeout: Timeout in seconds passed to every request, either a single value or a `(connect, read)` tuple. None waits forever
+
+    :param cache: An optional `arriva_api.http_cache.DiskCache` where GET responses are persisted between runs
+
+    :param coalesce: Whether concurrent identical GETs share a single request and response
+
+    :param memo_ttl: Seconds a GET's parsed response is reused for identical GETs (0 disables it). Callers share the returned object, so it must not be modified
+
+    :param memo_size: Maximum number of responses kept for `memo_ttl`. The least recently used are evicted first
+
+    :param rate_limiter: An optional `arriva_api.throttling.TokenBucket` every request takes a token from. Share it between adapters to share the limit
+
+    :param retry: An optional `arriva_api.throttling.Backoff` policy to retry network errors and 429/5xx responses
+
+    :param circuit_breaker: An optional `arriva_api.throttling.CircuitBreaker` that fails fast with `CircuitOpenError` while the API is down
+
+    :param hooks: Optional `arriva_api.metrics.Hooks` called at each step of a request (attempts, parsing, cache lookups, retries, authentications), e.g. a `arriva_api.metrics.MetricsCollector`
+
+    The adapter owns a `requests.Session`, so every module sharing an adapter also shares its connection pool.
+    Call `close()` or use it as a context manager to release the connections.
     """
 
-    def __init__(self, url: str, token: str = None, token_type: str = "Bearer", logger: logging.Logger = None, authentication_function: Callable = None, max_auth_recursion_level: int = 1):
+    def __init__(self, url: str, token: str = None, token_type: str = "Bearer", logger: logging.Logger = None, authentication_function: Callable = None, max_auth_recursion_level: int = 1, pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False, keep_alive: bool = True, timeout: float | tuple = (5, 30), cache: DiskCache = None, coalesce: bool = True, memo_ttl: float = 0, memo_size: int = 256, rate_limiter: TokenBucket = None, retry: Backoff = None, circuit_breaker: CircuitBreaker = None, hooks: Hooks = None):
         self.url = url
         self.token = token
         self.token_type = token_type
         self._logger = logger or logging.getLogger(__name__)
         self._authentication_function = authentication_function
         self.max_auth_recursion_level = max_auth_recursion_level
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.cache = cache
+        self.coalesce = coalesce
+        self.memo_ttl = memo_ttl
+        self.memo_size = memo_size
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.hooks = hooks
+        self._memo = OrderedDict()
+        self._inflight = {}
+        self._shared_lock = threading.Lock()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        """
+        Build a session whose adapters pool connections according to this adapter's settings
+        """
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        The pooled session used for every request. It's created on first use, and again after `close()`
+        """
+
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
 
-    def _do(self, http_method: str, endpoint: str, ep_params: dict = None, data: dict = None, load_json: bool = True, results_only: bool = True, _auth_recursion_level: int = 0) -> dict:
+    def close(self):
+        """
+        Close the pooled connections. The adapter can still be used afterwards, it'll open a new pool
+        """
+
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send(self, http_method: str, endpoint: str, headers: dict, ep_params: dict = None, data: dict = None, stream: bool = False) -> requests.Response:
+        """
+        Send a request through the rate limiter and circuit breaker, retrying according to `retry`.
+        With `stream` the body isn't downloaded until it's read
+        """
+
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            response = self._send_attempts(http_method, endpoint, headers, ep_params, data, stream)
+        except BaseException:
+            # Also when interrupted, so that a trial request doesn't leave the circuit half-open for good
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            if response.status_code == 429 or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+
+    def _send_attempts(self, http_method: str, endpoint: str, headers: dict, ep_params: dict, data: dict, stream: bool) -> requests.Response:
+        """
+        The attempts of `_send`: the first one and, for the methods `retry` allows, its retries
+        """
+
+        full_url = self.url + endpoint
+        hooks = self.hooks
+        max_retries = self.retry.max_retries if self.retry is not None and self.retry.retries(http_method) else 0
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            if hooks is not None:
+                context = hooks.request_started(http_method, endpoint)
+                started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method=http_method, url=full_url, headers=headers, params=ep_params, json=data, timeout=self.timeout, stream=stream)
+            except requests.exceptions.RequestException as e:
+                if hooks is not None:
+                    hooks.request_finished(context, http_method, endpoint, None, time.perf_counter() - started, None, e)
+                if attempt >= max_retries:
+                    self._logger.error("%s", e)
+                    raise e
+                delay = self.retry.delay(attempt)
+                self._logger.debug("Retrying in %.2fs after %s", delay, e)
+                if hooks is not None:
+                    hooks.retried(http_method, endpoint, attempt + 1, type(e).__name__)
+            else:
+                if hooks is not None:
+                    size = response.headers.get("Content-Length") if stream else len(response.content)
+                    hooks.request_finished(context, http_method, endpoint, response.status_code, time.perf_counter() - started,
+                                           int(size) if size is not None and str(size).isdigit() else None)
+                if attempt >= max_retries or response.status_code not in self.retry.statuses:
+                    return response
+                delay = self.retry.delay(attempt, response.headers.get("Retry-After"))
+                self._logger.debug("Retrying in %.2fs after status_code=%s", delay, response.status_code)
+                if hooks is not None:
+                    hooks.retried(http_method, endpoint, attempt + 1, str(response.status_code))
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _do(self, http_method: str, endpoint: str, ep_params: dict = None, data: dict = None, load_json: bool = True, results_only: bool = True, revalidate: bool = False, _auth_recursion_level: int = 0) -> dict:
         """
         Make an HTTP request
 
@@ -43,60 +238,272 @@ class RestAdapter():
 
         :param data: The request data (It'll be parsed into json)
 
+        :param revalidate: Ask the server even if the disk cache entry is fresh. It's still a conditional request, so an unchanged response isn't downloaded again
+
         :return: The results key from the JSON response of the api (already parsed)
         """
 
-        full_url = self.url + endpoint
         headers = {"Authorization": f"{self.token_type} {self.token}"}
+        hooks = self.hooks
+        # The log lines are only formatted if they are going to be emitted
+        log_args = (http_method, self.url + endpoint, ep_params, data)
 
-        def _escape_dict(data: dict) -> str:
-            return str(data).replace("{", "{{").replace("}", "}}")
-
-        log_line_pre = f"method={http_method}, url={full_url}, params={_escape_dict(ep_params)}, data={_escape_dict(data)}"
-        log_line_post = ', '.join(
-            (log_line_pre, "success={}, status_code={}, message={}"))
+        cache_key = cached = None
+        if self.cache is not None and http_method == 'GET' and load_json and self.cache.ttl(endpoint) is not None:
+            cache_key = self._cache_key(http_method, endpoint, ep_params)
+            cached = self.cache.load(cache_key)
+            if cached is not None:
+                if not revalidate and self.cache.is_fresh(endpoint, cached):
+                    self._logger.debug("method=%s, url=%s, params=%s, data=%s, cached=True", *log_args)
+                    if hooks is not None:
+                        hooks.cache_event(http_method, endpoint, "hit")
+                    return self._parse_cached(cached, results_only, http_method, endpoint)
+                headers.update(cached.conditional_headers())
+            if hooks is not None and cached is None:
+                hooks.cache_event(http_method, endpoint, "miss")
 
-        try:
-            self._logger.debug(msg=log_line_pre)
-            response = requests.request(
-                method=http_method, url=full_url, headers=headers, params=ep_params, json=data)
-        except requests.exceptions.RequestException as e:
-            self._logger.error(msg=(str(e)))
-            raise e
+        self._logger.debug("method=%s, url=%s, params=%s, data=%s", *log_args)
+        response = self._send(http_method, endpoint, headers, ep_params, data)
 
         if response.status_code == 401 and self._authentication_function and (_auth_recursion_level < self.max_auth_recursion_level):
             self.token = self._authentication_function()
-            self._logger.debug(msg="Retrying request after authentication")
-            return self._do(http_method, endpoint, ep_params, data, _auth_recursion_level+1)
+            self._logger.debug("Retrying request after authentication")
+            if hooks is not None:
+                hooks.authenticated(http_method, endpoint)
+            return self._do(http_method, endpoint, ep_params, data, load_json=load_json, results_only=results_only, revalidate=revalidate, _auth_recursion_level=_auth_recursion_level+1)
+        if response.status_code == 304 and cached is not None:
+            self._logger.debug("method=%s, url=%s, params=%s, data=%s, revalidated=True", *log_args)
+            if hooks is not None:
+                hooks.cache_event(http_method, endpoint, "revalidated")
+            cached = CacheEntry(body=cached.body,
+                                etag=response.headers.get("ETag", cached.etag),
+                                last_modified=response.headers.get("Last-Modified", cached.last_modified))
+            self.cache.store(cache_key, cached)
+            return self._parse_cached(cached, results_only, http_method, endpoint)
+        if cached is not None and hooks is not None:
+            hooks.cache_event(http_method, endpoint, "miss")
         if load_json:
+            if hooks is not None:
+                started = time.perf_counter()
             try:
                 data_out = response.json()
             except (ValueError, JSONDecodeError) as e:
                 if response.content == b'':
                     raise TPGalWSBlankResponse(response) from e
                 raise TPGalWSBadJsonException(response) from e
+            if hooks is not None:
+                hooks.parsed(http_method, endpoint, time.perf_counter() - started)
         else:
             data_out = response
             results_only = False  # It is not a dict, so it wouldn't work
 
         is_success = 299 >= response.status_code >= 200  # 200 to 299 is OK
-        log_line = log_line_post.format(
-            is_success, response.status_code, response.reason)
+        log_line = "method=%s, url=%s, params=%s, data=%s, success=%s, status_code=%s, message=%s"
         if is_success:
-            self._logger.debug(msg=log_line)
-            try:
-                # In XenteNovaQr the results key doesn't exist
-                return data_out.get("results", data_out) if results_only else data_out
-            except AttributeError:
-                return data_out  # For XenteNovaQR Account.get_qrs(), the API returns a list
-        self._logger.error(msg=log_line)
+            self._logger.debug(log_line, *log_args, is_success, response.status_code, response.reason)
+            if cache_key is not None:
+                self.cache.store(cache_key, CacheEntry(body=response.content,
+                                                       etag=response.headers.get("ETag"),
+                                                       last_modified=response.headers.get("Last-Modified")))
+            return _unwrap_results(data_out) if results_only else data_out
+        self._logger.error(log_line, *log_args, is_success, response.status_code, response.reason)
         raise TPGalWSAppException(response)
 
-    def get(self, endpoint: str, ep_params: dict = None, **kwargs) -> dict:
+    def _cache_key(self, http_method: str, endpoint: str, ep_params: dict) -> str:
+        """
+        The disk cache key for a request, scoped to this adapter's base URL and credentials
+        """
+
+        scope = self.url if self.token is None else f"{self.url}\n{self.token_type} {self.token}"
+        return self.cache.key(http_method, endpoint, ep_params, scope=scope)
+
+    def _parse_cached(self, entry: CacheEntry, results_only: bool, http_method: str, endpoint: str):
+        if self.hooks is not None:
+            started = time.perf_counter()
+            data_out = json.loads(entry.body)
+            self.hooks.parsed(http_method, endpoint, time.perf_counter() - started)
+        else:
+            data_out = json.loads(entry.body)
+        return _unwrap_results(data_out) if results_only else data_out
+
+    def _iter_body(self, endpoint: str, ep_params: dict = None, chunk_size: int = 65536, revalidate: bool = False, _auth_recursion_level: int = 0) -> Iterator[bytes]:
+        """
+        The body of a GET in chunks, from the disk cache when possible (see `revalidate` in `_do`). It's never held whole in memory
+        """
+
+        headers = {"Authorization": f"{self.token_type} {self.token}"}
+        hooks = self.hooks
+        log_args = (self.url + endpoint, ep_params)
+
+        cache_key = cached_file = None
+        if self.cache is not None and self.cache.ttl(endpoint) is not None:
+            cache_key = self._cache_key('GET', endpoint, ep_params)
+            opened = self.cache.open(cache_key)
+            if opened is not None:
+                cached, cached_file = opened
+                if not revalidate and self.cache.is_fresh(endpoint, cached):
+                    self._logger.debug("method=GET, url=%s, params=%s, stream=True, cached=True", *log_args)
+                    if hooks is not None:
+                        hooks.cache_event('GET', endpoint, "hit")
+                    with cached_file:
+                        yield from iter(lambda: cached_file.read(chunk_size), b"")
+                    return
+                headers.update(cached.conditional_headers())
+
+        try:
+            self._logger.debug("method=GET, url=%s, params=%s, stream=True", *log_args)
+            with self._send('GET', endpoint, headers, ep_params, stream=True) as response:
+                if response.status_code == 401 and self._authentication_function and (_auth_recursion_level < self.max_auth_recursion_level):
+                    self.token = self._authentication_function()
+                    self._logger.debug("Retrying request after authentication")
+                    if hooks is not None:
+                        hooks.authenticated('GET', endpoint)
+                    yield from self._iter_body(endpoint, ep_params, chunk_size, revalidate, _auth_recursion_level+1)
+                    return
+                if response.status_code == 304 and cached_file is not None:
+                    self._logger.debug("method=GET, url=%s, params=%s, stream=True, revalidated=True", *log_args)
+                    if hooks is not None:
+                        hooks.cache_event('GET', endpoint, "revalidated")
+                    yield from self.cache.store_chunks(cache_key, iter(lambda: cached_file.read(chunk_size), b""),
+                                                       etag=response.headers.get("ETag", cached.etag),
+                                                       last_modified=response.headers.get("Last-Modified", cached.last_modified))
+                    return
+
+                if cache_key is not None and hooks is not None:
+                    hooks.cache_event('GET', endpoint, "miss")
+                is_success = 299 >= response.status_code >= 200  # 200 to 299 is OK
+                log_line = "method=GET, url=%s, params=%s, stream=True, success=%s, status_code=%s, message=%s"
+                if not is_success:
+                    self._logger.error(log_line, *log_args, is_success, response.status_code, response.reason)
+                    response.content  # Read the body so that the exception has it
+                    raise TPGalWSAppException(response)
+                self._logger.debug(log_line, *log_args, is_success, response.status_code, response.reason)
+
+                chunks = response.iter_content(chunk_size=chunk_size)
+                if cache_key is not None:
+                    chunks = self.cache.store_chunks(cache_key, chunks,
+                                                     etag=response.headers.get("ETag"),
+                                                     last_modified=response.headers.get("Last-Modified"))
+                yield from chunks
+        finally:
+            if cached_file is not None:
+                cached_file.close()
+
+    def stream(self, endpoint: str, path: tuple = (), ep_params: dict = None, root_array_ok: bool = True, results_only: bool = True, chunk_size: int = 65536, revalidate: bool = False) -> Iterator:
+        """
+        Make an HTTP GET request and yield, already parsed, the items of an array in the JSON response as the body
+        is downloaded, instead of parsing the whole response at once. Peak memory depends on the size of one item,
+        not on the size of the response. The disk cache is used if set, the memo and coalescing aren't
+
+        :param path: Keys leading to the array, e.g. `("paradas",)`, in the same (unwrapped) response `get` returns. Empty if that response is the array
+
+        :param root_array_ok: If the response itself is an array, yield its items even though `path` isn't empty
+
+        :param results_only: Like in `_do`, follow `path` from the results key when the response has one
+
+        :param chunk_size: Bytes read from the network (or the disk cache) at a time
+
+        :param revalidate: Ask the server even if the disk cache entry is fresh, like in `_do`
+        """
+
+        return iter_array_items(self._iter_body(endpoint, ep_params, chunk_size, revalidate), path, root_array_ok, "results" if results_only else None)
+
+    def _shared_get(self, endpoint: str, ep_params: dict = None, **kwargs):
+        """
+        A GET whose response is shared: from the memo if it's recent enough, or from an identical request already in
+        flight, which this thread waits for instead of making its own
+        """
+
+        key = self._memo_key(endpoint, ep_params, kwargs)
+
+        hooks = self.hooks
+        with self._shared_lock:
+            memoized = self._memo.get(key)
+            if memoized is not None and time.monotonic() < memoized[0]:
+                # Evicted last when `memo_size` is reached
+                self._memo.move_to_end(key)
+                call = None
+            else:
+                call = self._inflight.get(key) if self.coalesce else None
+                leader = call is None
+                if leader:
+                    call = _InFlight()
+                    if self.coalesce:
+                        self._inflight[key] = call
+
+        # Hooks are called without holding the lock, so a slow one doesn't hold up every other shared GET
+        if call is None:
+            if hooks is not None:
+                hooks.cache_event('GET', endpoint, "memo")
+            return memoized[1]
+
+        if not leader:
+            if hooks is not None:
+                hooks.cache_event('GET', endpoint, "coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        if hooks is not None:
+            hooks.cache_event('GET', endpoint, "fetched")
+        try:
+            call.result = self._do(http_method='GET', endpoint=endpoint, ep_params=ep_params, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._shared_lock:
+                if self.coalesce:
+                    self._inflight.pop(key, None)
+                if call.error is None and self.memo_ttl:
+                    self._remember(key, call.result, self.memo_ttl)
+            call.done.set()
+
+        return call.result
+
+    @staticmethod
+    def _memo_key(endpoint: str, ep_params: dict, kwargs: dict) -> tuple:
+        return (endpoint, tuple(sorted((ep_params or {}).items())), tuple(sorted(kwargs.items())))
+
+    def _remember(self, key: tuple, result, ttl: float):
+        """
+        Keeps a response in the memo for `ttl` seconds. Must be called holding `_shared_lock`
+        """
+
+        self._memo[key] = (time.monotonic() + ttl, result)
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    def prime(self, endpoint: str, result, ttl: float, ep_params: dict = None, **kwargs):
+        """
+        Stores an already parsed GET response in the memo for `ttl` seconds (instead of `memo_ttl`), so shared GETs of
+        the same endpoint, params and kwargs get it without a request. Used to warm and refresh hot endpoints in the
+        background (see `arriva_api.transport.refresher`)
+        """
+
+        with self._shared_lock:
+            self._remember(self._memo_key(endpoint, ep_params, kwargs), result, ttl)
+
+    def clear_memo(self):
+        """
+        Forget the responses kept for `memo_ttl` or stored with `prime`
+        """
+
+        with self._shared_lock:
+            self._memo.clear()
+
+    def get(self, endpoint: str, ep_params: dict = None, shared: bool = True, **kwargs) -> dict:
         """
         Make an HTTP GET request
+
+        :param shared: Whether the response may be shared with identical GETs (see `coalesce` and `memo_ttl`).
+            Use False when the caller needs a response fetched after the call started. Implied by `revalidate=True`
         """
 
+        if shared and kwargs.get("load_json", True) and not kwargs.get("revalidate") and (self.coalesce or self.memo_ttl):
+            return self._shared_get(endpoint, ep_params, **kwargs)
         return self._do(http_method='GET', endpoint=endpoint, ep_params=ep_params, **kwargs)
 
     def post(self, endpoint: str, ep_params: dict = None, data: dict = None, **kwargs) -> dict:
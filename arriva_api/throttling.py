@@ -0,0 +1,189 @@
+"""
+Client side throttling for the REST adapters: a token bucket rate limiter, jittered exponential backoff that honours
+`Retry-After`, and a circuit breaker. All of them are thread-safe and can be shared between a
+`arriva_api.rest_adapter.RestAdapter` and an `arriva_api.async_rest_adapter.AsyncRestAdapter`.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while the circuit breaker is open (the upstream is considered down)
+    """
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Circuit open, not calling the API for {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class TokenBucket():
+    """
+    Allows `rate` requests per second on average, with bursts of up to `capacity` requests
+
+    :param rate: Tokens added per second
+
+    :param capacity: Maximum tokens stored, i.e. the largest burst allowed
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float) -> float:
+        """
+        Takes the tokens if available and returns 0, otherwise returns how long to wait for them. Raises `ValueError`
+        if they can never be available, i.e. if there are more than `capacity`
+        """
+
+        if tokens > self.capacity:
+            raise ValueError(f"Can't take {tokens} tokens from a bucket with capacity {self.capacity}")
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Takes the tokens if available without waiting
+        """
+
+        return self._take(tokens) == 0
+
+    def acquire(self, tokens: float = 1):
+        """
+        Blocks the thread until the tokens are available and takes them
+        """
+
+        while (wait := self._take(tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        """
+        Waits without blocking the event loop until the tokens are available and takes them
+        """
+
+        while (wait := self._take(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+
+class Backoff():
+    """
+    Retry policy with exponential backoff and full jitter
+
+    :param max_retries: How many times a request is retried
+
+    :param base: Seconds of the first backoff, doubled on each retry
+
+    :param cap: Maximum seconds between retries, also applied to `Retry-After`
+
+    :param statuses: HTTP statuses that are retried
+
+    :param methods: HTTP methods that are retried. Only idempotent ones by default: a POST or PATCH that timed out may
+    have been applied by the server, and sending it again would apply it twice. Add them here to opt in
+    """
+
+    def __init__(self, max_retries: int = 3, base: float = 0.5, cap: float = 30, statuses: frozenset = frozenset({429, 500, 502, 503, 504}), methods: frozenset = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+        self.statuses = statuses
+        self.methods = methods
+
+    def retries(self, http_method: str) -> bool:
+        """
+        Whether requests with this method are retried at all
+        """
+
+        return http_method.upper() in self.methods
+
+    def delay(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Seconds to wait before retry number `attempt` (starting at 0). A `Retry-After` header takes precedence
+        """
+
+        if retry_after:
+            seconds = parse_retry_after(retry_after)
+            if seconds is not None:
+                return min(self.cap, seconds)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker():
+    """
+    Stops calling the API after `failure_threshold` consecutive failures. Requests fail fast with `CircuitOpenError`
+    for `reset_timeout` seconds, then a single trial request is let through: if it succeeds the circuit closes again.
+    The adapters record one outcome per request, after its retries, so a single request never counts more than once
+
+    :param failure_threshold: Consecutive failed requests (network errors or 429/5xx after retrying) that open the circuit
+
+    :param reset_timeout: Seconds the circuit stays open before trying again
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_request(self):
+        """
+        Raises `CircuitOpenError` if the request must not be made
+        """
+
+        with self._lock:
+            if self._opened_at is None:
+                return
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0 or self._trial_in_flight:
+                raise CircuitOpenError(max(retry_in, 0))
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def parse_retry_after(value: str) -> float:
+    """
+    Seconds from a `Retry-After` header, which is either a number of seconds or an HTTP date. None if it's invalid
+    """
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
@@ -14,16 +14,45 @@ Este es un simple ''cliente'' en línea de comandos que muestra en acción este
 Este también es el submódulo __main__.py, por lo tanto, puedes probarlo.python -m arriva_api.transport
 """
 
-from ..rest_adapter import RestAdapter as RestAdapter
-from ..known_servers import ARRIVA as BASE_URL
+import importlib
+import threading
 
-_rest_adapter = RestAdapter(BASE_URL)
+__all__ = ["lines", "stops", "expeditions", "warning_alerts", "rates", "distance", "fleet", "snapshot", "journeys", "eta", "gtfs", "refresher"]
 
+_rest_adapter_lock = threading.Lock()
 
-from . import lines
-from . import stops
-from . import expeditions
-from . import warning_alerts
-from . import rates
 
-__all__ = ["lines", "stops", "expeditions", "warning_alerts", "rates"]
+def _build_rest_adapter():
+    """
+    The adapter shared by every submodule (`from . import _rest_adapter`), built on first access so that importing
+    the package doesn't import requests
+    """
+
+    from ..rest_adapter import RestAdapter
+    from ..known_servers import ARRIVA as BASE_URL
+    from ..throttling import Backoff, CircuitBreaker, TokenBucket
+
+    # A short memo so that back to back calls for the same document (e.g. `stops.get_stop_name` and
+    # `stops.get_stop_location`) share one request. The limiter, retries and breaker are shared by every submodule
+    return RestAdapter(BASE_URL, memo_ttl=2,
+                       rate_limiter=TokenBucket(rate=20, capacity=40),
+                       retry=Backoff(),
+                       circuit_breaker=CircuitBreaker())
+
+
+def __getattr__(name: str):
+    if name == "_rest_adapter":
+        with _rest_adapter_lock:
+            if "_rest_adapter" not in globals():
+                globals()["_rest_adapter"] = _build_rest_adapter()
+        return globals()["_rest_adapter"]
+    if name == "RestAdapter":
+        from ..rest_adapter import RestAdapter
+        return RestAdapter
+    if name in __all__ or name == "aio":
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,25 @@
+"""
+Utilidades para los ficheros que se escriben en un temporal y sustituyen al anterior de forma atómica
+"""
+
+import os
+import threading
+
+_umask_lock = threading.Lock()
+
+
+def _umask() -> int:
+    # Solo se puede leer cambiándola: se cambia por una restrictiva y se restaura enseguida
+    with _umask_lock:
+        mask = os.umask(0o077)
+        os.umask(mask)
+    return mask
+
+
+def make_shareable(path: str):
+    """
+    Da a un fichero creado con `tempfile.mkstemp`, que solo puede leer su dueño (0600), los permisos que tendría
+    creado con `open` (0666 menos la umask), para que lo puedan abrir procesos de otros usuarios
+    """
+
+    os.chmod(path, 0o666 & ~_umask())
@@ -0,0 +1,15 @@
+"""
+Utilidades para leer los registros de la API, cuyas claves no siempre están documentadas
+"""
+
+
+def first(data: dict, *keys):
+    """
+    El valor de la primera de `keys` que está en `data` y no es None, o None
+    """
+
+    for key in keys:
+        value = data.get(key)
+        if value is not None:
+            return value
+    return None
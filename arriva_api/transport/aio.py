@@ -0,0 +1,255 @@
+"""
+Versiones asíncronas (asyncio) de las funciones públicas del submódulo. Requiere `aiohttp`.
+
+Todas comparten `_rest_adapter`, que limita cuántas peticiones hay en vuelo a la vez (`max_concurrency`), así que
+se pueden lanzar cientos de consultas con `asyncio.gather` sin saturar la API:
+
+``` python
+from arriva_api.transport import aio
+
+rates, errors = await aio.get_rates([(1, 2), (1, 3), (2, 3)])
+```
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Iterable
+import weakref
+
+from ..async_rest_adapter import REQUEST_ERRORS, AsyncRestAdapter
+from ..known_servers import ARRIVA as BASE_URL
+from . import _rest_adapter as _sync_rest_adapter
+from . import stops as _stops
+from . import rates as _rates
+from . import lines as _lines
+from .stops import Stop, Location
+from .rates import Rate
+from .lines import Line
+
+# Shares the rate limit and circuit breaker with the blocking functions
+_rest_adapter = AsyncRestAdapter(BASE_URL,
+                                 rate_limiter=_sync_rest_adapter.rate_limiter,
+                                 retry=_sync_rest_adapter.retry,
+                                 circuit_breaker=_sync_rest_adapter.circuit_breaker)
+
+# Un lock por bucle de eventos: un `asyncio.Lock` queda ligado al primer bucle que espera en él
+_catalog_locks = weakref.WeakKeyDictionary()
+
+_logger = logging.getLogger(__name__)
+
+
+## vvv Methods vvv ##
+
+async def gather(aws: Iterable[Awaitable], limit: int = None, return_exceptions: bool = False) -> list:
+    """
+    Como `asyncio.gather`, pero con como mucho `limit` corrutinas ejecutándose a la vez
+
+    :param aws: Las corrutinas a ejecutar
+    :param limit: Máximo de corrutinas simultáneas. Por defecto, el `max_concurrency` del adaptador
+    :param return_exceptions: Devolver las excepciones como resultados en lugar de propagarlas
+    """
+
+    semaphore = asyncio.Semaphore(limit or _rest_adapter.max_concurrency)
+
+    async def _bounded(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(_bounded(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+async def _get_catalog() -> _stops.StopTable:
+    """
+    Como `arriva_api.transport.stops.catalog.get()`, pero descargando el catálogo sin bloquear el bucle de eventos
+    """
+
+    stops = _stops.catalog.peek()
+    if stops is None:
+        async with _catalog_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock()):
+            stops = _stops.catalog.peek()
+            if stops is None:
+                data = await _rest_adapter.get(endpoint="/superparadas/index/buscador.json")
+                # `put` espera al lock del catálogo (una descarga síncrona en curso) sin bloquear el bucle de eventos
+                stops = await asyncio.get_running_loop().run_in_executor(None, _stops.catalog.put, data)
+    return stops
+
+
+async def search_stops(query: str, num_results: int = 2147483647, fuzzy: bool = True) -> list[Stop]:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.search_stops`
+    """
+
+    await _get_catalog()
+
+    return _stops.search_stops(query, num_results, fuzzy)
+
+
+async def get_all_stops() -> list[Stop]:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.get_all_stops`
+    """
+
+    return list(await _get_catalog())
+
+
+async def location_search_stops(location: Location = None, lat: float = None, long: float = None, radius=5) -> list[Stop]:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.location_search_stops`
+    """
+
+    await _get_catalog()
+
+    return _stops.location_search_stops(location, lat, long, radius)
+
+
+async def nearest_stops(location: Location = None, k: int = 5, lat: float = None, long: float = None) -> list[Stop]:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.nearest_stops`
+    """
+
+    await _get_catalog()
+
+    return _stops.nearest_stops(location, k, lat, long)
+
+
+async def get_stop_name(stop_id: int) -> str:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.get_stop_name`
+    """
+
+    return _stops._parse_stop_name(await _rest_adapter.get(endpoint=f"/superparadas/expediciones-fecha/{stop_id}.json"))
+
+
+async def get_stop_location(stop_id: int) -> Location:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.get_stop_location`
+    """
+
+    return _stops._parse_stop_location(await _rest_adapter.get(endpoint=f"/superparadas/expediciones-fecha/{stop_id}.json"))
+
+
+async def hydrate_stops(stops: list[Stop], limit: int = None) -> list[Stop]:
+    """
+    Versión asíncrona de `arriva_api.transport.stops.hydrate_stops`
+
+    :param limit: Máximo de consultas simultáneas a la API para las paradas que no están en el catálogo
+    """
+
+    stops = list(stops)
+    missing = {}
+    for stop in _stops._hydrate_from_table(stops, await _get_catalog()):
+        missing.setdefault(_stops._parse_id(stop.id), []).append(stop)
+
+    responses = await gather((_rest_adapter.get(endpoint=f"/superparadas/expediciones-fecha/{stop_id}.json") for stop_id in missing),
+                             limit, return_exceptions=True)
+    failed = []
+    for stop_id, data in zip(missing, responses):
+        if isinstance(data, BaseException):
+            if not isinstance(data, REQUEST_ERRORS):
+                raise data
+            failed.append(stop_id)
+            continue
+        try:
+            _stops._hydrate_from_response(missing[stop_id], data)
+        except (LookupError, TypeError):
+            failed.append(stop_id)
+    if failed:
+        _logger.warning("Couldn't hydrate stops %s", failed)
+    return stops
+
+
+async def get_rate(origin_id: int, destination_id: int, use_cache: bool = True) -> Rate:
+    """
+    Versión asíncrona de `arriva_api.transport.rates.get_rate`. Comparte con ella los precios recordados
+    """
+
+    pair = (origin_id, destination_id)
+    if use_cache:
+        rate = _rates._cached_rate(pair)
+        if rate is not None:
+            return rate
+
+    rate = _rates._parse_rate(await _rest_adapter.get(f"/buscador/precio/{origin_id}/{destination_id}.json"))
+    _rates._remember_rate(pair, rate)
+    return rate
+
+
+async def get_rates(pairs: Iterable[tuple[int, int]], limit: int = None) -> tuple[dict[tuple[int, int], Rate], dict[tuple[int, int], Exception]]:
+    """
+    Versión asíncrona de `arriva_api.transport.rates.get_rates`: los pares repetidos se consultan una sola vez, los
+    ya recordados no se consultan y el resto se consultan de forma concurrente
+
+    :param limit: Máximo de peticiones simultáneas
+    :return: Las tarifas por par y, aparte, la excepción de cada par que falló
+    """
+
+    rates = {}
+    errors = {}
+    missing = []
+    for pair in dict.fromkeys(pairs):
+        rate = _rates._cached_rate(pair)
+        if rate is not None:
+            rates[pair] = rate
+        else:
+            missing.append(pair)
+
+    results = await gather((get_rate(*pair, use_cache=False) for pair in missing), limit=limit, return_exceptions=True)
+    for pair, result in zip(missing, results):
+        if isinstance(result, Exception):
+            errors[pair] = result
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            rates[pair] = result
+
+    return rates, errors
+
+
+async def get_line(line_id: int) -> Line:
+    """
+    Versión asíncrona de `arriva_api.transport.lines.get_line`
+    """
+
+    return _lines._parse_line(await _rest_adapter.get(f"/lineas/view/{line_id}"))
+
+
+async def get_all_lines() -> list[Line]:
+    """
+    Versión asíncrona de `arriva_api.transport.lines.get_all_lines`
+    """
+
+    return [_lines._parse_line(el) for el in await _rest_adapter.get("/lineas/index.json")]
+
+
+async def get_bus_last_area(bus: str) -> dict:
+    """
+    Obtiene el último área por el que ha pasado un bus
+    """
+
+    return await _rest_adapter.get(f"/buses/getLastArea/{bus}.json")
+
+
+async def get_bus_last_stop(bus: str) -> dict:
+    """
+    Obtiene la última parada por la que ha pasado un bus
+    """
+
+    return await _rest_adapter.get(f"/buses/getLastStop/{bus}.json")
+
+
+async def get_bus_geoloc(bus: str) -> dict:
+    """
+    Obtiene la posición geográfica y detalles de un bus
+    """
+
+    return await _rest_adapter.get(f"/buses/getGeoloc/{bus}.json")
+
+
+async def get_buses() -> dict:
+    """
+    Obtiene todos los buses con sus posiciones geográficas y detalles
+    """
+
+    return await _rest_adapter.get("/buses/getGeolocs.json")
+
+## ^^^ Methods ^^^ ##
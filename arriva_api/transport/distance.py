@@ -0,0 +1,128 @@
+"""
+Cálculo de distancias (fórmula del haversine) entre muchos puntos a la vez.
+
+Si NumPy está instalado los cálculos se vectorizan; si no, se usa una implementación en Python puro con el mismo
+resultado. Las funciones devuelven arrays de NumPy o listas de Python según el caso (ver `use_numpy`).
+"""
+
+import math
+from typing import Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+HAS_NUMPY = np is not None
+"""
+Indica si NumPy está disponible
+"""
+
+EARTH_RADIUS = 6371
+"""
+Radio de la Tierra en kilómetros
+"""
+
+
+## vvv Methods vvv ##
+
+def _want_numpy(use_numpy: bool) -> bool:
+    if use_numpy is None:
+        return HAS_NUMPY
+    if use_numpy and not HAS_NUMPY:
+        raise ImportError("NumPy is not installed")
+    return use_numpy
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calcula la distancia del círculo máximo en kilómetros entre dos puntos 
+    en la Tierra (especificado en grados decimales).
+    """
+    # Convertir decimal degrees a radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    # Diferencia entre las coordenadas
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    # Fórmula Haversine
+    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return c * EARTH_RADIUS
+
+
+def haversine_many(lat: float, long: float, lats: Sequence[float], longs: Sequence[float], use_numpy: bool = None):
+    """
+    Distancias en kilómetros desde un punto a muchos otros.
+
+    :param lat: Latitud del punto de origen
+    :param long: Longitud del punto de origen
+    :param lats: Latitudes de los destinos
+    :param longs: Longitudes de los destinos (misma longitud que `lats`)
+    :param use_numpy: Forzar (True) o evitar (False) NumPy. Por defecto se usa si está instalado
+    :return: Un array de NumPy o una lista, con una distancia por destino
+    """
+
+    if _want_numpy(use_numpy):
+        lat1, lon1 = math.radians(lat), math.radians(long)
+        lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+        lon2 = np.radians(np.asarray(longs, dtype=np.float64))
+        a = np.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+    # Lo que depende solo del origen se calcula una vez
+    lat1, lon1 = math.radians(lat), math.radians(long)
+    cos_lat1 = math.cos(lat1)
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    distances = []
+    for lat2, lon2 in zip(lats, longs):
+        lat2 = radians(lat2)
+        a = sin((lat2 - lat1) / 2)**2 + cos_lat1 * cos(lat2) * sin((radians(lon2) - lon1) / 2)**2
+        distances.append(2 * EARTH_RADIUS * asin(sqrt(a)))
+    return distances
+
+
+def haversine_pairwise(lats1: Sequence[float], longs1: Sequence[float], lats2: Sequence[float], longs2: Sequence[float], use_numpy: bool = None):
+    """
+    Distancias en kilómetros entre parejas de puntos (el i-ésimo del primer grupo con el i-ésimo del segundo),
+    por ejemplo la posición de cada bus con su próxima parada.
+
+    :return: Un array de NumPy o una lista, con una distancia por pareja
+    """
+
+    if _want_numpy(use_numpy):
+        lat1 = np.radians(np.asarray(lats1, dtype=np.float64))
+        lon1 = np.radians(np.asarray(longs1, dtype=np.float64))
+        lat2 = np.radians(np.asarray(lats2, dtype=np.float64))
+        lon2 = np.radians(np.asarray(longs2, dtype=np.float64))
+        a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+    return [haversine(*coords) for coords in zip(lats1, longs1, lats2, longs2)]
+
+
+def distance_matrix(origins: Sequence[tuple[float, float]], destinations: Sequence[tuple[float, float]], use_numpy: bool = None):
+    """
+    Matriz de distancias en kilómetros entre varios orígenes y varios destinos, por ejemplo las posiciones de los
+    usuarios y las paradas.
+
+    :param origins: Pares (latitud, longitud) de los orígenes
+    :param destinations: Pares (latitud, longitud) de los destinos
+    :param use_numpy: Forzar (True) o evitar (False) NumPy. Por defecto se usa si está instalado
+    :return: Un array de NumPy de forma (orígenes, destinos), o una lista de listas
+    """
+
+    if _want_numpy(use_numpy):
+        origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+        destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+        lat1, lon1 = origins[:, 0, None], origins[:, 1, None]
+        lat2, lon2 = destinations[None, :, 0], destinations[None, :, 1]
+        a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+    lats = [lat for lat, _ in destinations]
+    longs = [long for _, long in destinations]
+    return [haversine_many(lat, long, lats, longs, use_numpy=False) for lat, long in origins]
+
+## ^^^ Methods ^^^ ##
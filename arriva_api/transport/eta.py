@@ -0,0 +1,343 @@
+"""
+Predicción de llegadas en tiempo real. Combina los pasos por parada que informan los buses (`/buses/getLastStop`)
+con las horas programadas de cada expedición: de cada observación sale el retraso de la expedición, que se aplica a
+todas sus paradas siguientes. Las predicciones se guardan por parada, así que "llegadas a la parada X" se responde
+desde memoria, sin llamar a la API.
+
+``` python
+from arriva_api.transport.eta import EtaService
+from arriva_api.transport.fleet import FleetTracker
+
+service = EtaService()
+tracker = FleetTracker()
+for delta in tracker.watch():
+    service.update_from_fleet(delta)
+    print(service.arrivals(15004))
+```
+"""
+
+from . import fleet as _fleet
+from .expeditions import Expedition, Timetable, get_timetable
+from ._records import first as _first
+from .fleet import FleetDelta
+from .stops import Stop
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+from typing import Iterable
+
+
+## vvv Classes vvv ##
+
+class Arrival():
+    """
+    La llegada (programada o prevista) de una expedición a una parada
+    """
+
+    __slots__ = ("expedition_id", "line_id", "stop_id", "ordinal", "scheduled", "predicted", "bus")
+
+    def __init__(self, expedition_id: int, line_id: int, stop_id: int, ordinal: int, scheduled: datetime, predicted: datetime, bus: str = None):
+        self.expedition_id = expedition_id
+        """
+        Id de la expedición
+        """
+
+        self.line_id = line_id
+        """
+        Id de la línea
+        """
+
+        self.stop_id = stop_id
+        """
+        Id de la parada
+        """
+
+        self.ordinal = ordinal
+        """
+        Posición de la parada en la expedición
+        """
+
+        self.scheduled = scheduled
+        """
+        Hora programada
+        """
+
+        self.predicted = predicted
+        """
+        Hora prevista. Igual a la programada si no hay datos en tiempo real de la expedición
+        """
+
+        self.bus = bus
+        """
+        El bus que hace la expedición, None si no hay datos en tiempo real
+        """
+
+    @property
+    def realtime(self) -> bool:
+        return self.bus is not None
+
+    @property
+    def delay(self) -> timedelta:
+        return self.predicted - self.scheduled
+
+    def __repr__(self):
+        return f"{self.predicted:%H:%M} línea {self.line_id}" + (f" (bus {self.bus}, {self.delay.total_seconds() / 60:+.0f} min)" if self.realtime else "")
+
+
+class _Progress():
+    """
+    Por dónde va una expedición: la última parada por la que pasó, cuándo y con qué retraso
+    """
+
+    __slots__ = ("expedition", "midnight", "index", "delay", "observed_at", "bus")
+
+    def __init__(self, expedition: Expedition, midnight: datetime, index: int, delay: timedelta, observed_at: datetime, bus: str):
+        self.expedition = expedition
+        self.midnight = midnight
+        self.index = index
+        self.delay = delay
+        self.observed_at = observed_at
+        self.bus = bus
+
+
+class EtaService():
+    """
+    Estado en memoria del avance de cada expedición en curso y de las llegadas previstas a cada parada (ver el módulo).
+    Cada observación solo recalcula las paradas siguientes de su expedición. Thread-safe
+
+    :param timetable: Las horas programadas. Por defecto, el horario compartido de `expeditions.get_timetable`
+    :param max_age: Tiempo sin observaciones tras el que una expedición deja de considerarse en curso (ver `expire`)
+    """
+
+    def __init__(self, timetable: Timetable = None, max_age: timedelta = timedelta(minutes=30)):
+        self._timetable = timetable
+        self.max_age = max_age
+        self._schedules = {}
+        self._progress = {}
+        self._by_stop = {}
+        self._lock = threading.RLock()
+
+    @property
+    def timetable(self) -> Timetable:
+        if self._timetable is None:
+            self._timetable = get_timetable()
+        return self._timetable
+
+    def _expedition(self, expedition_id: int) -> Expedition:
+        expedition = self._schedules.get(expedition_id)
+        return expedition if expedition is not None else self.timetable.expeditions.get(expedition_id)
+
+    def set_schedule(self, expedition_id: int, line_id: int, stops: list[Stop]):
+        """
+        Usa como horas programadas de una expedición las de unas paradas (`Stop.ordinal` y `Stop.time`), por ejemplo
+        las de `/superparadas/expediciones-fecha`, en lugar de las del horario
+        """
+
+        stop_times = [(stop.id, stop.time.hour * 60 + stop.time.minute if stop.time is not None else -1)
+                      for stop in sorted(stops, key=lambda stop: stop.ordinal or 0)]
+        with self._lock:
+            self._schedules[expedition_id] = Expedition(expedition_id, line_id, stop_times)
+
+    def observe(self, expedition_id: int, stop_id: int, when: datetime = None, bus: str = None) -> list[Arrival]:
+        """
+        Registra que una expedición pasó por una parada y recalcula sus llegadas previstas a las paradas siguientes.
+        Se ignoran las observaciones de paradas anteriores a la última conocida
+
+        :param when: Cuándo pasó. Por defecto, ahora
+        :return: Las nuevas llegadas previstas de la expedición
+        """
+
+        expedition = self._expedition(expedition_id)
+        if expedition is None:
+            return []
+        when = when or datetime.now()
+
+        with self._lock:
+            progress = self._progress.get(expedition_id)
+            start = progress.index + 1 if progress is not None else 0
+            positions = [i for i, (other_id, minutes) in enumerate(expedition.stop_times) if other_id == stop_id and minutes >= 0]
+            if not positions:
+                return []
+            # En las líneas circulares una parada aparece varias veces: la siguiente a la última conocida
+            index = next((i for i in positions if i >= start), None)
+            if index is None:
+                if progress is not None and progress.index in positions:
+                    return []  # La misma parada otra vez
+                index = positions[0]
+
+            midnight = datetime.combine(when.date(), datetime.min.time())
+            scheduled = midnight + timedelta(minutes=expedition.stop_times[index][1])
+            if scheduled - when > timedelta(hours=12):
+                midnight -= timedelta(days=1)
+            elif when - scheduled > timedelta(hours=12):
+                midnight += timedelta(days=1)
+            scheduled = midnight + timedelta(minutes=expedition.stop_times[index][1])
+
+            if progress is not None and progress.midnight == midnight and index < progress.index:
+                return []
+
+            progress = _Progress(expedition, midnight, index, when - scheduled, when, bus)
+            self._progress[expedition_id] = progress
+            return self._predict(progress)
+
+    def _predict(self, progress: _Progress) -> list[Arrival]:
+        """
+        Actualiza las llegadas previstas de una expedición a partir de su avance. Se llama con el lock cogido
+        """
+
+        expedition = progress.expedition
+        arrivals = []
+        upcoming = set()
+        for position, (stop_id, minutes) in enumerate(expedition.stop_times):
+            entries = self._by_stop.get(stop_id)
+            if position <= progress.index or minutes < 0:
+                if entries is not None and stop_id not in upcoming:
+                    entries.pop(expedition.id, None)
+                continue
+            if stop_id in upcoming:
+                continue
+            upcoming.add(stop_id)
+            scheduled = progress.midnight + timedelta(minutes=minutes)
+            arrival = Arrival(expedition.id, expedition.line_id, stop_id, position, scheduled,
+                              max(scheduled + progress.delay, progress.observed_at), progress.bus)
+            if entries is None:
+                entries = self._by_stop[stop_id] = {}
+            entries[expedition.id] = arrival
+            arrivals.append(arrival)
+
+        if progress.index == len(expedition.stop_times) - 1:
+            del self._progress[expedition.id]  # Ha terminado
+        return arrivals
+
+    def _forget(self, expedition_id: int):
+        progress = self._progress.pop(expedition_id, None)
+        if progress is not None:
+            for stop_id, _ in progress.expedition.stop_times:
+                entries = self._by_stop.get(stop_id)
+                if entries is not None:
+                    entries.pop(expedition_id, None)
+
+    def observe_last_stop(self, bus: str, data: dict) -> list[Arrival]:
+        """
+        Registra una respuesta de `/buses/getLastStop/{bus}.json` (ver `observe`). Se ignora si no tiene la
+        expedición, la parada o una hora de paso que se entienda
+        """
+
+        expedition_id = _id(_first(data, "expedicion_id", "expedicion", "expedition_id"))
+        stop_id = _id(_first(data, "parada_id", "parada", "id_parada", "stop_id"))
+        when = _parse_time(_first(data, "fecha", "hora", "timestamp", "date"))
+        # Sin la hora de paso no se puede saber el retraso: tomar la actual lo inventaría
+        if expedition_id is None or stop_id is None or when is None:
+            return []
+        return self.observe(expedition_id, stop_id, when, bus)
+
+    def refresh(self, buses: Iterable[str], max_workers: int = 8) -> dict[str, Exception]:
+        """
+        Consulta en paralelo la última parada de cada bus y la registra
+
+        :return: La excepción de cada bus cuya consulta falló
+        """
+
+        buses = list(dict.fromkeys(buses))
+        errors = {}
+        if not buses:
+            return errors
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(buses))) as executor:
+            futures = {bus: executor.submit(_fleet.get_bus_last_stop, bus) for bus in buses}
+            for bus, future in futures.items():
+                try:
+                    data = future.result()
+                except Exception as e:
+                    errors[bus] = e
+                    continue
+                if isinstance(data, dict):
+                    self.observe_last_stop(bus, data)
+        return errors
+
+    def update_from_fleet(self, delta: FleetDelta, max_workers: int = 8) -> dict[str, Exception]:
+        """
+        Actualiza con los cambios de un `fleet.FleetTracker`: consulta la última parada solo de los buses que han
+        aparecido o se han movido, y olvida las expediciones de los que han desaparecido
+
+        :return: La excepción de cada bus cuya consulta falló
+        """
+
+        gone = {position.bus for position in delta.disappeared}
+        with self._lock:
+            for expedition_id in [expedition_id for expedition_id, progress in self._progress.items() if progress.bus in gone]:
+                self._forget(expedition_id)
+        return self.refresh([position.bus for position in delta.appeared + delta.changed], max_workers)
+
+    def expire(self, now: datetime = None):
+        """
+        Olvida las expediciones sin observaciones desde hace más de `max_age`
+        """
+
+        limit = (now or datetime.now()) - self.max_age
+        with self._lock:
+            for expedition_id in [expedition_id for expedition_id, progress in self._progress.items() if progress.observed_at < limit]:
+                self._forget(expedition_id)
+
+    def arrivals(self, stop_id: int, after: datetime = None, limit: int = 10, include_scheduled: bool = True) -> list[Arrival]:
+        """
+        Las próximas llegadas a una parada, ordenadas por hora prevista, sin llamar a la API
+
+        :param after: Desde cuándo. Por defecto, ahora
+        :param include_scheduled: Completar con las horas programadas del horario las expediciones sin datos en tiempo real
+        """
+
+        after = after or datetime.now()
+        with self._lock:
+            tracked = set(self._progress)
+            arrivals = [arrival for arrival in self._by_stop.get(stop_id, {}).values()
+                        if arrival.predicted >= after and arrival.expedition_id in tracked]
+
+        if include_scheduled:
+            for departure in self.timetable.next_departures(stop_id, after, limit + len(arrivals)):
+                if departure.expedition_id not in tracked:
+                    arrivals.append(Arrival(departure.expedition_id, departure.line_id, stop_id, None, departure.time, departure.time))
+
+        arrivals.sort(key=lambda arrival: arrival.predicted)
+        return arrivals[:limit]
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+def _id(value) -> int:
+    if isinstance(value, dict):
+        value = value.get("id")
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_time(value) -> datetime:
+    """
+    Una hora de la API: segundos (o milisegundos) desde epoch, fecha ISO o `HH:MM[:SS]` de hoy. None si no se entiende
+    """
+
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+            return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo is not None else parsed
+        except ValueError:
+            pass
+        try:
+            parts = [int(part) for part in value.split(":")]
+            return datetime.now().replace(hour=parts[0], minute=parts[1], second=parts[2] if len(parts) > 2 else 0, microsecond=0)
+        except (ValueError, IndexError):
+            pass
+    return None
+
+## ^^^ Methods ^^^ ##
@@ -0,0 +1,412 @@
+"""
+Expediciones (cada viaje de un bus por una línea) y un horario local para responder "próximas salidas desde la parada X"
+sin llamar a la API.
+
+El horario se construye una vez con la red completa (`lines.get_network`) o con una instantánea
+(`snapshot.Snapshot`) y, para cada día, se indexan las horas de paso por parada en listas ordenadas que se consultan
+por bisección.
+"""
+
+from . import lines as _lines
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import logging
+import threading
+from typing import Iterable
+
+_logger = logging.getLogger(__name__)
+
+ALL_DAYS = 0b1111111
+"""
+Máscara de días de la semana con todos los días (bit 0 lunes ... bit 6 domingo)
+"""
+
+_DAY_KEYS = (("lunes",), ("martes",), ("miercoles", "miércoles"), ("jueves",), ("viernes",), ("sabado", "sábado"), ("domingo",))
+
+
+## vvv Classes vvv ##
+
+class Expedition():
+    """
+    Una expedición: un viaje de un bus por una línea, con sus horas de paso por cada parada
+    """
+
+    __slots__ = ("id", "line_id", "stop_times", "weekdays", "seasons")
+
+    def __init__(self, id: int, line_id: int, stop_times: list[tuple[int, int]], weekdays: int = ALL_DAYS, seasons: list[tuple[int, int]] = None):
+        self.id = id
+        """
+        Id de la expedición en el sistema de Arriva
+        """
+
+        self.line_id = line_id
+        """
+        Id de la línea
+        """
+
+        self.stop_times = stop_times
+        """
+        Las paradas en orden como pares (id de parada, minutos desde la medianoche). Los minutos pueden pasar de
+        1440 si la expedición acaba después de la medianoche, y son -1 si no se conocen
+        """
+
+        self.weekdays = weekdays
+        """
+        Días de la semana en los que circula, como máscara de bits (bit 0 lunes ... bit 6 domingo)
+        """
+
+        self.seasons = seasons or []
+        """
+        Temporadas del año en las que circula, como pares (inicio, fin) en formato MMDD (ambos incluidos, pueden
+        cruzar el fin de año). Vacío si circula todo el año
+        """
+
+    def runs_on(self, day: date) -> bool:
+        """
+        Indica si la expedición circula ese día
+        """
+
+        if not self.weekdays >> day.weekday() & 1:
+            return False
+        if not self.seasons:
+            return True
+        month_day = day.month * 100 + day.day
+        return any(start <= month_day <= end if start <= end else (month_day >= start or month_day <= end)
+                   for start, end in self.seasons)
+
+    def __repr__(self):
+        return f"Expedición {self.id} (línea {self.line_id})"
+
+
+class Departure():
+    """
+    El paso de una expedición por una parada
+    """
+
+    __slots__ = ("expedition_id", "line_id", "stop_id", "time")
+
+    def __init__(self, expedition_id: int, line_id: int, stop_id: int, time: datetime):
+        self.expedition_id = expedition_id
+        """
+        Id de la expedición
+        """
+
+        self.line_id = line_id
+        """
+        Id de la línea
+        """
+
+        self.stop_id = stop_id
+        """
+        Id de la parada
+        """
+
+        self.time = time
+        """
+        Hora de paso
+        """
+
+    def __repr__(self):
+        return f"{self.time:%H:%M} línea {self.line_id} (expedición {self.expedition_id})"
+
+
+class Timetable():
+    """
+    Horario local de un conjunto de expediciones. Para cada día consultado se construye (y se guardan los
+    `cached_days` más recientes) un índice por parada con las horas de paso ordenadas
+
+    :param expeditions: Las expediciones
+    :param cached_days: Cuántos índices diarios se guardan
+    """
+
+    def __init__(self, expeditions: Iterable[Expedition], cached_days: int = 3):
+        self.expeditions = {expedition.id: expedition for expedition in expeditions}
+        """
+        Las expediciones por id
+        """
+
+        self.cached_days = cached_days
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _day_index(self, day: date) -> dict[int, tuple[array, list[Expedition]]]:
+        """
+        Por parada, las horas de paso (minutos, ordenadas) de las expediciones que circulan ese día y sus expediciones
+        """
+
+        with self._lock:
+            index = self._days.get(day)
+            if index is not None:
+                self._days.move_to_end(day)
+                return index
+
+        passes = {}
+        for expedition in self.expeditions.values():
+            if expedition.runs_on(day):
+                for stop_id, minutes in expedition.stop_times:
+                    if minutes >= 0:
+                        passes.setdefault(stop_id, []).append((minutes, expedition.id))
+
+        index = {}
+        for stop_id, stop_passes in passes.items():
+            stop_passes.sort()
+            index[stop_id] = (array("i", [minutes for minutes, _ in stop_passes]),
+                              [self.expeditions[expedition_id] for _, expedition_id in stop_passes])
+
+        with self._lock:
+            self._days[day] = index
+            while len(self._days) > self.cached_days:
+                self._days.popitem(last=False)
+        return index
+
+    def _departures(self, stop_id: int, day: date, start: int, end: int) -> list[Departure]:
+        """
+        Pasos por la parada de las expediciones del día `day` entre los minutos `start` (incluido) y `end` (excluido)
+        """
+
+        times, expeditions = self._day_index(day).get(stop_id, ((), ()))
+        midnight = datetime.combine(day, datetime.min.time())
+        return [Departure(expeditions[i].id, expeditions[i].line_id, stop_id, midnight + timedelta(minutes=times[i]))
+                for i in range(bisect_left(times, start), bisect_left(times, end))]
+
+    def departures_between(self, stop_id: int, start: datetime, end: datetime) -> list[Departure]:
+        """
+        Los pasos por una parada entre dos momentos, ordenados. Incluye las expediciones del día anterior que pasan
+        después de la medianoche
+        """
+
+        departures = []
+        day = start.date() - timedelta(days=1)
+        while day <= end.date():
+            midnight = datetime.combine(day, datetime.min.time())
+            start_minutes = max(0, int((start - midnight).total_seconds() // 60))
+            end_minutes = int((end - midnight).total_seconds() // 60) + 1
+            departures.extend(departure for departure in self._departures(stop_id, day, start_minutes, end_minutes)
+                              if start <= departure.time <= end)
+            day += timedelta(days=1)
+
+        departures.sort(key=lambda departure: departure.time)
+        return departures
+
+    def next_departures(self, stop_id: int, when: datetime = None, n: int = 5, days_ahead: int = 1) -> list[Departure]:
+        """
+        Los próximos `n` pasos por una parada a partir de un momento, ordenados
+
+        :param when: Desde cuándo. Por defecto, ahora
+        :param n: Cuántos pasos devolver como mucho
+        :param days_ahead: Cuántos días siguientes se miran si en el día de hoy no hay suficientes
+        """
+
+        when = when or datetime.now()
+        departures = []
+        day = when.date() - timedelta(days=1)
+        while day <= when.date() + timedelta(days=days_ahead):
+            midnight = datetime.combine(day, datetime.min.time())
+            start = max(0, -(-int((when - midnight).total_seconds()) // 60))
+            times, expeditions = self._day_index(day).get(stop_id, ((), ()))
+            first = bisect_left(times, start)
+            for i in range(first, min(first + n, len(times))):
+                departures.append(Departure(expeditions[i].id, expeditions[i].line_id, stop_id, midnight + timedelta(minutes=times[i])))
+            day += timedelta(days=1)
+            # Los días siguientes solo pueden aportar pasos posteriores a los ya encontrados
+            if len(departures) >= n and day > when.date():
+                break
+
+        departures.sort(key=lambda departure: departure.time)
+        return departures[:n]
+
+    def stop_expeditions(self, stop_id: int, day: date = None) -> list[Expedition]:
+        """
+        Las expediciones que pasan por una parada un día (por defecto hoy), por hora de paso
+        """
+
+        return list(self._day_index(day or date.today()).get(stop_id, ((), ()))[1])
+
+    @classmethod
+    def from_snapshot(cls, network) -> "Timetable":
+        """
+        Construye el horario con las expediciones de una `arriva_api.transport.snapshot.Snapshot`
+        """
+
+        return cls(network.parsed_expeditions())
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+def parse_minutes(value: str) -> int:
+    """
+    Minutos desde la medianoche de una hora `HH:MM[:SS]` (pueden pasar de 24 h), o -1 si no es válida
+    """
+
+    try:
+        hours, minutes = str(value).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _as_list(data) -> list[dict]:
+    if not data:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+def _parse_weekdays(data, expedition_id: int = None) -> int:
+    """
+    Máscara de días a partir de las `frecuencias_semanales` de una expedición (uno o varios registros con un booleano
+    por día). Si hay registros pero ninguno tiene los días que se conocen, se avisa y se supone que circula todos los
+    días: una máscara vacía haría que la expedición desapareciese del horario sin más
+    """
+
+    records = _as_list(data)
+    if not records:
+        return ALL_DAYS
+    mask = 0
+    known = False
+    for record in records:
+        for bit, keys in enumerate(_DAY_KEYS):
+            for key in keys:
+                if key in record:
+                    known = True
+                    if record[key] in (True, 1, "1", "S", "s"):
+                        mask |= 1 << bit
+    if not known:
+        _logger.warning("Expedition %s: unknown weekly frequency %r, assuming it runs every day", expedition_id, records)
+        return ALL_DAYS
+    return mask
+
+
+def _parse_month_day(value: str) -> int:
+    """
+    MMDD de una fecha `AAAA-MM-DD`, `DD/MM[/AAAA]` o `MM-DD`
+    """
+
+    value = str(value)[:10]
+    if "/" in value:
+        day, month = value.split("/")[:2]
+    else:
+        month, day = value.split("-")[-2:]
+    return int(month) * 100 + int(day)
+
+
+def _parse_seasons(data) -> list[tuple[int, int]]:
+    """
+    Las temporadas (inicio, fin) en formato MMDD a partir de las `temporadas_anuales` de una expedición
+    """
+
+    seasons = []
+    for record in _as_list(data):
+        start = record.get("fecha_inicio") or record.get("inicio") or record.get("desde")
+        end = record.get("fecha_fin") or record.get("fin") or record.get("hasta")
+        try:
+            seasons.append((_parse_month_day(start), _parse_month_day(end)))
+        except (TypeError, ValueError):
+            continue
+    return seasons
+
+
+def parse_stop_times(data: dict) -> list[tuple[int, int]]:
+    """
+    Las paradas de una expedición de la API en orden, como pares (id de parada, minutos)
+    """
+
+    stop_times = []
+    for stop_data in _lines._ordered_stop_records(data):
+        stop_id = _lines._record_stop_id(stop_data)
+        if stop_id is not None:
+            stop_times.append((stop_id, parse_minutes(stop_data.get("hora"))))
+    return stop_times
+
+
+def parse_expedition(data: dict, line_id: int = None) -> Expedition:
+    """
+    Construye una expedición con los datos de la API (con las asociaciones de `lines.NETWORK_ASSOCIATED`)
+    """
+
+    expedition_id = int(data["id"])
+    return Expedition(id=expedition_id,
+                      line_id=line_id if line_id is not None else data.get("linea_id"),
+                      stop_times=parse_stop_times(data),
+                      weekdays=_parse_weekdays(data.get("frecuencias_semanales"), expedition_id),
+                      seasons=_parse_seasons(data.get("temporadas_anuales")))
+
+
+def iter_network_expeditions(refresh: bool = False) -> Iterable[Expedition]:
+    """
+    Todas las expediciones de la red de `lines.get_network`, descargada de `/lineas/index.json` en una sola llamada
+    que se comparte con la red
+
+    :param refresh: Volver a descargar la red aunque no haya caducado
+    """
+
+    return iter(_lines.get_network(refresh).expeditions)
+
+
+def load_timetable(refresh: bool = False) -> Timetable:
+    """
+    Construye el horario con las expediciones de la red de `lines.get_network`
+
+    :param refresh: Volver a descargar la red aunque no haya caducado
+    """
+
+    return Timetable(_lines.get_network(refresh).expeditions)
+
+
+_timetable = (None, None)  # (horario, red con la que se construyó o None si se instaló con `set_timetable`)
+_timetable_lock = threading.Lock()
+
+
+def get_timetable(refresh: bool = False) -> Timetable:
+    """
+    El horario compartido por `next_departures` y `departures_between`, construido con la red de `lines.get_network`
+    y reconstruido cuando esta se vuelve a descargar (cada `lines.NETWORK_TTL` segundos). Uno instalado con
+    `set_timetable` se mantiene hasta que se pide `refresh`
+
+    :param refresh: Volver a descargar la red
+    """
+
+    global _timetable
+    timetable, built_from = _timetable
+    if timetable is not None and built_from is None and not refresh:
+        return timetable
+
+    network = _lines.get_network(refresh)
+    if timetable is None or built_from is not network:
+        with _timetable_lock:
+            timetable, built_from = _timetable
+            if timetable is None or built_from is not network:
+                timetable = Timetable(network.expeditions)
+                _timetable = (timetable, network)
+    return timetable
+
+
+def set_timetable(timetable: Timetable):
+    """
+    Sustituye el horario compartido, por ejemplo por uno construido con `Timetable.from_snapshot`
+    """
+
+    global _timetable
+    _timetable = (timetable, None)
+
+
+def next_departures(stop_id: int, when: datetime = None, n: int = 5) -> list[Departure]:
+    """
+    Los próximos `n` pasos por una parada (ver `Timetable.next_departures`), sin llamar a la API salvo la primera vez
+    """
+
+    return get_timetable().next_departures(stop_id, when, n)
+
+
+def departures_between(stop_id: int, start: datetime, end: datetime) -> list[Departure]:
+    """
+    Los pasos por una parada entre dos momentos (ver `Timetable.departures_between`)
+    """
+
+    return get_timetable().departures_between(stop_id, start, end)
+
+## ^^^ Methods ^^^ ##
@@ -0,0 +1,325 @@
+"""
+Seguimiento en vivo de la flota: consulta periódicamente `/buses/getGeolocs.json`, recuerda la última posición de
+cada bus y solo informa de lo que ha cambiado.
+
+``` python
+from arriva_api.transport.fleet import FleetTracker
+
+for delta in FleetTracker().watch():
+    print(delta.appeared, delta.changed, delta.disappeared)
+```
+"""
+
+from . import _rest_adapter
+from ._records import first as _first
+from .distance import haversine
+
+import logging
+import threading
+import time
+from typing import Callable, Iterator
+
+_logger = logging.getLogger(__name__)
+
+# `extracto_app.md` documenta los endpoints de la flota pero no la forma de sus respuestas, así que las claves que se
+# aceptan para cada campo están aquí, en un único sitio, por orden de preferencia
+BUS_KEYS = ("bus", "vehiculo", "id")
+LAT_KEYS = ("lat", "latitud", "latitude")
+LONG_KEYS = ("lon", "lng", "longitud", "longitude")
+LINE_KEYS = ("linea_id", "linea")
+EXPEDITION_KEYS = ("expedicion_id", "expedicion")
+TIME_KEYS = ("fecha", "timestamp", "date")
+
+
+## vvv Classes vvv ##
+
+class BusPosition():
+    """
+    La posición de un bus en un momento dado
+    """
+
+    __slots__ = ("bus", "lat", "long", "line_id", "expedition_id", "time", "raw")
+
+    def __init__(self, bus: str, lat: float, long: float, line_id: int = None, expedition_id: int = None, time: str = None, raw: dict = None):
+        self.bus = bus
+        """
+        Identificador del bus
+        """
+
+        self.lat = lat
+        """
+        Latitud
+        """
+
+        self.long = long
+        """
+        Longitud
+        """
+
+        self.line_id = line_id
+        """
+        Id de la línea que está haciendo, si la indica la API
+        """
+
+        self.expedition_id = expedition_id
+        """
+        Id de la expedición que está haciendo, si la indica la API
+        """
+
+        self.time = time
+        """
+        Momento de la posición, tal y como lo indica la API
+        """
+
+        self.raw = raw
+        """
+        Los datos tal cual los devuelve la API
+        """
+
+    def _state(self) -> tuple:
+        return (self.lat, self.long, self.line_id, self.expedition_id, self.time)
+
+    def __repr__(self):
+        return f"Bus {self.bus}: Lat: {self.lat}, Long: {self.long}"
+
+
+class FleetDelta():
+    """
+    Los cambios en la flota entre dos consultas
+    """
+
+    __slots__ = ("appeared", "changed", "disappeared", "polled_at")
+
+    def __init__(self, appeared: list[BusPosition], changed: list[BusPosition], disappeared: list[BusPosition], polled_at: float):
+        self.appeared = appeared
+        """
+        Buses que no estaban en la consulta anterior
+        """
+
+        self.changed = changed
+        """
+        Buses cuya posición (o línea, expedición...) ha cambiado, con su nueva posición
+        """
+
+        self.disappeared = disappeared
+        """
+        Buses que ya no aparecen, con su última posición conocida
+        """
+
+        self.polled_at = polled_at
+        """
+        Momento de la consulta (`time.time()`)
+        """
+
+    def __bool__(self):
+        return bool(self.appeared or self.changed or self.disappeared)
+
+    def __repr__(self):
+        return f"+{len(self.appeared)} ~{len(self.changed)} -{len(self.disappeared)}"
+
+
+class FleetTracker():
+    """
+    Consulta periódicamente las posiciones de todos los buses y genera solo las diferencias con la consulta anterior.
+
+    El intervalo entre consultas se adapta: se acorta (hasta `min_interval`) mientras hay cambios y se alarga
+    (hasta `max_interval`) cuando no los hay o la API falla.
+
+    :param interval: Segundos iniciales entre consultas
+    :param min_interval: Mínimo de segundos entre consultas
+    :param max_interval: Máximo de segundos entre consultas
+    :param factor: Cuánto se multiplica o divide el intervalo en cada ajuste
+    :param min_distance: Kilómetros que tiene que moverse un bus para contar como cambio (filtra el ruido del GPS)
+    """
+
+    def __init__(self, interval: float = 10, min_interval: float = 5, max_interval: float = 60, factor: float = 1.5, min_distance: float = 0):
+        self.interval = interval
+        """
+        Segundos hasta la próxima consulta
+        """
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.min_distance = min_distance
+
+        self.positions = {}
+        """
+        La última posición conocida de cada bus, por identificador
+        """
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _has_changed(self, old: BusPosition, new: BusPosition) -> bool:
+        if old._state() == new._state():
+            return False
+        if self.min_distance and (old.line_id, old.expedition_id) == (new.line_id, new.expedition_id):
+            return haversine(old.lat, old.long, new.lat, new.long) >= self.min_distance
+        return True
+
+    def update(self, positions: list[BusPosition]) -> FleetDelta:
+        """
+        Compara unas posiciones con las anteriores y las guarda. Es lo que hace `poll` con cada consulta
+        """
+
+        current = {position.bus: position for position in positions}
+        appeared = []
+        changed = []
+        for bus, position in current.items():
+            old = self.positions.get(bus)
+            if old is None:
+                appeared.append(position)
+            elif self._has_changed(old, position):
+                changed.append(position)
+            else:
+                # Se mantiene la posición anterior para que los movimientos pequeños se acumulen
+                current[bus] = old
+        disappeared = [position for bus, position in self.positions.items() if bus not in current]
+
+        self.positions = current
+        return FleetDelta(appeared, changed, disappeared, time.time())
+
+    def poll(self) -> FleetDelta:
+        """
+        Consulta las posiciones una vez y devuelve los cambios
+        """
+
+        return self.update(get_bus_positions())
+
+    def _adapt(self, delta: FleetDelta = None):
+        if delta:
+            self.interval = max(self.min_interval, self.interval / self.factor)
+        else:
+            self.interval = min(self.max_interval, self.interval * self.factor)
+
+    def watch(self, include_empty: bool = False) -> Iterator[FleetDelta]:
+        """
+        Generador que consulta indefinidamente (hasta `stop()`) y produce los cambios de cada consulta. La primera
+        produce todos los buses como aparecidos. Los errores de la API se registran y se reintenta más tarde
+
+        :param include_empty: Producir también las consultas sin cambios
+        """
+
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            try:
+                delta = self.poll()
+            except Exception as e:
+                _logger.warning("Fleet poll failed: %s", e)
+                delta = None
+            self._adapt(delta)
+            if delta is not None and (delta or include_empty):
+                yield delta
+            self._stop_event.wait(self.interval)
+
+    def start(self, callback: Callable[[FleetDelta], None]) -> threading.Thread:
+        """
+        Consulta en un hilo en segundo plano, llamando a `callback` con cada conjunto de cambios
+        """
+
+        def _run():
+            for delta in self.watch():
+                callback(delta)
+
+        self._thread = threading.Thread(target=_run, name="FleetTracker", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """
+        Detiene `watch` o el hilo de `start`
+        """
+
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+def _parse_bus_position(data: dict, bus: str = None) -> BusPosition:
+    """
+    Construye una posición con los datos de `/buses/getGeolocs.json` o `/buses/getGeoloc/{bus}.json`. Lanza
+    `ValueError` si el registro no identifica al bus (y no se indica `bus`) o no tiene posición
+
+    :param bus: El identificador del bus si el registro no lo trae
+    """
+
+    bus_id = _first(data, *BUS_KEYS)
+    if bus_id is None:
+        bus_id = bus
+    if bus_id is None or bus_id == "":
+        raise ValueError(f"Bus record without an id: {data!r}")
+
+    return BusPosition(bus=str(bus_id),
+                       lat=float(_first(data, *LAT_KEYS)),
+                       long=float(_first(data, *LONG_KEYS)),
+                       line_id=_first(data, *LINE_KEYS),
+                       expedition_id=_first(data, *EXPEDITION_KEYS),
+                       time=_first(data, *TIME_KEYS),
+                       raw=data)
+
+
+def _bus_records(data) -> list[tuple[str, dict]]:
+    """
+    Los registros de cada bus, venga la respuesta como lista, bajo una clave o como diccionario por bus. Cada uno
+    va con el identificador del bus si la respuesta lo da fuera del registro (como clave del diccionario), o None
+    """
+
+    if isinstance(data, list):
+        return [(None, record) for record in data]
+    for key in ("buses", "geolocs", "data"):
+        if isinstance(data.get(key), list):
+            return [(None, record) for record in data[key]]
+    return [(str(bus), record) for bus, record in data.items() if isinstance(record, dict)]
+
+
+def get_bus_positions() -> list[BusPosition]:
+    """
+    Obtiene la posición actual de todos los buses. Los registros sin posición se descartan, igual que los que no
+    identifican al bus (con un aviso en el log), que si no se mezclarían en un único bus
+    """
+
+    positions = []
+    without_id = 0
+    for bus, record in _bus_records(_rest_adapter.get("/buses/getGeolocs.json", shared=False)):
+        if bus is None and _first(record, *BUS_KEYS) in (None, ""):
+            without_id += 1
+            continue
+        try:
+            positions.append(_parse_bus_position(record, bus))
+        except (TypeError, ValueError):
+            continue  # Buses sin posición
+    if without_id:
+        _logger.warning("Skipped %d bus records without an id", without_id)
+    return positions
+
+
+def get_bus_position(bus: str) -> BusPosition:
+    """
+    Obtiene la posición actual de un bus
+    """
+
+    return _parse_bus_position(_rest_adapter.get(f"/buses/getGeoloc/{bus}.json", shared=False), bus)
+
+
+def get_bus_last_stop(bus: str) -> dict:
+    """
+    Obtiene la última parada por la que ha pasado un bus, tal y como la devuelve la API
+    """
+
+    return _rest_adapter.get(f"/buses/getLastStop/{bus}.json", shared=False)
+
+
+def get_bus_last_area(bus: str) -> dict:
+    """
+    Obtiene el último área por el que ha pasado un bus, tal y como la devuelve la API
+    """
+
+    return _rest_adapter.get(f"/buses/getLastArea/{bus}.json", shared=False)
+
+## ^^^ Methods ^^^ ##
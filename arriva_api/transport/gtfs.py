@@ -0,0 +1,326 @@
+"""
+Exportador a GTFS estático. Escribe `agency.txt`, `stops.txt` (de `Stop`), `routes.txt` (de `Line`), `trips.txt`,
+`stop_times.txt`, `calendar.txt` y `calendar_dates.txt` en un directorio.
+
+Las líneas se descargan (`/lineas/view/{id}.json` con sus expediciones y, si les faltan las paradas,
+`/expediciones/view/{id}.json`) con un número acotado de hilos y se escriben en disco según llegan, así que en
+memoria solo están las líneas en vuelo. Tras cada línea se guarda un punto de control: si la exportación se
+interrumpe, al volver a lanzarla continúa donde se quedó.
+
+``` python
+from arriva_api.transport import gtfs
+
+gtfs.export("gtfs/")
+```
+"""
+
+from . import _rest_adapter
+from . import lines as _lines
+from . import stops as _stops
+from ._files import make_shareable
+from .expeditions import ALL_DAYS, Expedition, parse_expedition
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from datetime import date, timedelta
+import json
+import logging
+import os
+import tempfile
+from typing import Iterable
+
+LINE_ASSOCIATED = "Expediciones.ParadaExpediciones.Paradas;Expediciones.FrecuenciasSemanales;Expediciones.TemporadasAnuales"
+"""
+Asociaciones pedidas a `/lineas/view/{id}.json`: las expediciones con sus paradas, días y temporadas
+"""
+
+EXPEDITION_ASSOCIATED = "ParadaExpediciones.Paradas;FrecuenciasSemanales;TemporadasAnuales"
+"""
+Asociaciones pedidas a `/expediciones/view/{id}.json` para las expediciones que llegan sin paradas
+"""
+
+AGENCY = {"agency_id": "arriva", "agency_name": "Arriva Galicia", "agency_url": "https://www.arriva.es/galicia",
+          "agency_timezone": "Europe/Madrid", "agency_lang": "es"}
+"""
+La fila de `agency.txt`
+"""
+
+CHECKPOINT = ".gtfs-checkpoint.json"
+
+_logger = logging.getLogger(__name__)
+
+_TRIPS = ("route_id", "service_id", "trip_id")
+_STOP_TIMES = ("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence")
+_DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+## vvv Classes vvv ##
+
+class GtfsExporter():
+    """
+    Exportación de la red a GTFS en `directory` (ver el módulo)
+
+    :param start_date: Primer día del calendario. Por defecto, hoy
+    :param end_date: Último día del calendario. Por defecto, un año después de `start_date`
+    :param max_workers: Líneas descargadas a la vez
+    :param resume: Continuar una exportación interrumpida en el mismo directorio (con las mismas fechas)
+    """
+
+    def __init__(self, directory: str, start_date: date = None, end_date: date = None, max_workers: int = 8, resume: bool = True):
+        self.directory = directory
+        self.start_date = start_date or date.today()
+        self.end_date = end_date or self.start_date + timedelta(days=365)
+        self.max_workers = max_workers
+        self.resume = resume
+        self._state = None
+        self._service_ids = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    ## Punto de control ##
+
+    def _load_state(self) -> dict:
+        fresh = {"start_date": self.start_date.isoformat(), "end_date": self.end_date.isoformat(),
+                 "stops": False, "lines": None, "done": [], "offsets": {}, "services": []}
+        if not self.resume:
+            return fresh
+        try:
+            with open(self._path(CHECKPOINT)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return fresh
+        if state.get("start_date") != fresh["start_date"] or state.get("end_date") != fresh["end_date"]:
+            return fresh
+        return state
+
+    def _save_state(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-checkpoint-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(CHECKPOINT))
+
+    def _write_atomic(self, name: str, header: tuple, rows: Iterable[tuple]):
+        """
+        Escribe un fichero entero según se generan sus filas, en un temporal que lo sustituye al terminar
+        """
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".tmp-{name}-")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+            make_shareable(tmp_path)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    ## Fases ##
+
+    def _export_stops(self):
+        # GTFS exige la posición de cada parada: las que no la tienen no se exportan, ni sus pasos (ver `_export_lines`)
+        def rows():
+            for stop in _stops.iter_all_stops():
+                if stop.location is not None:
+                    yield stop.id, stop.name, stop.location.lat, stop.location.long
+
+        self._write_atomic("stops.txt", ("stop_id", "stop_name", "stop_lat", "stop_lon"), rows())
+        self._state["stops"] = True
+        self._save_state()
+
+    def _export_routes(self):
+        line_ids = []
+
+        def rows():
+            for line in _lines.iter_all_lines():
+                line_ids.append(line.id)
+                # La API no da un código público de línea (`Line.id_sitme` no viene en `/lineas/index.json`)
+                yield line.id, AGENCY["agency_id"], line.id, line.name, 3  # 3: autobús
+
+        self._write_atomic("routes.txt", ("route_id", "agency_id", "route_short_name", "route_long_name", "route_type"), rows())
+        self._state["lines"] = line_ids
+        self._save_state()
+
+    def _open_append(self, name: str, header: tuple):
+        """
+        Abre un fichero de la fase de líneas para añadir, descartando lo escrito tras el último punto de control
+        """
+
+        path = self._path(name)
+        offset = self._state["offsets"].get(name)
+        if offset is None or not os.path.exists(path):
+            f = open(path, "w", newline="", encoding="utf-8")
+            csv.writer(f).writerow(header)
+            f.flush()
+            self._state["offsets"][name] = f.tell()
+            return f
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+        return open(path, "a", newline="", encoding="utf-8")
+
+    def _service_id(self, expedition: Expedition) -> str:
+        """
+        El servicio (días y temporadas) de una expedición, que se añade a los del punto de control si es nuevo
+        """
+
+        key = (expedition.weekdays, tuple(tuple(season) for season in expedition.seasons))
+        index = self._service_ids.get(key)
+        if index is None:
+            index = self._service_ids[key] = len(self._state["services"])
+            self._state["services"].append([expedition.weekdays, [list(season) for season in expedition.seasons]])
+        return f"S{index}"
+
+    def _exported_stops(self) -> set[int]:
+        """
+        Los ids de las paradas de `stops.txt`
+        """
+
+        with open(self._path("stops.txt"), newline="", encoding="utf-8") as f:
+            return {int(row["stop_id"]) for row in csv.DictReader(f)}
+
+    def _export_lines(self):
+        stop_ids = self._exported_stops()
+        skipped_trips = 0
+        done = set(self._state["done"])
+        pending = [line_id for line_id in self._state["lines"] if line_id not in done]
+        trips_file = self._open_append("trips.txt", _TRIPS)
+        stop_times_file = self._open_append("stop_times.txt", _STOP_TIMES)
+        try:
+            trips, stop_times = csv.writer(trips_file), csv.writer(stop_times_file)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Como mucho 2 * max_workers líneas en memoria, escritas en orden
+                in_flight = deque()
+                pending = iter(pending)
+                for line_id in pending:
+                    in_flight.append((line_id, executor.submit(fetch_line_expeditions, line_id)))
+                    if len(in_flight) >= 2 * self.max_workers:
+                        break
+                while in_flight:
+                    line_id, future = in_flight.popleft()
+                    for expedition in future.result():
+                        trip_stop_times = _trip_stop_times(expedition, stop_ids)
+                        if not trip_stop_times:
+                            skipped_trips += 1
+                            continue
+                        trips.writerow((line_id, self._service_id(expedition), expedition.id))
+                        for sequence, stop_id, minutes in trip_stop_times:
+                            time = _format_time(minutes)
+                            stop_times.writerow((expedition.id, time, time, stop_id, sequence))
+                    next_line = next(pending, None)
+                    if next_line is not None:
+                        in_flight.append((next_line, executor.submit(fetch_line_expeditions, next_line)))
+
+                    for f in (trips_file, stop_times_file):
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._state["offsets"]["trips.txt"] = trips_file.tell()
+                    self._state["offsets"]["stop_times.txt"] = stop_times_file.tell()
+                    self._state["done"].append(line_id)
+                    self._save_state()
+        finally:
+            trips_file.close()
+            stop_times_file.close()
+        if skipped_trips:
+            _logger.warning("Skipped %d trips without two located stops with a time", skipped_trips)
+
+    def _export_calendar(self):
+        services = self._state["services"]
+
+        def calendar():
+            for i, (weekdays, _) in enumerate(services):
+                yield (f"S{i}", *(weekdays >> day & 1 for day in range(7)),
+                       self.start_date.strftime("%Y%m%d"), self.end_date.strftime("%Y%m%d"))
+
+        def calendar_dates():
+            # Las temporadas no caben en calendar.txt: se quitan los días fuera de ellas
+            for i, (weekdays, seasons) in enumerate(services):
+                if not seasons:
+                    continue
+                expedition = Expedition(None, None, [], weekdays, [tuple(season) for season in seasons])
+                day = self.start_date
+                while day <= self.end_date:
+                    if weekdays >> day.weekday() & 1 and not expedition.runs_on(day):
+                        yield f"S{i}", day.strftime("%Y%m%d"), 2
+                    day += timedelta(days=1)
+
+        self._write_atomic("calendar.txt", ("service_id", *_DAYS, "start_date", "end_date"), calendar())
+        self._write_atomic("calendar_dates.txt", ("service_id", "date", "exception_type"), calendar_dates())
+        self._write_atomic("agency.txt", tuple(AGENCY), [tuple(AGENCY.values())])
+
+    def run(self):
+        """
+        Exporta (o continúa exportando) la red. Al terminar se borra el punto de control
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._state = self._load_state()
+        self._service_ids = {(weekdays, tuple(tuple(season) for season in seasons)): i
+                             for i, (weekdays, seasons) in enumerate(self._state["services"])}
+        if not self._state["stops"]:
+            self._export_stops()
+        if self._state["lines"] is None:
+            self._export_routes()
+        self._export_lines()
+        self._export_calendar()
+        try:
+            os.unlink(self._path(CHECKPOINT))
+        except FileNotFoundError:
+            pass
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+def _format_time(minutes: int) -> str:
+    """
+    Hora GTFS (`HH:MM:SS`, puede pasar de 24) de unos minutos desde la medianoche, vacía si no se conoce (solo en las
+    paradas intermedias, ver `_trip_stop_times`)
+    """
+
+    return "" if minutes < 0 else f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def _trip_stop_times(expedition: Expedition, stop_ids: set[int]) -> list[tuple[int, int, int]]:
+    """
+    Los pasos de una expedición que se exportan, como tuplas (secuencia, id de parada, minutos): solo los de paradas
+    de `stop_ids` y sin los primeros y últimos que no tienen hora, que GTFS exige al principio y al final del viaje.
+    Vacío si no quedan al menos dos
+    """
+
+    stop_times = [(sequence, stop_id, minutes) for sequence, (stop_id, minutes) in enumerate(expedition.stop_times)
+                  if stop_id in stop_ids]
+    first = next((i for i, (_, _, minutes) in enumerate(stop_times) if minutes >= 0), len(stop_times))
+    last = next((i for i in range(len(stop_times) - 1, -1, -1) if stop_times[i][2] >= 0), -1)
+    return stop_times[first:last + 1] if last - first >= 1 else []
+
+
+def fetch_line_expeditions(line_id: int) -> list[Expedition]:
+    """
+    Las expediciones de una línea con sus paradas, días y temporadas. Las que llegan sin paradas se piden una a una
+    """
+
+    data = _rest_adapter.get(f"/lineas/view/{line_id}.json", ep_params={"associated": LINE_ASSOCIATED}, shared=False)
+    expeditions = []
+    for expedition_data in _lines._line_expeditions(data):
+        if not expedition_data.get("parada_expediciones"):
+            expedition_data = _rest_adapter.get(f"/expediciones/view/{expedition_data['id']}.json",
+                                                ep_params={"associated": EXPEDITION_ASSOCIATED}, shared=False)
+            expedition_data = expedition_data.get("expedicion", expedition_data)
+        expeditions.append(parse_expedition(expedition_data, line_id))
+    return expeditions
+
+
+def export(directory: str, start_date: date = None, end_date: date = None, max_workers: int = 8, resume: bool = True):
+    """
+    Exporta la red a GTFS en `directory` (ver `GtfsExporter`)
+    """
+
+    GtfsExporter(directory, start_date, end_date, max_workers, resume).run()
+
+## ^^^ Methods ^^^ ##
@@ -0,0 +1,386 @@
+"""
+Planificador de viajes local sobre la red de Arriva, con transbordos y tramos a pie entre paradas cercanas, sin
+llamar a `buscador/search` para cada par origen-destino.
+
+Usa el Connection Scan Algorithm (CSA): las expediciones de un día se descomponen en conexiones (un bus que va de una
+parada a la siguiente) ordenadas por hora de salida, y una consulta las recorre una sola vez desde la hora pedida.
+Los datos salen del horario de `expeditions` y del catálogo de `stops`, que se descargan la primera vez.
+
+``` python
+from arriva_api.transport import journeys
+
+journey = journeys.plan(15004, 15018)
+journey.legs, journey.arrival
+journey.fetch_rates()
+```
+"""
+
+from . import stops as _stops
+from . import rates as _rates
+from .expeditions import Timetable, get_timetable
+from .spatial import GridIndex
+from .stops import StopTable
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import math
+import threading
+
+_INFINITY = 2 ** 31 - 1
+
+
+## vvv Classes vvv ##
+
+class Leg():
+    """
+    Un tramo de un viaje: en un bus (una expedición) o a pie entre dos paradas cercanas
+    """
+
+    __slots__ = ("origin_id", "destination_id", "departure", "arrival", "line_id", "expedition_id", "rate")
+
+    def __init__(self, origin_id: int, destination_id: int, departure: datetime, arrival: datetime, line_id: int = None, expedition_id: int = None):
+        self.origin_id = origin_id
+        """
+        Id de la parada de salida
+        """
+
+        self.destination_id = destination_id
+        """
+        Id de la parada de llegada
+        """
+
+        self.departure = departure
+        """
+        Hora de salida
+        """
+
+        self.arrival = arrival
+        """
+        Hora de llegada
+        """
+
+        self.line_id = line_id
+        """
+        Id de la línea, None si el tramo es a pie
+        """
+
+        self.expedition_id = expedition_id
+        """
+        Id de la expedición, None si el tramo es a pie
+        """
+
+        self.rate = None
+        """
+        El precio del tramo, tras `Journey.fetch_rates`
+        """
+
+    @property
+    def walking(self) -> bool:
+        return self.line_id is None
+
+    def __repr__(self):
+        how = "a pie" if self.walking else f"línea {self.line_id}"
+        return f"{self.departure:%H:%M} {self.origin_id} -> {self.arrival:%H:%M} {self.destination_id} ({how})"
+
+
+class Journey():
+    """
+    Un viaje de una parada a otra, como una lista de tramos
+    """
+
+    __slots__ = ("legs",)
+
+    def __init__(self, legs: list[Leg]):
+        self.legs = legs
+        """
+        Los tramos en orden
+        """
+
+    @property
+    def departure(self) -> datetime:
+        return self.legs[0].departure
+
+    @property
+    def arrival(self) -> datetime:
+        return self.legs[-1].arrival
+
+    @property
+    def duration(self) -> timedelta:
+        return self.arrival - self.departure
+
+    @property
+    def transfers(self) -> int:
+        """
+        Número de transbordos (cambios de bus)
+        """
+
+        return max(0, sum(1 for leg in self.legs if not leg.walking) - 1)
+
+    def fetch_rates(self, max_workers: int = 8) -> dict[tuple[int, int], Exception]:
+        """
+        Obtiene con `rates.get_rates` el precio de cada tramo en bus (cada bus es un billete) y lo guarda en `Leg.rate`
+
+        :return: La excepción de cada tramo (origen, destino) cuyo precio no se pudo obtener
+        """
+
+        bus_legs = [leg for leg in self.legs if not leg.walking]
+        rates, errors = _rates.get_rates([(leg.origin_id, leg.destination_id) for leg in bus_legs], max_workers=max_workers)
+        for leg in bus_legs:
+            leg.rate = rates.get((leg.origin_id, leg.destination_id))
+        return errors
+
+    @property
+    def price(self) -> float:
+        """
+        El precio total en efectivo, o None si falta el de algún tramo (ver `fetch_rates`)
+        """
+
+        bus_legs = [leg for leg in self.legs if not leg.walking]
+        if any(leg.rate is None for leg in bus_legs):
+            return None
+        return sum(leg.rate.effective for leg in bus_legs)
+
+    def __repr__(self):
+        return f"{self.departure:%H:%M} -> {self.arrival:%H:%M} ({self.transfers} transbordos)"
+
+
+class _Connections():
+    """
+    Las conexiones de un día ordenadas por hora de salida, en columnas. Las horas son minutos desde la medianoche de
+    ese día; incluye las expediciones del día anterior que pasan de la medianoche y las del día siguiente
+    """
+
+    __slots__ = ("departures", "arrivals", "origins", "destinations", "trips", "expeditions")
+
+    def __init__(self, timetable: Timetable, day: date):
+        connections = []
+        self.expeditions = []
+        for offset in (-1, 0, 1):
+            other_day = day + timedelta(days=offset)
+            for expedition in timetable.expeditions.values():
+                if not expedition.runs_on(other_day):
+                    continue
+                trip = len(self.expeditions)
+                self.expeditions.append(expedition)
+                stop_times = expedition.stop_times
+                for (origin_id, departure), (destination_id, arrival) in zip(stop_times, stop_times[1:]):
+                    if departure < 0 or arrival < departure:
+                        continue
+                    departure += offset * 1440
+                    if departure >= 0:
+                        connections.append((departure, arrival + offset * 1440, origin_id, destination_id, trip))
+
+        connections.sort()
+        self.departures = array("i", [connection[0] for connection in connections])
+        self.arrivals = array("i", [connection[1] for connection in connections])
+        self.origins = [connection[2] for connection in connections]
+        self.destinations = [connection[3] for connection in connections]
+        self.trips = array("i", [connection[4] for connection in connections])
+
+
+class JourneyPlanner():
+    """
+    Planificador de viajes (ver el módulo). Las conexiones de cada día consultado se construyen una vez y se guardan
+    las de los `cached_days` más recientes
+
+    :param timetable: El horario. Por defecto, el compartido de `expeditions.get_timetable`
+    :param stop_table: Las paradas, para los tramos a pie. Por defecto, el catálogo de `stops`
+    :param max_walk: Distancia máxima en km de un tramo a pie entre dos paradas. 0 para no caminar
+    :param walking_speed: Velocidad a pie en km/h
+    :param transfer_time: Minutos mínimos para cambiar de bus en la misma parada
+    """
+
+    def __init__(self, timetable: Timetable = None, stop_table: StopTable = None, max_walk: float = 0.4, walking_speed: float = 4.5, transfer_time: int = 2, cached_days: int = 2):
+        self.timetable = timetable or get_timetable()
+        self.stop_table = stop_table
+        self.max_walk = max_walk
+        self.walking_speed = walking_speed
+        self.transfer_time = transfer_time
+        self.cached_days = cached_days
+        self._days = OrderedDict()
+        self._footpaths = None
+        self._lock = threading.Lock()
+
+    def footpaths(self) -> dict[int, list[tuple[int, int]]]:
+        """
+        Por parada, las paradas a menos de `max_walk` km como pares (id de parada, minutos a pie)
+        """
+
+        if self._footpaths is not None:
+            return self._footpaths
+
+        footpaths = {}
+        if self.max_walk > 0:
+            if self.stop_table is None:
+                table, index, _ = _stops.catalog.indexed()
+            else:
+                table = self.stop_table
+                located = table.located_rows()
+                index = GridIndex([(table.lats[row], table.longs[row]) for row in located], located)
+            used = {stop_id for expedition in self.timetable.expeditions.values() for stop_id, _ in expedition.stop_times}
+            for stop_id in used:
+                row = table.row(stop_id)
+                if row is None or math.isnan(table.lats[row]) or math.isnan(table.longs[row]):
+                    continue
+                for distance, other_row in index.within(table.lats[row], table.longs[row], self.max_walk):
+                    other_id = table.ids[other_row]
+                    if other_id != stop_id and other_id in used:
+                        footpaths.setdefault(stop_id, []).append((other_id, math.ceil(distance / self.walking_speed * 60)))
+        self._footpaths = footpaths
+        return footpaths
+
+    def _connections(self, day: date) -> _Connections:
+        with self._lock:
+            connections = self._days.get(day)
+            if connections is not None:
+                self._days.move_to_end(day)
+                return connections
+
+        connections = _Connections(self.timetable, day)
+        with self._lock:
+            self._days[day] = connections
+            while len(self._days) > self.cached_days:
+                self._days.popitem(last=False)
+        return connections
+
+    def _scan(self, connections: _Connections, day: date, origin_id: int, destination_id: int, start: int) -> Journey:
+        """
+        Una pasada del CSA desde el minuto `start`: el viaje que llega antes al destino, o None
+        """
+
+        footpaths = self.footpaths()
+        transfer_time = self.transfer_time
+        departures, arrivals, origins, destinations, trips = (connections.departures, connections.arrivals, connections.origins,
+                                                              connections.destinations, connections.trips)
+
+        arrival = {origin_id: start}
+        ready = {origin_id: start}
+        via = {}
+        for other_id, minutes in footpaths.get(origin_id, ()):
+            arrival[other_id] = ready[other_id] = start + minutes
+            via[other_id] = (False, origin_id, start)
+        best = arrival.get(destination_id, _INFINITY)
+        boarded = {}
+
+        for i in range(bisect_left(departures, start), len(departures)):
+            departure = departures[i]
+            if departure >= best:
+                break
+            trip = trips[i]
+            if trip not in boarded:
+                if ready.get(origins[i], _INFINITY) > departure:
+                    continue
+                boarded[trip] = i
+            stop_id, stop_arrival = destinations[i], arrivals[i]
+            if stop_arrival >= arrival.get(stop_id, _INFINITY):
+                continue
+            arrival[stop_id] = stop_arrival
+            ready[stop_id] = stop_arrival + transfer_time
+            via[stop_id] = (True, boarded[trip], i)
+            if stop_id == destination_id:
+                best = stop_arrival
+            for other_id, minutes in footpaths.get(stop_id, ()):
+                if stop_arrival + minutes < arrival.get(other_id, _INFINITY):
+                    arrival[other_id] = ready[other_id] = stop_arrival + minutes
+                    via[other_id] = (False, stop_id, stop_arrival)
+                    if other_id == destination_id:
+                        best = min(best, stop_arrival + minutes)
+
+        if destination_id not in via:
+            return None
+
+        midnight = datetime.combine(day, datetime.min.time())
+        legs = []
+        stop_id = destination_id
+        while stop_id != origin_id:
+            by_bus, first, last = via[stop_id]
+            if by_bus:
+                expedition = connections.expeditions[trips[first]]
+                legs.append(Leg(origins[first], stop_id, midnight + timedelta(minutes=departures[first]), midnight + timedelta(minutes=arrivals[last]),
+                                expedition.line_id, expedition.id))
+                stop_id = origins[first]
+            else:
+                legs.append(Leg(first, stop_id, midnight + timedelta(minutes=last), midnight + timedelta(minutes=arrival[stop_id])))
+                stop_id = first
+        legs.reverse()
+
+        # Un primer tramo a pie se hace justo antes del primer bus, no nada más empezar
+        if len(legs) > 1 and legs[0].walking:
+            shift = legs[1].departure - legs[0].arrival
+            legs[0].departure += shift
+            legs[0].arrival += shift
+        return Journey(legs)
+
+    def earliest_arrival(self, origin_id: int, destination_id: int, when: datetime = None) -> Journey:
+        """
+        El viaje que llega antes al destino saliendo a partir de `when` (por defecto, ahora), o None si no hay
+        ninguno antes del final del día siguiente
+        """
+
+        if origin_id == destination_id:
+            return None
+        when = when or datetime.now()
+        day = when.date()
+        start = -(-int((when - datetime.combine(day, datetime.min.time())).total_seconds()) // 60)
+        return self._scan(self._connections(day), day, origin_id, destination_id, start)
+
+    def profile(self, origin_id: int, destination_id: int, start: datetime, end: datetime) -> list[Journey]:
+        """
+        Todos los viajes óptimos saliendo entre `start` y `end`: ninguno sale antes y llega después que otro. Se
+        obtienen con pasadas sucesivas del CSA, cada una desde justo después de la salida del viaje anterior
+
+        :return: Los viajes por hora de salida
+        """
+
+        journeys = []
+        when = start
+        while when <= end:
+            journey = self.earliest_arrival(origin_id, destination_id, when)
+            if journey is None or journey.departure > end:
+                break
+            while journeys and journeys[-1].arrival >= journey.arrival:
+                journeys.pop()
+            journeys.append(journey)
+            when = journey.departure + timedelta(minutes=1)
+        return journeys
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def get_planner() -> JourneyPlanner:
+    """
+    El planificador compartido por `plan` y `profile`, creado la primera vez con el horario y el catálogo compartidos
+    """
+
+    global _planner
+    if _planner is None or _planner.timetable is not get_timetable():
+        with _planner_lock:
+            if _planner is None or _planner.timetable is not get_timetable():
+                _planner = JourneyPlanner()
+    return _planner
+
+
+def plan(origin_id: int, destination_id: int, when: datetime = None) -> Journey:
+    """
+    El viaje que llega antes de una parada a otra saliendo a partir de `when` (ver `JourneyPlanner.earliest_arrival`)
+    """
+
+    return get_planner().earliest_arrival(origin_id, destination_id, when)
+
+
+def profile(origin_id: int, destination_id: int, start: datetime, end: datetime) -> list[Journey]:
+    """
+    Los viajes óptimos de una parada a otra saliendo entre dos momentos (ver `JourneyPlanner.profile`)
+    """
+
+    return get_planner().profile(origin_id, destination_id, start, end)
+
+## ^^^ Methods ^^^ ##
@@ -1,6 +1,26 @@
 from . import _rest_adapter
+from . import expeditions as _expeditions
 from .stops import Stop
 
+import threading
+import time
+from typing import Iterable, Iterator
+
+NETWORK_ASSOCIATED = "Expediciones.ParadaExpediciones.Paradas;Expediciones.ParadaOrigen;Expediciones.ParadaDestino;Expediciones.FrecuenciasSemanales;Expediciones.TemporadasAnuales;Expediciones.GescarPlanningHoy"
+"""
+Las asociaciones que pide la web (`getLines`) a `/lineas/index.json` para obtener la red entera en una sola llamada:
+cada línea con sus expediciones, las paradas de cada expedición, sus frecuencias semanales y temporadas
+"""
+
+NETWORK_TTL = 24 * 3600
+"""
+Segundos que se considera válida la red descargada por `get_network`
+"""
+
+_network = None
+_network_loaded_at = None
+_network_lock = threading.Lock()
+
 
 ## vvv Classes vvv ##
 
@@ -9,6 +29,8 @@ class Line():
     Una línea de bus
     """
 
+    __slots__ = ("id", "name", "origin", "destination", "id_sitme", "concession", "name_ida", "name_vta")
+
     def __init__(self, id: int, name: str, origin: Stop = None, destination: Stop = None, id_sitme: str = None, concession: str = None, name_ida: str = None, name_vta: str = None):
         self.id = id
         """
@@ -53,6 +75,81 @@ class Line():
     def __repr__(self):
         return self.name
 
+
+class Network():
+    """
+    La red de líneas como grafo: las paradas de cada línea en orden y las líneas que pasan por cada parada, junto con
+    las expediciones de todas las líneas. Se construye con una sola llamada a `/lineas/index.json` (ver `get_network`),
+    de la que salen también el horario de `expeditions` y la instantánea de `snapshot`
+    """
+
+    __slots__ = ("lines", "line_stops", "stop_lines", "expeditions")
+
+    def __init__(self, lines: dict[int, Line], line_stops: dict[int, list[int]], expeditions: list = None):
+        self.lines = lines
+        """
+        Las líneas por id
+        """
+
+        self.line_stops = line_stops
+        """
+        Por línea, los ids de sus paradas en el orden en que las recorren sus expediciones
+        """
+
+        self.stop_lines = {}
+        """
+        Por parada, los ids de las líneas que pasan por ella
+        """
+
+        for line_id, stop_ids in line_stops.items():
+            for stop_id in stop_ids:
+                self.stop_lines.setdefault(stop_id, []).append(line_id)
+
+        self.expeditions = expeditions or []
+        """
+        Las expediciones de todas las líneas (`arriva_api.transport.expeditions.Expedition`), con sus horas de paso
+        """
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "Network":
+        """
+        Construye la red con los registros de `iter_network_records`, en una sola pasada: cada expedición se
+        interpreta una vez y de ella salen tanto el orden de las paradas de su línea como sus horas de paso
+        """
+
+        lines = {}
+        line_stops = {}
+        expeditions = []
+        for el in records:
+            line = _parse_line(el)
+            lines[line.id] = line
+            # El orden de la línea es el de la primera expedición que pasa por cada parada
+            seen = {}
+            for expedition_data in _line_expeditions(el):
+                expedition = _expeditions.parse_expedition(expedition_data, int(line.id))
+                expeditions.append(expedition)
+                for stop_id, _ in expedition.stop_times:
+                    seen.setdefault(stop_id, None)
+            line_stops[line.id] = list(seen)
+        return cls(lines, line_stops, expeditions)
+
+    def lines_from_stop(self, stop_id: int) -> list[Line]:
+        """
+        Las líneas que pasan por una parada
+        """
+
+        return [self.lines[line_id] for line_id in self.stop_lines.get(stop_id, ())]
+
+    def stops_of_line(self, line_id: int) -> list[int]:
+        """
+        Los ids de las paradas de una línea, en orden
+        """
+
+        return self.line_stops.get(line_id, [])
+
+    def __len__(self):
+        return len(self.lines)
+
 ## ^^^ Classes ^^^ ##
 
 
@@ -63,9 +160,7 @@ def _parse_stop(data: dict) -> Stop:
     Builds a stop based on the data given by the API. Nothe this is specific to the lines endpoints, e.g. the "nome" attribute
     """
 
-    # Only busstops are posible as a line's origin or destination, kinda obvious
     return Stop(id=data["id"],
-                type="busstop",
                 name=data["nome"],
                 lat=data.get("latitude"),
                 long=data.get("longitude"))
@@ -90,36 +185,92 @@ def _parse_line(data: dict) -> Line:
                 destination=destination)
 
 
+def _ordered_stop_records(data: dict) -> list[dict]:
+    """
+    Las paradas (`parada_expediciones`) de una expedición de `iter_network_records`, en orden
+    """
+
+    return sorted(data.get("parada_expediciones") or [], key=lambda el: el.get("orden") or 0)
+
+
+def _record_stop_id(data: dict) -> int:
+    """
+    El id de parada de un registro de `_ordered_stop_records`, o None si no lo tiene
+    """
+
+    stop_id = data.get("parada_id") or (data.get("parada") or {}).get("id")
+    return None if stop_id is None else int(stop_id)
+
+
 def search_lines_from_stop(stop_id: int, page_number: int = 1, page_size: int = 2147483647) -> list[Line]:
     """
-    Based on a stop id, obtains all the lines that go through it. **WARNING**: The API seems to have deprecated this, almost-always returns an empty list, again `15004` works, check `busGal_api.transport.stops.get_stop_name`
+    Based on a stop id, obtains all the lines that go through it. The API endpoint (`/lines/search`) is deprecated
+    upstream, so this is answered from the local line–stop graph of `get_network` (downloaded the first time)
 
     :param page_number: The page number to retrieve. Defaults to the first one.
 
     :param page_size: Number of results per page. Defaults to the maximum integer value the API would accept, a.k.a. the maximum positive value for a 32-bit signed binary integer (Wikipedia), a.k.a. 2,147,483,647
     """
 
-    data = _rest_adapter.get("/lines/search",
-                            ep_params={"stop_id": stop_id,
-                                       "page_number": page_number,
-                                       "page_size": page_size})
+    start = (page_number - 1) * page_size
+    return get_network().lines_from_stop(stop_id)[start:start + page_size]
+
+
+def iter_all_lines() -> Iterator[Line]:
+    """
+    Generador con todas las líneas, leídas según se descarga `/lineas/index.json` (sin cargar la respuesta entera en memoria)
+    """
 
-    # Last element in list is total_results
-    return [_parse_line(el) for el in data[:-1]]
+    for el in _rest_adapter.stream("/lineas/index.json"):
+        yield _parse_line(el)
 
 
-def get_all_lines():
+def iter_network_records(revalidate: bool = False) -> Iterator[dict]:
     """
-    Obtiene todas las líneas (calls `concession_search_lines` with no filters)
+    Generador con los registros de `/lineas/index.json` con todas las asociaciones de `NETWORK_ASSOCIATED`, tal y
+    como los devuelve la API, leídos según se descargan
+
+    :param revalidate: Preguntar a la API aunque la caché en disco del adaptador tenga la respuesta sin caducar
     """
 
-    data = _rest_adapter.get("/lineas/index.json")
+    return _rest_adapter.stream("/lineas/index.json", ep_params={"associated": NETWORK_ASSOCIATED}, revalidate=revalidate)
 
-    return [Line(id=el["linea"]["id"],
-                name=el["linea"]["mom_linea"],
-                origin=origin,
-                destination=destination)
-            for el in data]
+
+def _line_expeditions(data: dict) -> list[dict]:
+    """
+    Las expediciones asociadas a un registro de `iter_network_records`
+    """
+
+    return data.get("expediciones") or data["linea"].get("expediciones") or []
+
+
+def get_all_lines() -> list[Line]:
+    """
+    Obtiene todas las líneas
+    """
+
+    return list(iter_all_lines())
+
+
+def get_network(refresh: bool = False) -> Network:
+    """
+    Obtiene la red entera (líneas, sus paradas, las líneas de cada parada y las expediciones) en una sola llamada. Se
+    guarda en memoria durante `NETWORK_TTL` segundos, y el horario de `expeditions.get_timetable` se construye con ella
+
+    :param refresh: Volver a descargarla aunque no haya caducado, también si la caché en disco del adaptador la tiene
+    """
+
+    global _network, _network_loaded_at
+    if not refresh and _network is not None and time.monotonic() - _network_loaded_at < NETWORK_TTL:
+        return _network
+
+    with _network_lock:
+        if not refresh and _network is not None and time.monotonic() - _network_loaded_at < NETWORK_TTL:
+            return _network
+        network = Network.from_records(iter_network_records(revalidate=refresh))
+        _network_loaded_at = time.monotonic()
+        _network = network
+    return network
 
 
 def get_line(line_id: int) -> Line:
@@ -1,6 +1,24 @@
 from . import _rest_adapter
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+import threading
+import time
+from typing import Iterable
+
+RATE_TTL = 2 * 24 * 3600
+"""
+Segundos que se recuerda el precio de un viaje. Las tarifas cambian muy de vez en cuando
+"""
+
+RATE_CACHE_SIZE = 10000
+"""
+Número máximo de precios recordados. Al superarlo se olvidan los usados hace más tiempo
+"""
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
 
 ## vvv Classes vvv ##
 
@@ -10,6 +28,8 @@ class SpecialRate():
     A special rate (a discount)
     """
 
+    __slots__ = ("id", "text", "type_id", "type_name")
+
     def __init__(self, id: int, text: str, type_id: int, type_name: str):
         self.id = id
         """
@@ -40,6 +60,8 @@ class Rate():
     Una tarifa (el precio de un viaje)
     """
 
+    __slots__ = ("effective", "credit_card", "special_rates")
+
     def __init__(self, effective: float, credit_card: float, special_rates: list[SpecialRate] = None):
         self.effective = effective
         """
@@ -59,6 +81,50 @@ class Rate():
     def __repr__(self):
         return f"Efectivo: {self.effective}€ || Tarjeta: {self.credit_card}€"
 
+
+class RateMatrix():
+    """
+    Los precios entre varios orígenes y varios destinos. `rates[i][j]` es la tarifa de `origins[i]` a
+    `destinations[j]`, o None si no se pudo obtener (el error está en `errors`)
+    """
+
+    __slots__ = ("origins", "destinations", "rates", "errors")
+
+    def __init__(self, origins: list[int], destinations: list[int], rates: list[list[Rate]], errors: dict[tuple[int, int], Exception]):
+        self.origins = origins
+        """
+        Ids de las paradas de origen (filas)
+        """
+
+        self.destinations = destinations
+        """
+        Ids de las paradas de destino (columnas)
+        """
+
+        self.rates = rates
+        """
+        Matriz densa de tarifas, None donde hubo un error
+        """
+
+        self.errors = errors
+        """
+        La excepción de cada par (origen, destino) que falló
+        """
+
+    def __getitem__(self, pair: tuple[int, int]) -> Rate:
+        origin_id, destination_id = pair
+        return self.rates[self.origins.index(origin_id)][self.destinations.index(destination_id)]
+
+    def to_dict(self) -> dict[tuple[int, int], Rate]:
+        """
+        La matriz en formato disperso: solo los pares con tarifa
+        """
+
+        return {(origin_id, destination_id): rate
+                for origin_id, row in zip(self.origins, self.rates)
+                for destination_id, rate in zip(self.destinations, row)
+                if rate is not None}
+
 ## ^^^ Classes ^^^ ##
 
 
@@ -77,11 +143,111 @@ def _parse_rate(data: dict) -> Rate:
                 special_rates=[_parse_special_rate(sr) for sr in data["special_rates"]] if data.get("special_rates") else None)
 
 
-def get_rate(origin_id: int, destination_id: int) -> Rate:
+def _cached_rate(pair: tuple[int, int]) -> Rate:
+    """
+    El precio recordado de un par, o None si no está o ha caducado (y entonces se olvida)
+    """
+
+    with _memo_lock:
+        entry = _memo.get(pair)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            del _memo[pair]
+            return None
+        _memo.move_to_end(pair)
+        return entry[1]
+
+
+def _remember_rate(pair: tuple[int, int], rate: Rate):
+    """
+    Recuerda el precio de un par durante `RATE_TTL` segundos, olvidando los usados hace más tiempo si ya hay
+    `RATE_CACHE_SIZE`
+    """
+
+    with _memo_lock:
+        _memo[pair] = (time.monotonic() + RATE_TTL, rate)
+        _memo.move_to_end(pair)
+        while len(_memo) > RATE_CACHE_SIZE:
+            _memo.popitem(last=False)
+
+
+def clear_rate_cache():
+    """
+    Olvida los precios recordados por `get_rate` y `get_rates`
+    """
+
+    with _memo_lock:
+        _memo.clear()
+
+
+def get_rate(origin_id: int, destination_id: int, use_cache: bool = True) -> Rate:
     """
-    Obtiene los precios de un viaje, incluyendo tarifas especiales
+    Obtiene los precios de un viaje, incluyendo tarifas especiales. Se recuerdan durante `RATE_TTL` segundos
+
+    :param use_cache: Usar el precio recordado si lo hay. Con False siempre se consulta la API
+    """
+
+    pair = (origin_id, destination_id)
+    if use_cache:
+        rate = _cached_rate(pair)
+        if rate is not None:
+            return rate
+
+    rate = _parse_rate(_rest_adapter.get(f"/buscador/precio/{origin_id}/{destination_id}.json"))
+    _remember_rate(pair, rate)
+
+    return rate
+
+
+def get_rates(pairs: Iterable[tuple[int, int]], max_workers: int = 8) -> tuple[dict[tuple[int, int], Rate], dict[tuple[int, int], Exception]]:
     """
+    Obtiene los precios de muchos viajes a la vez. Los pares repetidos se consultan una sola vez, los ya
+    recordados no se consultan y el resto se consultan en paralelo
+
+    :param pairs: Pares (id de origen, id de destino)
+    :param max_workers: Máximo de consultas simultáneas a la API
+    :return: Las tarifas por par y, aparte, la excepción de cada par que falló
+    """
+
+    rates = {}
+    errors = {}
+    missing = []
+    for pair in dict.fromkeys(pairs):
+        rate = _cached_rate(pair)
+        if rate is not None:
+            rates[pair] = rate
+        else:
+            missing.append(pair)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            futures = {pair: executor.submit(get_rate, *pair, use_cache=False) for pair in missing}
+            for pair, future in futures.items():
+                try:
+                    rates[pair] = future.result()
+                except Exception as e:
+                    errors[pair] = e
+
+    return rates, errors
+
+
+def get_rate_matrix(origins: Iterable[int], destinations: Iterable[int], max_workers: int = 8) -> RateMatrix:
+    """
+    Obtiene los precios de todos los orígenes a todos los destinos (ver `get_rates`)
+
+    :param origins: Ids de las paradas de origen
+    :param destinations: Ids de las paradas de destino
+    :param max_workers: Máximo de consultas simultáneas a la API
+    """
+
+    origins = list(dict.fromkeys(origins))
+    destinations = list(dict.fromkeys(destinations))
+    rates, errors = get_rates(((o, d) for o in origins for d in destinations), max_workers=max_workers)
 
-    return _parse_rate(_rest_adapter.get(f"/buscador/precio/{origin_id}/{destination_id}.json"))
+    return RateMatrix(origins=origins,
+                      destinations=destinations,
+                      rates=[[rates.get((o, d)) for d in destinations] for o in origins],
+                      errors=errors)
 
 ## ^^^ Methods ^^^ ##
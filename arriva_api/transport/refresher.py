@@ -0,0 +1,393 @@
+"""
+Refresco en segundo plano de los datos que más se piden (el catálogo de paradas, la red de líneas, los avisos y las
+salidas de las paradas más concurridas), para que ninguna consulta tenga que esperar a la API cuando caducan.
+
+Cada dato se vuelve a descargar en un hilo antes de caducar (`refresh_ahead`), con un margen aleatorio (`jitter`)
+para que no caduquen ni se descarguen todos a la vez. Mientras tanto se sigue sirviendo el anterior
+(stale-while-revalidate). Al arrancar se descargan todos en paralelo (`warm`).
+
+``` python
+from arriva_api.transport import refresher
+
+warmer = refresher.transport_refresher(hot_stops=[15004, 15010])
+warmer.start()  # Descarga todo y lo mantiene al día
+...
+warmer.stats(), warmer.to_prometheus()
+```
+"""
+
+from . import _rest_adapter
+from . import expeditions as _expeditions
+from . import lines as _lines
+from . import stops as _stops
+from . import warning_alerts as _warning_alerts
+from ..metrics import escape_label_value
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+_logger = logging.getLogger(__name__)
+
+
+## vvv Classes vvv ##
+
+class _Job():
+    """
+    Un dato que se mantiene al día y lo que se sabe de sus refrescos
+    """
+
+    __slots__ = ("name", "load", "ttl", "install", "value", "loaded_at", "due", "lock",
+                 "refreshes", "failures", "lag", "max_lag", "last_duration", "last_error")
+
+    def __init__(self, name: str, load: Callable[[], Any], ttl: float, install: Callable[[Any], None] = None):
+        self.name = name
+        self.load = load
+        self.ttl = ttl
+        self.install = install
+        self.value = None
+        self.loaded_at = None
+        self.due = 0.0
+        self.lock = threading.Lock()
+        self.refreshes = 0
+        self.failures = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.last_duration = None
+        self.last_error = None
+
+    def is_stale(self, now: float) -> bool:
+        return self.loaded_at is None or now - self.loaded_at >= self.ttl
+
+
+class Refresher():
+    """
+    Mantiene al día un conjunto de datos con nombre (ver el módulo). Cada uno tiene una función que lo descarga, un
+    TTL y, opcionalmente, una función que lo instala donde lo leen las consultas (por ejemplo `StopCatalog.put_table`).
+    Thread-safe
+
+    :param refresh_ahead: Fracción del TTL antes de que caduque en la que se vuelve a descargar cada dato
+
+    :param jitter: Fracción del TTL que se suma o resta al azar al momento de cada refresco
+
+    :param retry_after: Segundos (aproximados, con el mismo `jitter`) tras los que se reintenta un refresco fallido
+
+    :param max_workers: Refrescos simultáneos como máximo
+    """
+
+    def __init__(self, refresh_ahead: float = 0.2, jitter: float = 0.1, retry_after: float = 30, max_workers: int = 4):
+        self.refresh_ahead = refresh_ahead
+        """
+        Fracción del TTL antes de que caduque en la que se vuelve a descargar cada dato
+        """
+
+        self.jitter = jitter
+        """
+        Fracción del TTL que se suma o resta al azar al momento de cada refresco
+        """
+
+        self.retry_after = retry_after
+        """
+        Segundos tras los que se reintenta un refresco fallido
+        """
+
+        self.max_workers = max_workers
+        """
+        Refrescos simultáneos como máximo
+        """
+
+        self._jobs = {}
+        self._toggles = []
+        self._enabled = []
+        self._lock = threading.Lock()
+        self._executor = None
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add(self, name: str, load: Callable[[], Any], ttl: float, install: Callable[[Any], None] = None):
+        """
+        Registra un dato. No se descarga hasta `warm`, `start`, `get` o `refresh`
+
+        :param load: Descarga el dato y lo devuelve
+
+        :param ttl: Segundos que el dato se considera válido
+
+        :param install: Recibe cada valor nuevo para instalarlo donde lo leen las consultas
+        """
+
+        with self._lock:
+            self._jobs[name] = _Job(name, load, ttl, install)
+        self._wakeup.set()
+
+    def add_endpoint(self, endpoint: str, ttl: float, ep_params: dict = None):
+        """
+        Registra un GET de la API con el endpoint como nombre. Cada respuesta se guarda en la memoria del adaptador
+        compartido (`RestAdapter.prime`), así que las llamadas normales a ese endpoint la reciben sin esperar. Se
+        pregunta siempre a la API, aunque la caché en disco del adaptador tenga la respuesta sin caducar
+        """
+
+        self.add(endpoint,
+                 lambda: _rest_adapter.get(endpoint, ep_params=ep_params, shared=False, revalidate=True),
+                 ttl,
+                 lambda data: _rest_adapter.prime(endpoint, data, ttl, ep_params=ep_params))
+
+    def add_toggle(self, enable: Callable[[], Any], disable: Callable[[Any], None]):
+        """
+        Registra un ajuste que solo está activo con el planificador en marcha: `start` llama a `enable` y `stop` a
+        `disable` con lo que devolvió (por ejemplo, el valor anterior del ajuste para restaurarlo)
+        """
+
+        with self._lock:
+            self._toggles.append((enable, disable))
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._jobs)
+
+    def _job(self, name: str) -> _Job:
+        with self._lock:
+            return self._jobs[name]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="Refresher")
+            return self._executor
+
+    def _spread(self, ttl: float) -> float:
+        return random.uniform(-self.jitter, self.jitter) * ttl
+
+    def _refresh(self, job: _Job) -> Any:
+        """
+        Descarga e instala un dato. Si ya se está descargando, espera a esa descarga en lugar de repetirla
+        """
+
+        if not job.lock.acquire(blocking=False):
+            with job.lock:
+                return job.value
+
+        try:
+            started = time.monotonic()
+            try:
+                value = job.load()
+                if job.install is not None:
+                    job.install(value)
+            except Exception as e:
+                job.failures += 1
+                job.last_error = e
+                job.due = time.monotonic() + max(0.0, self.retry_after + self._spread(self.retry_after))
+                raise
+
+            now = time.monotonic()
+            if job.loaded_at is not None:
+                # Cuánto tiempo se sirvió el dato ya caducado
+                job.lag = max(0.0, now - (job.loaded_at + job.ttl))
+                job.max_lag = max(job.max_lag, job.lag)
+            job.value = value
+            job.loaded_at = now
+            job.refreshes += 1
+            job.last_duration = now - started
+            job.last_error = None
+            job.due = now + max(0.0, job.ttl * (1 - self.refresh_ahead) + self._spread(job.ttl))
+            return value
+        finally:
+            job.lock.release()
+            self._wakeup.set()
+
+    def _submit(self, job: _Job) -> Future:
+        # Hasta que termine, el refresco fija el siguiente
+        job.due = float("inf")
+        future = self._pool().submit(self._refresh, job)
+
+        def _log(future: Future):
+            if future.exception() is not None:
+                _logger.warning("Refresh of %s failed: %s", job.name, future.exception())
+
+        future.add_done_callback(_log)
+        return future
+
+    def get(self, name: str) -> Any:
+        """
+        El valor de un dato. Si ha caducado se devuelve igualmente y se vuelve a descargar en segundo plano; solo se
+        espera si no se había descargado nunca
+        """
+
+        job = self._job(name)
+        if job.loaded_at is None:
+            return self._refresh(job)
+        if job.is_stale(time.monotonic()) and not job.lock.locked():
+            self._submit(job)
+        return job.value
+
+    def refresh(self, name: str, wait: bool = True) -> Any:
+        """
+        Vuelve a descargar un dato aunque no haya caducado
+
+        :param wait: Esperar y devolver el valor nuevo. Si no, se descarga en segundo plano y se devuelve el `Future`
+        """
+
+        job = self._job(name)
+        return self._refresh(job) if wait else self._submit(job)
+
+    def warm(self, names: Iterable[str] = None) -> dict[str, Exception]:
+        """
+        Descarga en paralelo los datos indicados (todos por defecto) y espera a que terminen. Los fallos no se
+        lanzan: se devuelven por nombre y el planificador de `start` los reintenta
+        """
+
+        jobs = [self._job(name) for name in (self.names() if names is None else names)]
+        futures = {job.name: self._submit(job) for job in jobs}
+        wait(futures.values())
+        return {name: future.exception() for name, future in futures.items() if future.exception() is not None}
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.clear()
+            now = time.monotonic()
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                if job.due <= now and not job.lock.locked():
+                    self._submit(job)
+            next_due = min((job.due for job in jobs), default=float("inf"))
+            self._wakeup.wait(None if next_due == float("inf") else max(0.0, next_due - now))
+
+    def start(self, warm: bool = True) -> threading.Thread:
+        """
+        Arranca el planificador en un hilo en segundo plano, que refresca cada dato antes de que caduque
+
+        :param warm: Descargar antes todos los datos y esperar a que terminen
+        """
+
+        with self._lock:
+            if not self._enabled:
+                self._enabled = [(disable, enable()) for enable, disable in self._toggles]
+
+        if warm:
+            self.warm()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="Refresher", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """
+        Detiene el planificador de `start` y deshace sus ajustes (`add_toggle`). Los refrescos en curso terminan en
+        segundo plano
+        """
+
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+            enabled, self._enabled = self._enabled, []
+        if executor is not None:
+            executor.shutdown(wait=False)
+        for disable, previous in reversed(enabled):
+            disable(previous)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Por dato: su edad (`age`, None si no se ha descargado), si ha caducado (`stale`), cuánto tiempo se sirvió
+        caducado antes del último refresco y como máximo (`lag`, `max_lag`), los refrescos y fallos, lo que tardó el
+        último y su error
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {job.name: {"age": None if job.loaded_at is None else now - job.loaded_at,
+                           "stale": job.is_stale(now),
+                           "lag": job.lag,
+                           "max_lag": job.max_lag,
+                           "refreshes": job.refreshes,
+                           "failures": job.failures,
+                           "last_duration": job.last_duration,
+                           "last_error": None if job.last_error is None else repr(job.last_error)}
+                for job in jobs}
+
+    def to_prometheus(self, prefix: str = "arriva") -> str:
+        """
+        Las estadísticas de `stats` en el formato de texto de Prometheus
+        """
+
+        stats = self.stats()
+        lines = []
+
+        def metric(name: str, kind: str, help: str, key: str):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for job, values in sorted(stats.items()):
+                if values[key] is not None:
+                    lines.append(f'{prefix}_{name}{{key="{escape_label_value(job)}"}} {int(values[key]) if isinstance(values[key], bool) else values[key]}')
+
+        metric("refresh_age_seconds", "gauge", "Seconds since the data was last downloaded", "age")
+        metric("refresh_stale", "gauge", "Whether the data is being served past its TTL", "stale")
+        metric("refresh_lag_seconds", "gauge", "Seconds the data was served past its TTL before the last refresh", "lag")
+        metric("refresh_max_lag_seconds", "gauge", "Maximum seconds the data was served past its TTL", "max_lag")
+        metric("refresh_duration_seconds", "gauge", "Duration of the last refresh", "last_duration")
+        metric("refreshes_total", "counter", "Successful refreshes", "refreshes")
+        metric("refresh_failures_total", "counter", "Failed refreshes", "failures")
+        return "\n".join(lines) + "\n"
+
+## ^^^ Classes ^^^ ##
+
+
+## vvv Methods vvv ##
+
+def transport_refresher(hot_stops: Iterable[int] = (), lines: bool = True, timetable: bool = False, alerts: bool = True, stop_ttl: float = 60, stale_while_revalidate: bool = False, **kwargs) -> Refresher:
+    """
+    Un `Refresher` con los datos compartidos de `arriva_api.transport`: el catálogo de paradas y, según los
+    parámetros, la red de líneas, el horario, los avisos y las salidas de las paradas más concurridas. Cada refresco
+    pregunta a la API aunque la caché en disco del adaptador tenga el dato sin caducar, porque sus TTL no tienen por
+    qué coincidir con los de aquí
+
+    :param hot_stops: Ids de las paradas cuyas salidas (`/superparadas/expediciones-fecha/{id}.json`) se mantienen en la memoria del adaptador
+
+    :param lines: Mantener la red de `lines.get_network` (una descarga grande, una vez al día)
+
+    :param timetable: Mantener también el horario de `expeditions.get_timetable`, que se construye con la misma red
+
+    :param alerts: Mantener los avisos de `warning_alerts`
+
+    :param stop_ttl: Segundos que se consideran válidas las salidas de cada parada
+
+    :param stale_while_revalidate: Mientras el planificador esté en marcha, que `stops.catalog` sirva el catálogo anterior si caduca en lugar de esperar a descargarlo (ver `StopCatalog.stale_while_revalidate`)
+
+    :param kwargs: Se pasan a `Refresher`
+    """
+
+    refresher = Refresher(**kwargs)
+
+    catalog = _stops.catalog
+    if stale_while_revalidate:
+        def _enable():
+            previous, catalog.stale_while_revalidate = catalog.stale_while_revalidate, True
+            return previous
+
+        refresher.add_toggle(_enable, lambda previous: setattr(catalog, "stale_while_revalidate", previous))
+    refresher.add("stops",
+                  lambda: _stops.StopTable.from_records(_stops.iter_stop_records(revalidate=True)),
+                  catalog.ttl if catalog.ttl is not None else 24 * 3600,
+                  catalog.put_table)
+    if lines or timetable:
+        # El horario sale de la misma descarga que la red: se reconstruye en este hilo al instalar la nueva
+        refresher.add("network",
+                      lambda: _lines.get_network(refresh=True),
+                      _lines.NETWORK_TTL,
+                      (lambda network: _expeditions.get_timetable()) if timetable else None)
+    if alerts:
+        refresher.add("alerts", lambda: _warning_alerts.store.sync(revalidate=True), 300)
+    for stop_id in hot_stops:
+        refresher.add_endpoint(f"/superparadas/expediciones-fecha/{stop_id}.json", stop_ttl)
+    return refresher
+
+## ^^^ Methods ^^^ ##
@@ -0,0 +1,350 @@
+"""
+Instantánea de la red en un fichero binario: paradas, líneas (con sus paradas en orden) y expediciones (con sus
+horas de paso). Se genera una vez con `build` y cada proceso la abre con `Snapshot`, que la proyecta en memoria con
+mmap: abrirla es instantáneo, no se copia nada y el sistema operativo comparte las páginas entre procesos. Las
+paradas y líneas se construyen al acceder a ellas.
+
+``` python
+from arriva_api.transport import snapshot
+
+snapshot.build("red.bin")  # Una vez, con acceso a la API
+
+network = snapshot.Snapshot("red.bin")
+network.stop(15004), network.line_stops(1234)
+network.install()  # Usa sus paradas como catálogo de `stops`, sin descargarlo
+```
+
+El formato son registros de ancho fijo ordenados por id (se buscan por bisección) y una tabla de cadenas UTF-8:
+
+- Cabecera: `ARRVSNAP`, versión y, por sección, número de registros y posición
+- Paradas: id, nombre, nombre con ayuntamiento, peso, latitud, longitud
+- Líneas: id, nombre, primera posición y número de sus paradas en la sección de paradas de línea
+- Paradas de línea: ids de parada
+- Expediciones: id, id de línea, primera posición y número de sus horas de paso, máscara de días de la semana y
+  primera posición y número de sus temporadas
+- Horas de paso: id de parada y minutos desde la medianoche (-1 si no se conoce)
+- Temporadas: inicio y fin en formato MMDD
+"""
+
+from . import lines as _lines
+from . import stops as _stops
+from ._files import make_shareable
+from .expeditions import Expedition
+from .stops import Stop, StopTable
+from .lines import Line
+
+from array import array
+import math
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"ARRVSNAP"
+VERSION = 2
+
+_HEADER = struct.Struct("<8sI" + "II" * 6 + "I")
+_STOP = struct.Struct("<qIIqdd")
+_LINE = struct.Struct("<qIII")
+_LINE_STOP = struct.Struct("<q")
+_EXPEDITION = struct.Struct("<qqIIIII")
+_STOP_TIME = struct.Struct("<qi")
+_SEASON = struct.Struct("<HH")
+_STRING_LENGTH = struct.Struct("<I")
+_NO_STRING = 0xFFFFFFFF
+
+
+## vvv Methods vvv ##
+
+def build(path: str, refresh: bool = False):
+    """
+    Descarga el catálogo de paradas y la red de líneas con sus expediciones y escribe la instantánea en `path`.
+    El fichero se sustituye de forma atómica, así que los procesos que tengan abierta la anterior pueden seguir usándola
+
+    :param refresh: Volver a descargar la red aunque la de `lines.get_network` no haya caducado
+    """
+
+    strings = {}
+    string_table = bytearray()
+
+    def _string(value: str) -> int:
+        if value is None:
+            return _NO_STRING
+        offset = strings.get(value)
+        if offset is None:
+            encoded = value.encode()
+            offset = strings[value] = len(string_table)
+            string_table.extend(_STRING_LENGTH.pack(len(encoded)) + encoded)
+        return offset
+
+    table = StopTable.from_records(_stops.iter_stop_records())
+    stop_records = sorted((table.ids[row], _string(table.name(row)), _string(table.name_council(row)), table.pesos[row], table.lats[row], table.longs[row])
+                          for row in range(len(table)))
+
+    # La misma red (y la misma descarga) que usan `lines.get_network` y el horario de `expeditions`
+    network = _lines.get_network(refresh)
+    line_records = [(int(line_id), _string(line.name), network.line_stops[line_id]) for line_id, line in network.lines.items()]
+    expedition_records = network.expeditions
+    line_stops = array("q")
+
+    lines_packed = bytearray()
+    for line_id, name, stop_ids in sorted(line_records):
+        lines_packed += _LINE.pack(line_id, name, len(line_stops), len(stop_ids))
+        line_stops.extend(stop_ids)
+
+    expeditions_packed = bytearray()
+    stop_times_packed = bytearray()
+    seasons_packed = bytearray()
+    count = season_count = 0
+    for expedition in sorted(expedition_records, key=lambda expedition: expedition.id):
+        expeditions_packed += _EXPEDITION.pack(expedition.id, expedition.line_id, count, len(expedition.stop_times),
+                                               expedition.weekdays, season_count, len(expedition.seasons))
+        for stop_id, minutes in expedition.stop_times:
+            stop_times_packed += _STOP_TIME.pack(stop_id, minutes)
+        for start, end in expedition.seasons:
+            seasons_packed += _SEASON.pack(start, end)
+        count += len(expedition.stop_times)
+        season_count += len(expedition.seasons)
+
+    sections = [b"".join(_STOP.pack(*record) for record in stop_records),
+                bytes(lines_packed),
+                b"".join(_LINE_STOP.pack(stop_id) for stop_id in line_stops),
+                bytes(expeditions_packed),
+                bytes(stop_times_packed),
+                bytes(seasons_packed)]
+    counts = [len(stop_records), len(line_records), len(line_stops), len(expedition_records), count, season_count]
+
+    offset = _HEADER.size
+    header_fields = []
+    for n, section in zip(counts, sections):
+        header_fields += [n, offset]
+        offset += len(section)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, *header_fields, offset))
+            for section in sections:
+                f.write(section)
+            f.write(string_table)
+        make_shareable(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+## ^^^ Methods ^^^ ##
+
+
+## vvv Classes vvv ##
+
+class _Section():
+    """
+    Registros de ancho fijo dentro del fichero
+    """
+
+    __slots__ = ("buffer", "record", "offset", "count")
+
+    def __init__(self, buffer, record: struct.Struct, count: int, offset: int):
+        self.buffer = buffer
+        self.record = record
+        self.count = count
+        self.offset = offset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> tuple:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self.record.unpack_from(self.buffer, self.offset + i * self.record.size)
+
+    def find(self, key: int) -> int:
+        """
+        Posición del registro cuyo primer campo (el id) es `key`, o None. Los registros están ordenados por id
+        """
+
+        low, high = 0, self.count
+        size, offset, buffer = self.record.size, self.offset, self.buffer
+        while low < high:
+            middle = (low + high) // 2
+            value = struct.unpack_from("<q", buffer, offset + middle * size)[0]
+            if value < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and struct.unpack_from("<q", buffer, offset + low * size)[0] == key:
+            return low
+        return None
+
+
+class Snapshot():
+    """
+    Una instantánea de la red abierta con mmap (ver el módulo). Solo lectura
+
+    :param path: El fichero generado con `build`
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"{path} is not a version {VERSION} network snapshot")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = _HEADER.unpack_from(self._mmap, 0)
+        magic, version = fields[:2]
+        sections = fields[2:-1]
+        self._strings = fields[-1]
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} network snapshot")
+        size = len(self._mmap)
+        records = (_STOP, _LINE, _LINE_STOP, _EXPEDITION, _STOP_TIME, _SEASON)
+        if self._strings > size or any(offset + count * record.size > min(size, self._strings)
+                                       for record, count, offset in zip(records, sections[0::2], sections[1::2])):
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated or corrupt")
+        self._stops = _Section(self._mmap, _STOP, *sections[0:2])
+        self._lines = _Section(self._mmap, _LINE, *sections[2:4])
+        self._line_stops = _Section(self._mmap, _LINE_STOP, *sections[4:6])
+        self._expeditions = _Section(self._mmap, _EXPEDITION, *sections[6:8])
+        self._stop_times = _Section(self._mmap, _STOP_TIME, *sections[8:10])
+        self._seasons = _Section(self._mmap, _SEASON, *sections[10:12])
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _string(self, offset: int) -> str:
+        if offset == _NO_STRING:
+            return None
+        start = self._strings + offset
+        if start + _STRING_LENGTH.size > len(self._mmap):
+            raise ValueError(f"{self.path} is truncated or corrupt")
+        length = _STRING_LENGTH.unpack_from(self._mmap, start)[0]
+        start += _STRING_LENGTH.size
+        if start + length > len(self._mmap):
+            raise ValueError(f"{self.path} is truncated or corrupt")
+        return self._mmap[start:start + length].decode()
+
+    def _stop(self, record: tuple) -> Stop:
+        stop_id, name, name_council, peso, lat, long = record
+        return Stop(id=stop_id,
+                    name=self._string(name),
+                    name_council=self._string(name_council),
+                    peso=None if peso == StopTable._NO_PESO else peso,
+                    location=None if math.isnan(lat) or math.isnan(long) else _stops.Location(lat, long))
+
+    def stop_count(self) -> int:
+        return len(self._stops)
+
+    def stops(self):
+        """
+        Generador con todas las paradas, ordenadas por id
+        """
+
+        return (self._stop(record) for record in (self._stops[i] for i in range(len(self._stops))))
+
+    def stop(self, stop_id: int) -> Stop:
+        """
+        Una parada por su id, o None
+        """
+
+        i = self._stops.find(stop_id)
+        return None if i is None else self._stop(self._stops[i])
+
+    def stop_table(self) -> StopTable:
+        """
+        Las paradas como `StopTable`
+        """
+
+        records = [self._stops[i] for i in range(len(self._stops))]
+        return StopTable(ids=array("q", [record[0] for record in records]),
+                         names=[self._string(record[1]) for record in records],
+                         names_council=[self._string(record[2]) for record in records],
+                         pesos=array("q", [record[3] for record in records]),
+                         lats=array("d", [record[4] for record in records]),
+                         longs=array("d", [record[5] for record in records]))
+
+    def install(self):
+        """
+        Usa las paradas de la instantánea como catálogo de `arriva_api.transport.stops` (hasta que caduque)
+        """
+
+        _stops.catalog.put_table(self.stop_table())
+
+    def line_count(self) -> int:
+        return len(self._lines)
+
+    def lines(self):
+        """
+        Generador con todas las líneas, ordenadas por id
+        """
+
+        return (Line(id=record[0], name=self._string(record[1])) for record in (self._lines[i] for i in range(len(self._lines))))
+
+    def line(self, line_id: int) -> Line:
+        """
+        Una línea por su id, o None
+        """
+
+        i = self._lines.find(line_id)
+        if i is None:
+            return None
+        record = self._lines[i]
+        return Line(id=record[0], name=self._string(record[1]))
+
+    def line_stops(self, line_id: int) -> list[int]:
+        """
+        Los ids de las paradas de una línea, en el orden en que las recorren sus expediciones
+        """
+
+        i = self._lines.find(line_id)
+        if i is None:
+            return []
+        _, _, first, count = self._lines[i]
+        return [self._line_stops[j][0] for j in range(first, first + count)]
+
+    def expedition_count(self) -> int:
+        return len(self._expeditions)
+
+    def expeditions(self):
+        """
+        Generador con las expediciones como tuplas (id, id de línea, [(id de parada, minutos), ...])
+        """
+
+        for i in range(len(self._expeditions)):
+            yield self._expedition(self._expeditions[i])
+
+    def expedition(self, expedition_id: int) -> tuple[int, int, list[tuple[int, int]]]:
+        """
+        Una expedición por su id como tupla (id, id de línea, [(id de parada, minutos), ...]), o None
+        """
+
+        i = self._expeditions.find(expedition_id)
+        return None if i is None else self._expedition(self._expeditions[i])
+
+    def _expedition(self, record: tuple) -> tuple[int, int, list[tuple[int, int]]]:
+        expedition_id, line_id, first, count = record[:4]
+        return expedition_id, line_id, [self._stop_times[j] for j in range(first, first + count)]
+
+    def parsed_expeditions(self):
+        """
+        Generador con las expediciones como `arriva_api.transport.expeditions.Expedition`, con sus días y temporadas
+        """
+
+        for i in range(len(self._expeditions)):
+            expedition_id, line_id, first, count, weekdays, first_season, season_count = self._expeditions[i]
+            yield Expedition(id=expedition_id,
+                             line_id=line_id,
+                             stop_times=[self._stop_times[j] for j in range(first, first + count)],
+                             weekdays=weekdays,
+                             seasons=[self._seasons[j] for j in range(first_season, first_season + season_count)])
+
+## ^^^ Classes ^^^ ##
@@ -0,0 +1,144 @@
+"""
+Índice espacial en rejilla para las búsquedas por proximidad sobre el catálogo de paradas
+"""
+
+import heapq
+import math
+
+from .distance import EARTH_RADIUS, HAS_NUMPY, haversine_many, np
+
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+## vvv Classes vvv ##
+
+class GridIndex():
+    """
+    Índice espacial que reparte los puntos en celdas de `cell_size` grados. Cada consulta solo calcula distancias
+    contra los puntos de las celdas que pueden estar dentro del radio, en lugar de contra todos.
+
+    :param points: Pares (latitud, longitud) en grados
+    :param items: Lo que se devuelve por cada punto (por ejemplo, las paradas). Por defecto, su posición en `points`
+    :param cell_size: Tamaño de cada celda en grados. 0.02 son unos 2 km de latitud en Galicia
+    """
+
+    def __init__(self, points: list[tuple[float, float]], items: list = None, cell_size: float = 0.02):
+        self.cell_size = cell_size
+        self.items = items if items is not None else list(range(len(points)))
+        self._points = points
+        self._cells = {}
+        self._lats = [lat for lat, _ in points]
+        self._longs = [long for _, long in points]
+        if HAS_NUMPY:
+            self._lats = np.array(self._lats, dtype=np.float64)
+            self._longs = np.array(self._longs, dtype=np.float64)
+
+        for i, (lat, long) in enumerate(points):
+            self._cells.setdefault(self._cell(lat, long), []).append(i)
+
+        if self._cells:
+            rows = [cell[0] for cell in self._cells]
+            cols = [cell[1] for cell in self._cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat: float, long: float) -> tuple[int, int]:
+        return (math.floor(lat / self.cell_size), math.floor(long / self.cell_size))
+
+    def _candidates(self, rows: range, cols: range):
+        for row in rows:
+            for col in cols:
+                yield from self._cells.get((row, col), ())
+
+    def _distances(self, lat: float, long: float, candidates) -> list[tuple[float, int]]:
+        """
+        Pares (distancia, posición) de los candidatos, calculados de una vez con `distance.haversine_many`
+        """
+
+        if HAS_NUMPY:
+            candidates = np.fromiter(candidates, dtype=np.intp)
+            distances = haversine_many(lat, long, self._lats[candidates], self._longs[candidates])
+            return list(zip(distances.tolist(), candidates.tolist()))
+
+        candidates = list(candidates)
+        lats, longs = self._lats, self._longs
+        distances = haversine_many(lat, long, [lats[i] for i in candidates], [longs[i] for i in candidates])
+        return list(zip(distances, candidates))
+
+    def within(self, lat: float, long: float, radius: float) -> list[tuple[float, object]]:
+        """
+        Devuelve los pares (distancia en km, item) a menos de `radius` km del punto, ordenados por distancia
+        """
+
+        if not self._cells:
+            return []
+
+        # Caja de celdas que contiene el círculo. La longitud se escala con el coseno de la latitud más alejada del ecuador
+        dlat = radius / _KM_PER_DEGREE
+        max_lat = min(abs(lat) + dlat, 89.9)
+        dlong = min(radius / (_KM_PER_DEGREE * math.cos(math.radians(max_lat))), 180)
+        row_min, col_min = self._cell(lat - dlat, long - dlong)
+        row_max, col_max = self._cell(lat + dlat, long + dlong)
+        min_row, max_row, min_col, max_col = self._bounds
+        rows = range(max(row_min, min_row), min(row_max, max_row) + 1)
+        cols = range(max(col_min, min_col), min(col_max, max_col) + 1)
+
+        found = [(distance, i) for distance, i in self._distances(lat, long, self._candidates(rows, cols))
+                 if distance <= radius]
+        found.sort()
+        return [(distance, self.items[i]) for distance, i in found]
+
+    def nearest(self, lat: float, long: float, k: int = 1) -> list[tuple[float, object]]:
+        """
+        Devuelve los `k` pares (distancia en km, item) más cercanos al punto, ordenados por distancia.
+
+        Recorre anillos de celdas cada vez más grandes alrededor del punto hasta que ninguna celda sin visitar
+        puede contener algo más cercano que el k-ésimo encontrado.
+        """
+
+        if not self._cells or k <= 0:
+            return []
+
+        row, col = self._cell(lat, long)
+        min_row, max_row, min_col, max_col = self._bounds
+        rings = max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+        best = []  # max-heap de los k mejores como (-distancia, i)
+
+        for ring in range(rings + 1):
+            if ring == 0:
+                candidates = self._cells.get((row, col), ())
+            else:
+                candidates = self._ring(row, col, ring)
+            for distance, i in self._distances(lat, long, candidates):
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, i))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, i))
+
+            if len(best) == k and -best[0][0] <= self._ring_clearance(lat, long, row, col, ring):
+                break
+
+        return [(distance, self.items[i]) for distance, i in sorted((-d, i) for d, i in best)]
+
+    def _ring(self, row: int, col: int, ring: int):
+        for c in range(col - ring, col + ring + 1):
+            yield from self._cells.get((row - ring, c), ())
+            yield from self._cells.get((row + ring, c), ())
+        for r in range(row - ring + 1, row + ring):
+            yield from self._cells.get((r, col - ring), ())
+            yield from self._cells.get((r, col + ring), ())
+
+    def _ring_clearance(self, lat: float, long: float, row: int, col: int, ring: int) -> float:
+        """
+        Distancia mínima (km) desde el punto hasta cualquier celda fuera de los anillos ya visitados
+        """
+
+        size = self.cell_size
+        lat_gap = min(lat - (row - ring) * size, (row + ring + 1) * size - lat)
+        long_gap = min(long - (col - ring) * size, (col + ring + 1) * size - long)
+        max_lat = min(abs(lat) + lat_gap, 89.9)
+        return min(lat_gap * _KM_PER_DEGREE, long_gap * _KM_PER_DEGREE * math.cos(math.radians(max_lat)))
+
+## ^^^ Classes ^^^ ##
@@ -1,7 +1,18 @@
 from . import _rest_adapter
+from .spatial import GridIndex
+from .text_search import TextIndex
+from .distance import haversine
 
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import logging
 import math
+import threading
+import time
+from typing import Iterable, Iterator
+
+_logger = logging.getLogger(__name__)
 
 
 ## vvv Classes vvv ##
@@ -11,6 +22,8 @@ class Location():
     Una ubicación geográfica (latitud y longitud)
     """
 
+    __slots__ = ("lat", "long")
+
     def __init__(self, lat: float, long: float):
         self.lat = float(lat)
         """
@@ -31,6 +44,8 @@ class Stop():
     Una parada de bus
     """
 
+    __slots__ = ("id", "name", "council_simob", "name_council", "peso", "location", "school_integration", "ordinal", "simob_id", "sitme_id", "time")
+
     def __init__(self, id: int, name: str = None, name_council: str = None, peso: int = None, location: Location = None, lat: float = None, long: float = None, school_integration: bool = None, ordinal: int = None, simob_id: int = None, council_simob: str = None, sitme_id: int = None, time: datetime = None):
         self.id = id
         """
@@ -109,118 +124,424 @@ class Stop():
     def __repr__(self):
         return self.name
 
+
+class StopTable():
+    """
+    Tabla de paradas por columnas: ids, pesos y coordenadas en arrays y los nombres concatenados en una única cadena.
+    Ocupa una fracción de lo que ocupan los objetos `Stop` equivalentes. Las paradas se crean al acceder a ellas
+    (`table[fila]`, `table.get(stop_id)` o iterando), así que modificarlas no altera la tabla.
+    """
+
+    _NO_PESO = -(2**63)
+
+    def __init__(self, ids: array, names: list[str], names_council: list[str], pesos: array, lats: array, longs: array):
+        self.ids = ids
+        """
+        Id de cada parada (`array` de enteros)
+        """
+
+        self.pesos = pesos
+        """
+        Peso de cada parada (`array` de enteros)
+        """
+
+        self.lats = lats
+        """
+        Latitud de cada parada (`array` de floats, NaN si no tiene)
+        """
+
+        self.longs = longs
+        """
+        Longitud de cada parada (`array` de floats, NaN si no tiene)
+        """
+
+        self._names, self._name_offsets = self._pack(names)
+        self._names_council, self._name_council_offsets = self._pack(names_council)
+        self._rows = {stop_id: row for row, stop_id in enumerate(ids)}
+
+    @staticmethod
+    def _pack(strings: list[str]) -> tuple[str, array]:
+        # None se guarda como una cadena vacía
+        offsets = array("I", [0])
+        position = 0
+        for string in strings:
+            position += len(string or "")
+            offsets.append(position)
+        return "".join(string or "" for string in strings), offsets
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "StopTable":
+        """
+        Construye la tabla con las paradas de `/superparadas/index/buscador.json`. Recorre `records` una sola vez,
+        así que puede ser un generador (ver `iter_stop_records`)
+        """
+
+        ids, pesos, lats, longs = array("q"), array("q"), array("d"), array("d")
+        names, names_council = [], []
+        for record in records:
+            stop_id, name, name_council, peso, lat, long = _parse_stop_record(record)
+            ids.append(stop_id)
+            names.append(name)
+            names_council.append(name_council)
+            pesos.append(cls._NO_PESO if peso is None else peso)
+            lats.append(math.nan if lat is None else lat)
+            longs.append(math.nan if long is None else long)
+
+        return cls(ids=ids, names=names, names_council=names_council, pesos=pesos, lats=lats, longs=longs)
+
+    @classmethod
+    def from_stops(cls, stops: list[Stop]) -> "StopTable":
+        """
+        Construye la tabla a partir de objetos `Stop`
+        """
+
+        return cls(ids=array("q", [_parse_id(stop.id) for stop in stops]),
+                   names=[stop.name for stop in stops],
+                   names_council=[stop.name_council for stop in stops],
+                   pesos=array("q", [cls._NO_PESO if stop.peso is None else stop.peso for stop in stops]),
+                   lats=array("d", [stop.location.lat if stop.location else math.nan for stop in stops]),
+                   longs=array("d", [stop.location.long if stop.location else math.nan for stop in stops]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> Stop:
+        lat, long = self.lats[row], self.longs[row]
+        return Stop(id=self.ids[row],
+                    name=self.name(row),
+                    name_council=self.name_council(row),
+                    peso=self.peso(row),
+                    location=None if math.isnan(lat) or math.isnan(long) else Location(lat, long))
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def name(self, row: int) -> str:
+        """
+        El nombre de la parada de una fila, sin construir la parada
+        """
+
+        return self._names[self._name_offsets[row]:self._name_offsets[row + 1]]
+
+    def name_council(self, row: int) -> str:
+        """
+        El nombre con ayuntamiento de la parada de una fila, sin construir la parada
+        """
+
+        return self._names_council[self._name_council_offsets[row]:self._name_council_offsets[row + 1]] or None
+
+    def peso(self, row: int) -> int:
+        """
+        El peso de la parada de una fila, sin construir la parada
+        """
+
+        peso = self.pesos[row]
+        return None if peso == self._NO_PESO else peso
+
+    def row(self, stop_id: int) -> int:
+        """
+        La fila de una parada por su id, o None si no está en la tabla
+        """
+
+        return self._rows.get(stop_id)
+
+    def get(self, stop_id: int) -> Stop:
+        """
+        Una parada por su id, o None si no está en la tabla
+        """
+
+        row = self._rows.get(stop_id)
+        return None if row is None else self[row]
+
+    def located_rows(self) -> list[int]:
+        """
+        Las filas de las paradas con coordenadas
+        """
+
+        return [row for row in range(len(self)) if not (math.isnan(self.lats[row]) or math.isnan(self.longs[row]))]
+
+
+class StopCatalog():
+    """
+    Caché en memoria del catálogo de paradas (`/superparadas/index/buscador.json`), ya parseado en una `StopTable`
+    con sus índices espacial y de texto. Lo comparten todas las búsquedas de paradas.
+
+    La carga es single-flight: si varios hilos lo piden a la vez con la caché caducada, solo uno descarga el catálogo
+    y el resto espera a su resultado.
+
+    :param ttl: Segundos que el catálogo se considera válido. None para que no caduque nunca
+
+    :param stale_while_revalidate: Si ha caducado, devolver el catálogo anterior en lugar de esperar y descargarlo de
+    nuevo en un hilo en segundo plano
+    """
+
+    def __init__(self, ttl: float = 3600, stale_while_revalidate: bool = False):
+        self.ttl = ttl
+        """
+        Segundos que el catálogo se considera válido
+        """
+
+        self.stale_while_revalidate = stale_while_revalidate
+        """
+        Si las consultas con el catálogo caducado reciben el anterior mientras se descarga en segundo plano
+        """
+
+        # (tabla, índice espacial, índice de texto, cargado en). Se sustituye entero con una sola asignación, así que
+        # quien lo lee una vez nunca mezcla filas de una tabla con los índices de otra
+        self._state = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, state: tuple = None) -> bool:
+        state = self._state if state is None else state
+        return state is not None and (self.ttl is None or time.monotonic() - state[3] < self.ttl)
+
+    def peek(self) -> StopTable:
+        """
+        Devuelve el catálogo si está en caché y no ha caducado, sin descargarlo nunca
+        """
+
+        state = self._state
+        return state[0] if self._is_fresh(state) else None
+
+    def get(self) -> StopTable:
+        """
+        Devuelve el catálogo, descargándolo si no está en caché o ha caducado
+        """
+
+        return self.indexed()[0]
+
+    def indexed(self) -> tuple[StopTable, GridIndex, TextIndex]:
+        """
+        Devuelve el catálogo junto con sus índices espacial y de texto (cuyos elementos son filas de esa tabla),
+        descargándolo si no está en caché o ha caducado. Los tres son siempre de la misma carga, aunque otro hilo
+        refresque el catálogo a la vez
+        """
+
+        state = self._state
+        if self._is_fresh(state):
+            return state[:3]
+
+        if self.stale_while_revalidate and state is not None:
+            self._revalidate()
+            return state[:3]
+
+        with self._lock:
+            # Otro hilo pudo cargarlo mientras esperábamos
+            state = self._state
+            if self._is_fresh(state):
+                return state[:3]
+            return self._store(StopTable.from_records(iter_stop_records()))[:3]
+
+    def _revalidate(self):
+        """
+        Descarga el catálogo en un hilo en segundo plano, salvo que ya se esté descargando
+        """
+
+        if not self._lock.acquire(blocking=False):
+            return
+
+        def _run():
+            try:
+                if not self._is_fresh():
+                    self._store(StopTable.from_records(iter_stop_records()))
+            except Exception as e:
+                _logger.warning("Stop catalog refresh failed: %s", e)
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=_run, name="StopCatalog", daemon=True).start()
+
+    def refresh(self) -> StopTable:
+        """
+        Vuelve a descargar el catálogo aunque no haya caducado. Las llamadas concurrentes comparten una única descarga
+        """
+
+        generation = self._generation
+        with self._lock:
+            if self._generation != generation:
+                return self._state[0]
+            return self._store(StopTable.from_records(iter_stop_records()))[0]
+
+    def index(self) -> GridIndex:
+        """
+        Devuelve el índice espacial (sus elementos son filas de la tabla) de las paradas del catálogo,
+        descargándolo si no está en caché o ha caducado. Para usarlo con la tabla, mejor `indexed`
+        """
+
+        return self.indexed()[1]
+
+    def text_index(self) -> TextIndex:
+        """
+        Devuelve el índice de texto (sus elementos son filas de la tabla) de los nombres de las paradas del catálogo,
+        descargándolo si no está en caché o ha caducado. Para usarlo con la tabla, mejor `indexed`
+        """
+
+        return self.indexed()[2]
+
+    def invalidate(self):
+        """
+        Descarta el catálogo en caché, la próxima consulta lo descargará de nuevo
+        """
+
+        self._state = None
+
+    def put(self, data: dict) -> StopTable:
+        """
+        Parsea y guarda en caché la respuesta de `/superparadas/index/buscador.json`
+        """
+
+        return self.put_table(StopTable.from_records(data['paradas']))
+
+    def put_table(self, table: StopTable) -> StopTable:
+        """
+        Guarda en caché una tabla de paradas ya construida, indexándola. Espera a que termine la descarga en curso,
+        si la hay
+        """
+
+        with self._lock:
+            return self._store(table)[0]
+
+    def _store(self, table: StopTable) -> tuple:
+        # Solo con `_lock`
+        located = table.located_rows()
+        index = GridIndex([(table.lats[row], table.longs[row]) for row in located], located)
+        text_index = TextIndex([table.name(row) for row in range(len(table))],
+                               weights=[table.peso(row) for row in range(len(table))])
+        state = self._state = (table, index, text_index, time.monotonic())
+        self._generation += 1
+        return state
+
 ## ^^^ Classes ^^^ ##
 
 
+catalog = StopCatalog()
+"""
+Catálogo de paradas compartido por `search_stops`, `get_all_stops`, `location_search_stops` y `nearest_stops`
+"""
+
+
 ## vvv Methods vvv ##
 
-def search_stops(query: str, num_results: int = 2147483647) -> list[Stop]:
+def _parse_id(value) -> int:
     """
-    Busca paradas por su nombre, usando la API de Arriva.
-
-    :param query: Nombre de la búsqueda
-    :param num_results: Numero de resultados a devolver. Por defecto, el valor entero máximo que acepta la API, es decir, el valor positivo máximo para un entero binario con signo de 32 bits (2,147,483,647).
+    Convierte un id de parada de la API (un entero o una cadena con uno) a entero
     """
 
-    # Llamar al endpoint de la API
-    data = _rest_adapter.get(endpoint="/superparadas/index/buscador.json")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid stop id: {value!r}") from None
 
-    stops = []
 
-    # Recorrer las paradas devueltas por la API
-    for parada_data in data['paradas']:
-        # Si la búsqueda es por nombre, filtramos
-        if query.lower() in parada_data["nombre"].lower():
-            # Crear objeto Location
-            location = Location(lat=parada_data.get("lat"),
-                                long=parada_data.get("lon"))
+def _parse_stop_record(record: dict) -> tuple:
+    """
+    Lee un registro de `/superparadas/index/buscador.json`: (id, nombre, nombre web, peso, lat, lon), con los números
+    ya convertidos y None en los campos que faltan
+    """
 
-            # Crear objeto Stop
-            stop = Stop(
-                id=parada_data["parada"],
-                name=parada_data["nombre"],
-                name_council=parada_data.get("nom_web"),
-                peso=parada_data.get("peso"),
-                location=location
-            )
+    peso, lat, long = record.get("peso"), record.get("lat"), record.get("lon")
+    return (_parse_id(record["parada"]),
+            record["nombre"],
+            record.get("nom_web"),
+            None if peso in (None, "") else int(peso),
+            None if lat in (None, "") else float(lat),
+            None if long in (None, "") else float(long))
 
-            stops.append(stop)
 
-            # Limitar el número de resultados si es necesario
-            if len(stops) >= num_results:
-                break
+def _parse_stop(record: dict) -> Stop:
+    """
+    Construye una parada con un registro de `/superparadas/index/buscador.json`
+    """
 
-    return stops
+    stop_id, name, name_council, peso, lat, long = _parse_stop_record(record)
+    return Stop(id=stop_id, name=name, name_council=name_council, peso=peso, lat=lat, long=long)
 
 
-    
+def iter_stop_records(revalidate: bool = False) -> Iterator[dict]:
+    """
+    Generador con los registros del catálogo de paradas tal y como los devuelve la API, leídos según se descargan
+    (sin cargar el catálogo entero en memoria)
 
+    :param revalidate: Preguntar a la API aunque la caché en disco del adaptador tenga el catálogo sin caducar
+    """
 
-def get_all_stops() -> list[Stop]:
+    # Como `get`, `stream` sigue la ruta dentro de la clave results si la respuesta la tiene
+    return _rest_adapter.stream("/superparadas/index/buscador.json", ("paradas",), revalidate=revalidate)
+
+
+def iter_all_stops() -> Iterator[Stop]:
     """
-    Obtiene todas las paradas existentes (llama a `search_stops` con una query vacía)
+    Generador con todas las paradas, descargadas y construidas una a una sin pasar por el catálogo en caché
     """
 
-    return search_stops(query='')
+    for record in iter_stop_records():
+        yield _parse_stop(record)
+
 
-def haversine(lat1, lon1, lat2, lon2):
+def search_stops(query: str, num_results: int = 2147483647, fuzzy: bool = True) -> list[Stop]:
     """
-    Calcula la distancia del círculo máximo en kilómetros entre dos puntos 
-    en la Tierra (especificado en grados decimales).
+    Busca paradas por su nombre en el catálogo de paradas de Arriva (ver `catalog`), ordenadas por relevancia.
+    Cada palabra de la búsqueda tiene que ser el principio de una palabra del nombre, sin tener en cuenta acentos
+    ni mayúsculas (`coru` encuentra `A Coruña`); si ninguna lo es, basta con que esté dentro de una palabra (`ruña`
+    también encuentra `A Coruña`). Los empates se resuelven por el `peso` de la parada.
+
+    :param query: Nombre de la búsqueda
+    :param num_results: Numero de resultados a devolver. Por defecto, el valor entero máximo que acepta la API, es decir, el valor positivo máximo para un entero binario con signo de 32 bits (2,147,483,647).
+    :param fuzzy: Si no hay resultados, buscar nombres parecidos para tolerar erratas (`santigo` encuentra `Santiago`)
     """
-    # Convertir decimal degrees a radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
 
-    # Diferencia entre las coordenadas
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
+    table, _, text_index = catalog.indexed()
+    return [table[row] for row in text_index.search(query, limit=num_results, fuzzy=fuzzy)]
 
-    # Fórmula Haversine
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    r = 6371  # Radio de la Tierra en kilómetros
-    return c * r
+
+def get_all_stops() -> list[Stop]:
+    """
+    Obtiene todas las paradas existentes del catálogo en caché
+    """
+
+    return list(catalog.get())
 
 def location_search_stops(location: Location = None, lat: float = None, long: float = None, radius=5) -> list[Stop]:
     """
-    Busca por las paradas existentes en un punto con un determinado radio (latitud, longitud).
+    Busca por las paradas existentes en un punto con un determinado radio (latitud, longitud), ordenadas por distancia.
 
+    :param location: Punto de búsqueda. Si no se indica se usan `lat` y `long`.
     :param lat: Latitud del punto de búsqueda.
-    :param lon: Longitud del punto de búsqueda.
+    :param long: Longitud del punto de búsqueda.
     :param radius: Radio en kilómetros para la búsqueda.
     """
 
-    # Llamar al endpoint de la API para obtener todas las paradas
-    data = _rest_adapter.get(endpoint="/superparadas/index/buscador.json")
+    if location:
+        lat, long = location.lat, location.long
 
-    stops_in_range = []
+    table, index, _ = catalog.indexed()
+    return [table[row] for _, row in index.within(lat, long, radius)]
+
+
+def nearest_stops(location: Location = None, k: int = 5, lat: float = None, long: float = None) -> list[Stop]:
+    """
+    Obtiene las `k` paradas más cercanas a un punto, ordenadas por distancia.
+
+    :param location: Punto de búsqueda. Si no se indica se usan `lat` y `long`.
+    :param k: Número de paradas a devolver.
+    :param lat: Latitud del punto de búsqueda.
+    :param long: Longitud del punto de búsqueda.
+    """
 
-    # Recorrer todas las paradas devueltas por la API
-    for parada_data in data['paradas']:
-        # Obtener la latitud y longitud de la parada
-        parada_lat = parada_data.get("lat")
-        parada_lon = parada_data.get("lon")
+    if location:
+        lat, long = location.lat, location.long
 
-        # Calcular la distancia desde el punto dado hasta la parada
-        distance = haversine(lat, long, parada_lat, parada_lon)
+    table, index, _ = catalog.indexed()
+    return [table[row] for _, row in index.nearest(lat, long, k)]
 
-        # Si la parada está dentro del rango especificado
-        if distance <= radius:
-            # Crear objeto Location
-            location = Location(lat=parada_lat, long=parada_lon)
 
-            # Crear objeto Stop
-            stop = Stop(
-                id=parada_data["parada"],
-                name=parada_data["nombre"],
-                name_council=parada_data.get("nom_web"),
-                peso=parada_data.get("peso"),
-                location=location
-            )
+def _parse_stop_name(data: dict) -> str:
+    return data["paradas"][0]["nom_parada"]
 
-            stops_in_range.append(stop)
 
-    return stops_in_range
+def _parse_stop_location(data: dict) -> Location:
+    return Location(data["paradas"][0]["lat"], data["paradas"][0]["lon"])
 
 
 def get_stop_name(stop_id: int) -> str:
@@ -230,7 +551,7 @@ def get_stop_name(stop_id: int) -> str:
 
     data = _rest_adapter.get(endpoint=f"/superparadas/expediciones-fecha/{stop_id}.json")
 
-    return data["paradas"][0]["nom_parada"]
+    return _parse_stop_name(data)
 
 
 def get_stop_location(stop_id: int) -> Location:
@@ -240,6 +561,75 @@ def get_stop_location(stop_id: int) -> Location:
 
     data = _rest_adapter.get(endpoint=f"/superparadas/expediciones-fecha/{stop_id}.json")
 
-    return Location(data["paradas"][0]["lat"], data["paradas"][0]["lon"])
+    return _parse_stop_location(data)
+
+
+def _hydrate_from_table(stops: Iterable[Stop], table: StopTable) -> list[Stop]:
+    """
+    Completa los datos que les falten a unas paradas con los de la tabla. Devuelve las que no están en ella y les
+    falta el nombre o la ubicación. Los ids pueden ser cadenas, como los devuelve a veces la API
+    """
+
+    missing = []
+    for stop in stops:
+        row = table.row(_parse_id(stop.id))
+        if row is None:
+            if stop.name is None or stop.location is None:
+                missing.append(stop)
+            continue
+        if stop.name is None:
+            stop.name = table.name(row)
+        if stop.name_council is None:
+            stop.name_council = table.name_council(row)
+        if stop.peso is None:
+            stop.peso = table.peso(row)
+        if stop.location is None and not (math.isnan(table.lats[row]) or math.isnan(table.longs[row])):
+            stop.location = Location(table.lats[row], table.longs[row])
+    return missing
+
+
+def _hydrate_from_response(stops: list[Stop], data: dict):
+    """
+    Completa el nombre y la ubicación de paradas con el mismo id con una respuesta de `/superparadas/expediciones-fecha/{id}.json`
+    """
+
+    for stop in stops:
+        if stop.name is None:
+            stop.name = _parse_stop_name(data)
+        if stop.location is None:
+            stop.location = _parse_stop_location(data)
+
+
+def hydrate_stops(stops: Iterable[Stop], max_workers: int = 8) -> list[Stop]:
+    """
+    Completa el nombre, nombre con ayuntamiento, peso y ubicación de cualquier número de paradas en una sola pasada
+    por el catálogo, en lugar de con `Stop.fetch_name` y `Stop.fetch_location` para cada una. Solo se rellenan los
+    datos que falten. Las paradas que no están en el catálogo se consultan a la API en paralelo, una vez por id; si
+    la consulta falla o la respuesta no tiene la parada, se quedan sin completar y se avisa en el log
+
+    :param max_workers: Máximo de consultas simultáneas a la API
+    :return: Las paradas, completadas
+    """
+
+    stops = list(stops)
+    missing = {}
+    for stop in _hydrate_from_table(stops, catalog.get()):
+        missing.setdefault(_parse_id(stop.id), []).append(stop)
+
+    if missing:
+        from ..rest_adapter import REQUEST_ERRORS
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            futures = {stop_id: executor.submit(_rest_adapter.get, f"/superparadas/expediciones-fecha/{stop_id}.json")
+                       for stop_id in missing}
+            for stop_id, future in futures.items():
+                try:
+                    _hydrate_from_response(missing[stop_id], future.result())
+                except REQUEST_ERRORS + (LookupError, TypeError):
+                    failed.append(stop_id)  # Se quedan sin completar
+        if failed:
+            _logger.warning("Couldn't hydrate stops %s", failed)
+    return stops
 
 ## ^^^ Methods ^^^ ##
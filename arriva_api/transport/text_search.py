@@ -0,0 +1,214 @@
+"""
+Índice de texto para buscar paradas por nombre: sin acentos ni mayúsculas, por prefijo de palabra; si no hay
+resultados, por cualquier parte de una palabra (`ruña` encuentra `A Coruña`, como la búsqueda por subcadena
+anterior) y, si sigue sin haberlos, con tolerancia a erratas mediante trigramas.
+"""
+
+from bisect import bisect_left
+import heapq
+import re
+import unicodedata
+
+_NOT_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+## vvv Methods vvv ##
+
+def fold(text: str) -> str:
+    """
+    Normaliza un texto para compararlo: minúsculas, sin acentos ni diacríticos (`Coruña` -> `coruna`) y sin signos
+    """
+
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _NOT_ALNUM.sub(" ", text).strip()
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Divide un texto normalizado con `fold` en palabras
+    """
+
+    return fold(text).split()
+
+
+def trigrams(token: str) -> set[str]:
+    """
+    Los trigramas de una palabra, con relleno para que cuenten el principio y el final
+    """
+
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+## ^^^ Methods ^^^ ##
+
+
+## vvv Classes vvv ##
+
+class TextIndex():
+    """
+    Índice invertido de palabras. Cada consulta recorre solo las palabras que empiezan por lo buscado (búsqueda
+    binaria sobre el vocabulario ordenado) y sus apariciones, así que cuesta en función de los resultados y no del
+    número de elementos indexados.
+
+    :param names: El texto de cada elemento
+    :param items: Lo que se devuelve por cada elemento. Por defecto, su posición en `names`
+    :param weights: Peso de cada elemento para desempatar el orden (mayor primero), por ejemplo el `peso` de las paradas
+    """
+
+    def __init__(self, names: list[str], items: list = None, weights: list[float] = None):
+        self.items = items if items is not None else list(range(len(names)))
+        # La API puede mandar el peso como cadena
+        self._weights = [float(weight) if weight not in (None, "") else 0 for weight in weights] if weights is not None else [0] * len(names)
+        self._lengths = [len(name) for name in names]
+        self._first_tokens = []
+        postings = {}
+
+        for i, name in enumerate(names):
+            tokens = tokenize(name)
+            self._first_tokens.append(tokens[0] if tokens else "")
+            for token in tokens:
+                postings.setdefault(token, set()).add(i)
+
+        self._vocabulary = sorted(postings)
+        self._postings = [postings[token] for token in self._vocabulary]
+        self._trigrams = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def _prefix_range(self, prefix: str) -> range:
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_left(self._vocabulary, prefix + "\uffff", start)
+        return range(start, end)
+
+    def _trigram_index(self) -> dict[str, list[int]]:
+        """
+        Índice de trigramas del vocabulario, construido la primera vez que se necesita una búsqueda aproximada
+        """
+
+        if self._trigrams is None:
+            index = {}
+            sizes = []
+            for position, token in enumerate(self._vocabulary):
+                token_trigrams = trigrams(token)
+                sizes.append(len(token_trigrams))
+                for trigram in token_trigrams:
+                    index.setdefault(trigram, []).append(position)
+            self._trigram_sizes = sizes
+            self._trigrams = index
+        return self._trigrams
+
+    def _infix_tokens(self, token: str) -> list[int]:
+        """
+        Posiciones del vocabulario cuyas palabras contienen `token` en cualquier parte. Con tres letras o más solo
+        se comprueban las palabras que tienen todos sus trigramas
+        """
+
+        inner = [token[i:i + 3] for i in range(len(token) - 2)]
+        if not inner:
+            return [position for position, word in enumerate(self._vocabulary) if token in word]
+
+        index = self._trigram_index()
+        candidates = None
+        for trigram in sorted(inner, key=lambda trigram: len(index.get(trigram, ()))):
+            positions = index.get(trigram, ())
+            candidates = set(positions) if candidates is None else candidates.intersection(positions)
+            if not candidates:
+                return []
+        return [position for position in candidates if token in self._vocabulary[position]]
+
+    def _similar_tokens(self, token: str, threshold: float) -> dict[int, float]:
+        """
+        Posiciones del vocabulario cuyas palabras se parecen a `token` (similitud de Jaccard entre trigramas)
+        """
+
+        query_trigrams = trigrams(token)
+        index = self._trigram_index()
+        shared = {}
+        for trigram in query_trigrams:
+            for position in index.get(trigram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        similar = {}
+        for position, count in shared.items():
+            union = len(query_trigrams) + self._trigram_sizes[position] - count
+            similarity = count / union
+            if similarity >= threshold:
+                similar[position] = similarity
+        return similar
+
+    def _match(self, tokens: list[str], fuzzy_threshold: float = None, infix: bool = False) -> dict[int, float]:
+        """
+        Elementos que contienen todas las palabras de la consulta, con su puntuación. Una palabra exacta puntúa 2,
+        un prefijo 1, una palabra que la contiene (`infix`) 0.5 y una aproximada su similitud
+        """
+
+        scores = None
+        for token in tokens:
+            token_scores = {}
+            if infix:
+                for position in self._infix_tokens(token):
+                    word = self._vocabulary[position]
+                    score = 2 if word == token else 1 if word.startswith(token) else 0.5
+                    for i in self._postings[position]:
+                        if token_scores.get(i, 0) < score:
+                            token_scores[i] = score
+            elif fuzzy_threshold is None:
+                for position in self._prefix_range(token):
+                    score = 2 if self._vocabulary[position] == token else 1
+                    for i in self._postings[position]:
+                        if token_scores.get(i, 0) < score:
+                            token_scores[i] = score
+            else:
+                for position, similarity in self._similar_tokens(token, fuzzy_threshold).items():
+                    for i in self._postings[position]:
+                        if token_scores.get(i, 0) < similarity:
+                            token_scores[i] = similarity
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {i: score + token_scores[i] for i, score in scores.items() if i in token_scores}
+            if not scores:
+                break
+
+        return scores or {}
+
+    def search(self, query: str, limit: int = None, fuzzy: bool = True, fuzzy_threshold: float = 0.4, weighted: bool = True) -> list:
+        """
+        Busca los elementos cuyo nombre contiene palabras que empiezan por cada una de las palabras de la consulta,
+        ordenados por relevancia. Si no hay ninguno, los que tienen palabras que las contienen en cualquier parte.
+        Sin acentos ni mayúsculas. Una consulta vacía devuelve todos los elementos.
+
+        :param query: El texto buscado
+        :param limit: Número máximo de resultados
+        :param fuzzy: Si tampoco hay resultados, buscar palabras parecidas (erratas)
+        :param fuzzy_threshold: Similitud mínima (0 a 1) para la búsqueda aproximada
+        :param weighted: Desempatar por el peso de cada elemento
+        """
+
+        tokens = tokenize(query)
+        if not tokens:
+            return self.items[:limit]
+
+        scores = self._match(tokens)
+        if not scores:
+            scores = self._match(tokens, infix=True)
+        if not scores and fuzzy:
+            scores = self._match(tokens, fuzzy_threshold)
+
+        first_token = tokens[0]
+        weights, lengths, first_tokens = self._weights, self._lengths, self._first_tokens
+
+        def _rank(i):
+            # Mejor puntuación, los que empiezan por la primera palabra, más peso y nombres más cortos
+            return (-scores[i], not first_tokens[i].startswith(first_token), -weights[i] if weighted else 0, lengths[i], i)
+
+        if limit is not None and limit < len(scores):
+            ranked = heapq.nsmallest(limit, scores, key=_rank)
+        else:
+            ranked = sorted(scores, key=_rank)
+        return [self.items[i] for i in ranked]
+
+## ^^^ Classes ^^^ ##
@@ -0,0 +1,416 @@
+"""
+Avisos y comunicaciones del servicio (`/comunicaciones`), sincronizados de forma incremental: cada sincronización
+descarga el índice y solo pide `/comunicaciones/view/{id}.json` de los avisos nuevos o modificados. Los avisos se
+indexan en memoria por línea y por parada, así que consultar los de un panel de salidas no llama a la API.
+
+``` python
+from arriva_api.transport import warning_alerts
+
+warning_alerts.sync_alerts()
+warning_alerts.alerts_for_stop(15004), warning_alerts.alerts_for_line(1234)
+```
+"""
+
+from . import _rest_adapter
+from ._records import first as _first
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Iterable
+
+_logger = logging.getLogger(__name__)
+
+
+## vvv Classes vvv ##
+
+class WarningAlert():
+    """
+    Un aviso o comunicación del servicio
+    """
+
+    __slots__ = ("id", "title", "text", "start", "end", "line_ids", "stop_ids", "raw")
+
+    def __init__(self, id: int, title: str = None, text: str = None, start: datetime = None, end: datetime = None, line_ids: list[int] = None, stop_ids: list[int] = None, raw: dict = None):
+        self.id = id
+        """
+        Id del aviso
+        """
+
+        self.title = title
+        """
+        Título
+        """
+
+        self.text = text
+        """
+        Texto completo
+        """
+
+        self.start = start
+        """
+        Desde cuándo está vigente, None si no se indica
+        """
+
+        self.end = end
+        """
+        Hasta cuándo está vigente, None si no se indica
+        """
+
+        self.line_ids = line_ids or []
+        """
+        Ids de las líneas afectadas. Vacío si es un aviso general
+        """
+
+        self.stop_ids = stop_ids or []
+        """
+        Ids de las paradas afectadas
+        """
+
+        self.raw = raw
+        """
+        El registro tal y como lo devuelve la API
+        """
+
+    def is_active(self, when: datetime = None) -> bool:
+        """
+        Indica si el aviso está vigente en un momento (por defecto, ahora)
+        """
+
+        when = when or datetime.now()
+        return (self.start is None or self.start <= when) and (self.end is None or when <= self.end)
+
+    def __repr__(self):
+        return self.title or f"Aviso {self.id}"
+
+
+class AlertDelta():
+    """
+    Lo que cambió en una sincronización
+    """
+
+    __slots__ = ("added", "updated", "removed", "failed")
+
+    def __init__(self, added: list[WarningAlert], updated: list[WarningAlert], removed: list[WarningAlert], failed: list[int] = None):
+        self.added = added
+        self.updated = updated
+        self.removed = removed
+        self.failed = failed or []
+        """
+        Ids de los avisos nuevos o modificados que no se pudieron descargar. Se vuelven a pedir en la siguiente
+        sincronización
+        """
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.removed)
+
+    def __repr__(self):
+        return f"+{len(self.added)} ~{len(self.updated)} -{len(self.removed)}"
+
+
+class AlertStore():
+    """
+    Los avisos en memoria con índices por línea y por parada (ver el módulo). Thread-safe
+
+    :param max_workers: Máximo de avisos pedidos a la vez en una sincronización
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.synced_at = None
+        """
+        `time.monotonic()` de la última sincronización, None si no se ha sincronizado
+        """
+
+        self._alerts = {}
+        self._versions = {}
+        self._by_line = {}
+        self._by_stop = {}
+        self._general = set()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alerts)
+
+    def get(self, alert_id: int) -> WarningAlert:
+        """
+        Un aviso por su id, o None
+        """
+
+        with self._lock:
+            return self._alerts.get(alert_id)
+
+    def alerts(self, when: datetime = None) -> list[WarningAlert]:
+        """
+        Todos los avisos vigentes
+        """
+
+        with self._lock:
+            alerts = list(self._alerts.values())
+        return [alert for alert in alerts if alert.is_active(when)]
+
+    def _index(self, alert: WarningAlert):
+        for line_id in alert.line_ids:
+            self._by_line.setdefault(line_id, set()).add(alert.id)
+        for stop_id in alert.stop_ids:
+            self._by_stop.setdefault(stop_id, set()).add(alert.id)
+        if not alert.line_ids and not alert.stop_ids:
+            self._general.add(alert.id)
+
+    def _unindex(self, alert: WarningAlert):
+        for index, keys in ((self._by_line, alert.line_ids), (self._by_stop, alert.stop_ids)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(alert.id)
+                    if not ids:
+                        del index[key]
+        self._general.discard(alert.id)
+
+    def put(self, alert: WarningAlert, version: str = None) -> WarningAlert:
+        """
+        Guarda (o sustituye) un aviso y lo indexa. Devuelve el que había con ese id, o None
+        """
+
+        with self._lock:
+            old = self._alerts.get(alert.id)
+            if old is not None:
+                self._unindex(old)
+            self._alerts[alert.id] = alert
+            self._versions[alert.id] = version
+            self._index(alert)
+            return old
+
+    def remove(self, alert_id: int) -> WarningAlert:
+        """
+        Quita un aviso. Devuelve el quitado, o None
+        """
+
+        with self._lock:
+            old = self._alerts.pop(alert_id, None)
+            self._versions.pop(alert_id, None)
+            if old is not None:
+                self._unindex(old)
+            return old
+
+    def sync(self, revalidate: bool = False) -> AlertDelta:
+        """
+        Descarga el índice de avisos y pide solo los nuevos o modificados (en paralelo). Los que ya no están en el
+        índice se quitan. Si falla la descarga de un aviso se deja como estaba (ver `AlertDelta.failed`) y se aplica
+        el resto. Las sincronizaciones simultáneas se hacen de una en una
+
+        :param revalidate: Preguntar a la API por el índice aunque la caché en disco del adaptador lo tenga sin caducar.
+            Los avisos modificados siempre se le preguntan, porque la caché puede tener la versión anterior
+        """
+
+        with self._sync_lock:
+            records = _index_records(_rest_adapter.get("/comunicaciones/index.json", shared=False, revalidate=revalidate))
+            versions = {int(record["id"]): _version(record) for record in records if record.get("id") is not None}
+            with self._lock:
+                changed = [alert_id for alert_id, version in versions.items()
+                           if alert_id not in self._alerts or self._versions.get(alert_id) != version]
+                revalidates = [revalidate or alert_id in self._alerts for alert_id in changed]
+                gone = [alert_id for alert_id in self._alerts if alert_id not in versions]
+
+            fetched = []
+            if changed:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(changed))) as executor:
+                    fetched = list(executor.map(_try_get_alert, changed, revalidates))
+
+            added, updated, failed = [], [], []
+            for alert_id, alert in zip(changed, fetched):
+                if alert is None:
+                    failed.append(alert_id)
+                    continue
+                old = self.put(alert, versions[alert_id])
+                (added if old is None else updated).append(alert)
+            removed = [alert for alert in map(self.remove, gone) if alert is not None]
+            if failed:
+                _logger.warning("Couldn't download alerts %s, they'll be retried on the next sync", failed)
+
+            self.synced_at = time.monotonic()
+            return AlertDelta(added, updated, removed, failed)
+
+    def sync_if_stale(self, max_age: float = 300) -> AlertDelta:
+        """
+        Sincroniza solo si la última sincronización tiene más de `max_age` segundos. None si no hizo falta
+        """
+
+        if self.synced_at is not None and time.monotonic() - self.synced_at < max_age:
+            return None
+        return self.sync()
+
+    def _lookup(self, index: dict, key: int, when: datetime, include_general: bool) -> list[WarningAlert]:
+        with self._lock:
+            alerts = self._alerts
+            result = [alerts[alert_id] for alert_id in index.get(key, ())]
+            if include_general:
+                result += [alerts[alert_id] for alert_id in self._general]
+        return [alert for alert in result if alert.is_active(when)]
+
+    def for_line(self, line_id: int, when: datetime = None, include_general: bool = False) -> list[WarningAlert]:
+        """
+        Los avisos vigentes de una línea
+
+        :param include_general: Incluir los avisos que no son de ninguna línea ni parada
+        """
+
+        return self._lookup(self._by_line, line_id, when, include_general)
+
+    def for_stop(self, stop_id: int, when: datetime = None, include_general: bool = False) -> list[WarningAlert]:
+        """
+        Los avisos vigentes de una parada
+
+        :param include_general: Incluir los avisos que no son de ninguna línea ni parada
+        """
+
+        return self._lookup(self._by_stop, stop_id, when, include_general)
+
+    def for_board(self, stop_id: int, line_ids: Iterable[int] = (), when: datetime = None, include_general: bool = True) -> list[WarningAlert]:
+        """
+        Los avisos vigentes para un panel de salidas: los de la parada, los de sus líneas y (por defecto) los generales,
+        sin repetir
+        """
+
+        alerts = {alert.id: alert for alert in self.for_stop(stop_id, when, include_general)}
+        for line_id in line_ids:
+            alerts.update((alert.id, alert) for alert in self.for_line(line_id, when))
+        return list(alerts.values())
+
+## ^^^ Classes ^^^ ##
+
+
+store = AlertStore()
+"""
+Avisos compartidos por `sync_alerts`, `alerts_for_line` y `alerts_for_stop`
+"""
+
+
+## vvv Methods vvv ##
+
+def _index_records(data) -> list[dict]:
+    if isinstance(data, list):
+        return data
+    for key in ("comunicaciones", "comunicacion", "data"):
+        if isinstance(data.get(key), list):
+            return data[key]
+    return []
+
+
+def _version(record: dict) -> str:
+    """
+    La versión de un registro del índice: su fecha de modificación si la tiene, si no una huella del registro entero
+    """
+
+    modified = _first(record, "modified", "updated", "fecha_modificacion")
+    if modified is not None:
+        return str(modified)
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _parse_datetime(value) -> datetime:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo is not None else parsed
+
+
+def _ids(data: dict, list_keys: tuple, id_keys: tuple) -> list[int]:
+    """
+    Los ids de las líneas o paradas de un aviso, vengan como lista (de ids o de registros) o como un único id
+    """
+
+    ids = []
+    for key in list_keys:
+        for value in data.get(key) or []:
+            value = value.get("id") if isinstance(value, dict) else value
+            if value is not None:
+                ids.append(int(value))
+    value = _first(data, *id_keys)
+    if value is not None:
+        ids.append(int(value))
+    return list(dict.fromkeys(ids))
+
+
+def _parse_alert(data: dict) -> WarningAlert:
+    """
+    Construye un aviso con los datos de `/comunicaciones/view/{id}.json`
+    """
+
+    data = data.get("comunicacion", data)
+    return WarningAlert(id=int(data["id"]),
+                        title=_first(data, "titulo", "title", "asunto"),
+                        text=_first(data, "texto", "contenido", "descripcion", "body"),
+                        start=_parse_datetime(_first(data, "fecha_inicio", "inicio", "desde")),
+                        end=_parse_datetime(_first(data, "fecha_fin", "fin", "hasta")),
+                        line_ids=_ids(data, ("lineas",), ("linea_id",)),
+                        stop_ids=_ids(data, ("paradas", "superparadas"), ("parada_id", "superparada_id")),
+                        raw=data)
+
+
+def get_alerts() -> list[WarningAlert]:
+    """
+    Descarga todos los avisos del índice tal y como vienen en él, sin pedirlos uno a uno
+    """
+
+    return [_parse_alert(record) for record in _index_records(_rest_adapter.get("/comunicaciones/index.json"))]
+
+
+def get_alert(alert_id: int, revalidate: bool = False) -> WarningAlert:
+    """
+    Descarga un aviso completo
+
+    :param revalidate: Preguntar a la API aunque la caché en disco del adaptador lo tenga sin caducar
+    """
+
+    return _parse_alert(_rest_adapter.get(f"/comunicaciones/view/{alert_id}.json", shared=False, revalidate=revalidate))
+
+
+def _try_get_alert(alert_id: int, revalidate: bool = False) -> WarningAlert:
+    """
+    Como `get_alert`, pero devuelve None si la petición falla o la respuesta no es un aviso
+    """
+
+    from ..rest_adapter import REQUEST_ERRORS
+
+    try:
+        return get_alert(alert_id, revalidate)
+    except REQUEST_ERRORS + (LookupError, TypeError, ValueError):
+        return None
+
+
+def sync_alerts() -> AlertDelta:
+    """
+    Sincroniza los avisos compartidos (ver `AlertStore.sync`)
+    """
+
+    return store.sync()
+
+
+def alerts_for_line(line_id: int, when: datetime = None) -> list[WarningAlert]:
+    """
+    Los avisos vigentes de una línea, sincronizando primero si hace más de 5 minutos de la última vez
+    """
+
+    store.sync_if_stale()
+    return store.for_line(line_id, when)
+
+
+def alerts_for_stop(stop_id: int, when: datetime = None) -> list[WarningAlert]:
+    """
+    Los avisos vigentes de una parada, sincronizando primero si hace más de 5 minutos de la última vez
+    """
+
+    store.sync_if_stale()
+    return store.for_stop(stop_id, when)
+
+## ^^^ Methods ^^^ ##
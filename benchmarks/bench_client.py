@@ -0,0 +1,203 @@
+"""
+Benchmarks del cliente contra `fake_server.FakeArrivaServer`: operaciones por segundo, latencia p50/p99 y memoria
+máxima (tracemalloc) de cada operación. Los resultados se pueden guardar en JSON (con el commit) y comparar con los
+de otro commit:
+
+``` bash
+python benchmarks/bench_client.py --json antes.json
+git checkout otra-rama
+python benchmarks/bench_client.py --compare antes.json
+python benchmarks/bench_client.py --only search_stops get_rate --latency 0.02 --jitter 0.01 --error-rate 0.01
+```
+
+El servidor usa las respuestas grabadas con `record_fixtures.py` (en `benchmarks/fixtures` o `--fixtures`) y solo
+genera las que falten, que se listan al final.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_server import FakeArrivaServer, Fixtures, default_directory
+
+import arriva_api.transport as transport
+from arriva_api.transport import fleet, lines, rates, stops
+
+_QUERIES = ["coruña", "santiago", "praza lugo", "hospital", "estacion ourense", "rua ferrol", "colexio", "porto sada"]
+
+
+## vvv Benchmarks vvv ##
+# Cada benchmark recibe las fixtures y un `random.Random` y devuelve la operación a medir (sin argumentos). Lo que
+# hace antes de devolverla es preparación y no se mide
+
+def bench_search_stops(fixtures: Fixtures, rng: random.Random):
+    stops.catalog.get()
+    return lambda: stops.search_stops(rng.choice(_QUERIES), num_results=20)
+
+
+def bench_search_stops_cold(fixtures: Fixtures, rng: random.Random):
+    def op():
+        stops.catalog.invalidate()
+        return stops.search_stops(rng.choice(_QUERIES), num_results=20)
+    return op
+
+
+def bench_location_search_stops(fixtures: Fixtures, rng: random.Random):
+    stops.catalog.get()
+    return lambda: stops.location_search_stops(lat=42 + rng.random() * 1.8, long=-9.2 + rng.random() * 2, radius=5)
+
+
+def bench_get_rate(fixtures: Fixtures, rng: random.Random):
+    ids = [stop["parada"] for stop in fixtures.stops]
+    return lambda: rates.get_rate(rng.choice(ids), rng.choice(ids), use_cache=False)
+
+
+def bench_get_rates_batch(fixtures: Fixtures, rng: random.Random):
+    ids = [stop["parada"] for stop in fixtures.stops]
+    def op():
+        rates.clear_rate_cache()
+        return rates.get_rates([(rng.choice(ids), rng.choice(ids)) for _ in range(50)])
+    return op
+
+
+def bench_get_all_lines(fixtures: Fixtures, rng: random.Random):
+    return lines.get_all_lines
+
+
+def bench_get_network(fixtures: Fixtures, rng: random.Random):
+    return lambda: lines.get_network(refresh=True)
+
+
+def bench_fleet_poll(fixtures: Fixtures, rng: random.Random):
+    tracker = fleet.FleetTracker()
+    tracker.poll()
+    return tracker.poll
+
+
+BENCHMARKS = {name[len("bench_"):]: function for name, function in list(globals().items()) if name.startswith("bench_")}
+
+## ^^^ Benchmarks ^^^ ##
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))]
+
+
+def run(name: str, fixtures: Fixtures, iterations: int, min_time: float, memory_iterations: int, seed: int) -> dict:
+    """
+    Mide un benchmark: al menos `iterations` operaciones y `min_time` segundos, y aparte la memoria máxima de
+    `memory_iterations` operaciones
+    """
+
+    rng = random.Random(seed)
+    transport._rest_adapter.clear_memo()
+    op = BENCHMARKS[name](fixtures, rng)
+    op()  # Calentamiento (conexiones, caché del catálogo...)
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    while len(latencies) < iterations or time.perf_counter() - start < min_time:
+        op_start = time.perf_counter()
+        try:
+            op()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - op_start)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            try:
+                op()
+            except Exception:
+                pass
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"ops": len(latencies),
+            "errors": errors,
+            "ops_per_sec": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": _percentile(latencies, 99) * 1000,
+            "peak_memory_kb": peak / 1024}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del cliente contra un servidor local")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks a ejecutar (por defecto todos)")
+    parser.add_argument("--iterations", type=int, default=50, help="operaciones mínimas por benchmark")
+    parser.add_argument("--min-time", type=float, default=1, help="segundos mínimos por benchmark")
+    parser.add_argument("--memory-iterations", type=int, default=3, help="operaciones para medir la memoria")
+    parser.add_argument("--latency", type=float, default=0, help="latencia del servidor en segundos")
+    parser.add_argument("--jitter", type=float, default=0, help="jitter del servidor en segundos")
+    parser.add_argument("--error-rate", type=float, default=0, help="probabilidad de 503 del servidor")
+    parser.add_argument("--fixtures", default=default_directory(), help="directorio con respuestas grabadas (por defecto benchmarks/fixtures, si existe)")
+    parser.add_argument("--no-generate", action="store_true", help="fallar en lugar de generar las respuestas que no estén grabadas")
+    parser.add_argument("--stops", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--keep-rate-limit", action="store_true", help="no desactivar el límite de peticiones del adaptador")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    parser.add_argument("--compare", help="resultados JSON de otro commit con los que comparar")
+    args = parser.parse_args()
+
+    fixtures = Fixtures(stops=args.stops, lines=args.lines, seed=args.seed, directory=args.fixtures, generate=not args.no_generate)
+    adapter = transport._rest_adapter
+    if not args.keep_rate_limit:
+        adapter.rate_limiter = None
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    with FakeArrivaServer(fixtures, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed) as server:
+        adapter.url = server.url
+        print(f"{'benchmark':<24} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10} {'errors':>7}" + ("   vs baseline" if baseline else ""))
+        for name in args.only or BENCHMARKS:
+            result = results[name] = run(name, fixtures, args.iterations, args.min_time, args.memory_iterations, args.seed)
+            line = (f"{name:<24} {result['ops_per_sec']:10.1f} {result['p50_ms']:9.3f} {result['p99_ms']:9.3f} "
+                    f"{result['peak_memory_kb']:10.0f} {result['errors']:7d}")
+            if baseline and name in baseline:
+                line += f"   x{result['ops_per_sec'] / baseline[name]['ops_per_sec']:.2f} ops/s"
+            print(line)
+
+    if fixtures.generated:
+        print(f"Generated (not recorded) responses for {len(fixtures.generated)} paths, e.g. {sorted(fixtures.generated)[:3]}. "
+              f"Record real ones with benchmarks/record_fixtures.py")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": _commit(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "settings": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+                       "generated": sorted(fixtures.generated),
+                       "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""
+Servidor HTTP local que sustituye a arriva.gal en los benchmarks, con latencia, jitter y errores 503 configurables.
+Soporta keep-alive y `If-None-Match`.
+
+``` bash
+python benchmarks/fake_server.py --port 8000 --latency 0.05 --jitter 0.02 --error-rate 0.01
+```
+
+Sirve respuestas reales grabadas con `record_fixtures.py` en un directorio (por defecto `benchmarks/fixtures`, si
+existe), con la misma ruta que el endpoint, por ejemplo `fixtures/superparadas/index/buscador.json` o
+`fixtures/buscador/precio/15004/15018.json`. Las paradas, líneas y expediciones grabadas se usan también para las
+rutas con parámetros que no estén grabadas.
+
+Solo como último recurso, lo que no esté grabado se genera de forma determinista. Los datos generados tienen la forma
+que el cliente espera (salen de las mismas claves que lee), así que no sirven para comprobar que la interpreta bien:
+`Fixtures.generated` dice qué rutas se generaron y con `generate=False` (`--no-generate`) se responde 404.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+PREFIX = "/plataforma/api/"
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+"""
+Directorio de las respuestas grabadas con `record_fixtures.py`
+"""
+
+_NAMES = ["A Coruña", "Santiago de Compostela", "Lugo", "Ourense", "Ferrol", "Arteixo", "Betanzos", "Carballo",
+          "Narón", "Oleiros", "Culleredo", "Cambre", "Sada", "Ordes", "Bergondo", "Abegondo", "Laracha", "Malpica"]
+_PLACES = ["Praza", "Rúa", "Avenida", "Estación", "Hospital", "Igrexa", "Cruce", "Polígono", "Colexio", "Porto"]
+
+
+def _unwrap(data):
+    return data.get("results", data) if isinstance(data, dict) else data
+
+
+def stop_records(data) -> list[dict]:
+    """
+    Los registros de parada de una respuesta de `/superparadas/index/buscador.json`
+    """
+
+    data = _unwrap(data)
+    return data["paradas"] if isinstance(data, dict) else data
+
+
+class Fixtures():
+    """
+    Las respuestas del servidor (ver el módulo). Las grabadas en `directory` tienen prioridad; las demás se generan,
+    las estáticas una vez (con `seed`) y las de las rutas con parámetros al pedirlas, a partir de las paradas y
+    líneas grabadas si las hay
+
+    :param stops: Número de paradas del catálogo generado
+    :param lines: Número de líneas de la red generada
+    :param expeditions_per_line: Expediciones de cada línea generada
+    :param stops_per_expedition: Paradas de cada expedición generada
+    :param buses: Buses en `getGeolocs`
+    :param directory: Directorio con respuestas grabadas
+    :param generate: Generar las respuestas que no estén grabadas. Si no, se responde 404
+    """
+
+    def __init__(self, stops: int = 5000, lines: int = 200, expeditions_per_line: int = 20, stops_per_expedition: int = 15, buses: int = 300, seed: int = 0, directory: str = None, generate: bool = True):
+        self.directory = directory
+        self.generate = generate
+        self.generated = set()
+        """
+        Las rutas que se han respondido con datos generados
+        """
+
+        self.buses = buses
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tick = 0
+
+        rng = self._random
+        self.stops = [{"parada": 10000 + i,
+                       "nombre": f"{rng.choice(_PLACES)} {rng.choice(_NAMES)} {i}",
+                       "nom_web": f"{rng.choice(_PLACES)} ({rng.choice(_NAMES)})",
+                       "peso": rng.randint(0, 100),
+                       "lat": round(42.0 + rng.random() * 1.8, 6),
+                       "lon": round(-9.2 + rng.random() * 2.0, 6)} for i in range(stops)]
+
+        results = []
+        expedition_id = 1
+        for line_id in range(1, lines + 1):
+            route = rng.sample(self.stops, min(stops_per_expedition, len(self.stops)))
+            expeditions = []
+            for n in range(expeditions_per_line):
+                minutes = 6 * 60 + n * (16 * 60 // max(1, expeditions_per_line))
+                stop_times = []
+                for order, stop in enumerate(route):
+                    stop_times.append({"orden": order, "parada_id": stop["parada"], "hora": f"{minutes // 60:02d}:{minutes % 60:02d}:00"})
+                    minutes += rng.randint(1, 6)
+                expeditions.append({"id": expedition_id,
+                                    "frecuencias_semanales": {day: n % 3 != 0 or day not in ("sabado", "domingo")
+                                                              for day in ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")},
+                                    "temporadas_anuales": [],
+                                    "parada_expediciones": stop_times})
+                expedition_id += 1
+            results.append({"linea": {"id": line_id, "mom_linea": f"{route[0]['nombre']} - {route[-1]['nombre']}"},
+                            "expediciones": expeditions})
+
+        self._static = {
+            "superparadas/index/buscador.json": json.dumps({"paradas": self.stops}).encode(),
+            "superparadas/index.json": json.dumps({"paradas": self.stops}).encode(),
+            "lineas/index.json": json.dumps({"results": results}).encode(),
+        }
+        # Las rutas con parámetros se generan con las paradas y líneas grabadas, si las hay
+        recorded = self._recorded("superparadas/index/buscador.json")
+        if recorded is not None:
+            self.stops = stop_records(json.loads(recorded))
+        recorded = self._recorded("lineas/index.json")
+        if recorded is not None:
+            results = _unwrap(json.loads(recorded))
+
+        self._stop_index = {int(stop["parada"]): stop for stop in self.stops}
+        self._lines = {int(el["linea"]["id"]): el for el in results}
+        self._expeditions = {int(expedition["id"]): expedition for el in results
+                             for expedition in el.get("expediciones") or el["linea"].get("expediciones") or []}
+        located = [stop for stop in self.stops if stop.get("lat") not in (None, "") and stop.get("lon") not in (None, "")]
+        line_ids = list(self._lines) or [None]
+        self._bus_positions = {f"{1000 + i}": [float(rng.choice(located)["lat"]), float(rng.choice(located)["lon"]), rng.choice(line_ids)]
+                               for i in range(buses if located else 0)}
+
+    def _geolocs(self) -> list[dict]:
+        # Cada consulta mueve un tercio de los buses
+        with self._lock:
+            self._tick += 1
+            for i, (bus, position) in enumerate(self._bus_positions.items()):
+                if (i + self._tick) % 3 == 0:
+                    position[0] += self._random.uniform(-0.002, 0.002)
+                    position[1] += self._random.uniform(-0.002, 0.002)
+            return [{"bus": bus, "lat": round(lat, 6), "lon": round(long, 6), "linea_id": line_id, "fecha": int(time.time())}
+                    for bus, (lat, long, line_id) in self._bus_positions.items()]
+
+    def _recorded(self, path: str) -> bytes:
+        """
+        La respuesta grabada para una ruta, o None
+        """
+
+        if self.directory is None:
+            return None
+        file_path = os.path.join(self.directory, *path.split("/"))
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def get(self, path: str) -> bytes:
+        """
+        La respuesta para una ruta relativa a la API (sin parámetros), o None si no existe
+        """
+
+        body = self._recorded(path)
+        if body is not None or not self.generate:
+            return body
+        body = self._generate(path)
+        if body is not None:
+            with self._lock:
+                self.generated.add(path)
+        return body
+
+    def _generate(self, path: str) -> bytes:
+        if path in self._static:
+            return self._static[path]
+
+        match = re.fullmatch(r"buscador/precio/(\d+)/(\d+)\.json", path)
+        if match:
+            distance = abs(int(match[1]) - int(match[2])) % 97
+            effective = round(1 + distance * 0.05, 2)
+            return json.dumps({"effective": effective, "credit_card": round(effective * 0.7, 2), "special_rates": []}).encode()
+
+        match = re.fullmatch(r"superparadas/expediciones-fecha/(\d+)\.json", path)
+        if match:
+            stop = self._stop_index.get(int(match[1]))
+            if stop is None:
+                return None
+            return json.dumps({"paradas": [{"nom_parada": stop["nombre"], "lat": stop.get("lat"), "lon": stop.get("lon")}]}).encode()
+
+        match = re.fullmatch(r"lineas/view/(\d+)\.json", path)
+        if match and int(match[1]) in self._lines:
+            el = self._lines[int(match[1])]
+            return json.dumps({"linea": {**el["linea"], "expediciones": el["expediciones"]}}).encode()
+
+        match = re.fullmatch(r"expediciones/view/(\d+)\.json", path)
+        if match and int(match[1]) in self._expeditions:
+            return json.dumps({"expedicion": self._expeditions[int(match[1])]}).encode()
+
+        if path == "buses/getGeolocs.json":
+            return json.dumps({"buses": self._geolocs()}).encode()
+
+        match = re.fullmatch(r"buses/getGeoloc/(\w+)\.json", path)
+        if match and match[1] in self._bus_positions:
+            lat, long, line_id = self._bus_positions[match[1]]
+            return json.dumps({"bus": match[1], "lat": lat, "lon": long, "linea_id": line_id}).encode()
+
+        return None
+
+
+class FakeArrivaServer():
+    """
+    El servidor, en un hilo en segundo plano. Se usa como context manager; `url` es la base para `RestAdapter`
+
+    :param latency: Segundos de espera antes de cada respuesta
+    :param jitter: Segundos extra aleatorios (uniforme entre 0 y `jitter`)
+    :param error_rate: Probabilidad de responder 503
+    :param token: Si se indica, se responde 401 a las peticiones sin `Authorization: Bearer {token}`
+    """
+
+    def __init__(self, fixtures: Fixtures = None, host: str = "127.0.0.1", port: int = 0, latency: float = 0, jitter: float = 0, error_rate: float = 0, seed: int = 0, token: str = None):
+        self.fixtures = fixtures or Fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token = token
+        self.requests = 0
+        self.connections = 0
+        """
+        Conexiones abiertas por los clientes (con keep-alive, cada una atiende varias peticiones)
+        """
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        """
+        Máximo de peticiones atendidas a la vez
+        """
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{PREFIX}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _reply(self, status: int, body: bytes = b"", headers: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self._get()
+                except ConnectionError:
+                    self.close_connection = True  # El cliente se fue antes de la respuesta (p. ej. por su timeout)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _get(self):
+                delay = server.latency + (server._random.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if server.error_rate and server._random.random() < server.error_rate:
+                    return self._reply(503, b'{"error": "injected"}', {"Retry-After": "0"})
+                if server.token is not None and self.headers.get("Authorization") != f"Bearer {server.token}":
+                    return self._reply(401, b'{"error": "unauthorized"}')
+
+                path = re.sub("/+", "/", self.path.split("?", 1)[0])
+                if not path.startswith(PREFIX):
+                    return self._reply(404, b"{}")
+                body = server.fixtures.get(path[len(PREFIX):])
+                if body is None:
+                    return self._reply(404, b"{}")
+
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._reply(304, headers={"ETag": etag})
+                self._reply(200, body, {"ETag": etag})
+
+        return Handler
+
+    def start(self) -> "FakeArrivaServer":
+        # Un sondeo corto para que `stop` no espere medio segundo
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), name="fake-arriva", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def default_directory() -> str:
+    """
+    `DEFAULT_DIRECTORY` si existe (se han grabado respuestas), si no None
+    """
+
+    return DEFAULT_DIRECTORY if os.path.isdir(DEFAULT_DIRECTORY) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Arriva")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0, help="segundos de espera por respuesta")
+    parser.add_argument("--jitter", type=float, default=0, help="segundos extra aleatorios por respuesta")
+    parser.add_argument("--error-rate", type=float, default=0, help="probabilidad de responder 503")
+    parser.add_argument("--fixtures", default=default_directory(), help="directorio con respuestas grabadas (por defecto benchmarks/fixtures, si existe)")
+    parser.add_argument("--no-generate", action="store_true", help="responder 404 a lo que no esté grabado en lugar de generarlo")
+    parser.add_argument("--stops", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixtures = Fixtures(stops=args.stops, lines=args.lines, seed=args.seed, directory=args.fixtures, generate=not args.no_generate)
+    server = FakeArrivaServer(fixtures, args.host, args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    print(f"Serving on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Tiempo de importación de arriva_api, medido en procesos nuevos (en frío para el intérprete, con los .pyc ya
+generados). Falla si un import supera su presupuesto o carga módulos pesados que deberían cargarse solo al usarlos:
+
+``` bash
+python benchmarks/import_time.py
+python benchmarks/import_time.py --runs 20 --budget-ms 50
+```
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    # import: módulos que no debe cargar
+    "arriva_api": ["requests", "aiohttp", "numpy", "arriva_api.transport", "arriva_api.rest_adapter"],
+    "arriva_api.transport": ["requests", "aiohttp", "numpy", "arriva_api.transport.stops", "arriva_api.rest_adapter"],
+    "arriva_api.exceptions": ["requests", "aiohttp", "numpy"],
+    "arriva_api.transport.text_search": ["requests", "aiohttp", "numpy"],
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(target: str, runs: int) -> tuple[float, set[str]]:
+    """
+    La mediana en ms de importar `target` en `runs` procesos nuevos y los módulos cargados
+    """
+
+    times = []
+    modules = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(target=target)], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        times.append(result["ms"])
+        modules = set(result["modules"])
+    return statistics.median(times), modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="procesos por import (se toma la mediana)")
+    parser.add_argument("--budget-ms", type=float, default=30, help="tiempo máximo de cada import")
+    args = parser.parse_args()
+
+    failed = False
+    for target, forbidden in TARGETS.items():
+        ms, modules = measure(target, args.runs)
+        loaded = [module for module in forbidden if module in modules]
+        ok = ms <= args.budget_ms and not loaded
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} import {target:<35} {ms:7.2f} ms" + (f"  loads {', '.join(loaded)}" if loaded else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
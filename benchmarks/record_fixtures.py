@@ -0,0 +1,78 @@
+"""
+Graba respuestas reales de la API de Arriva en un directorio de fixtures para `fake_server`, con la misma ruta que
+el endpoint. Con ellas los benchmarks y el servidor local usan la forma real de las respuestas en lugar de la
+generada (que se deduce de las mismas claves que lee el cliente y no puede detectar que se hayan cambiado).
+
+``` bash
+python benchmarks/record_fixtures.py                # benchmarks/fixtures
+python benchmarks/record_fixtures.py --rates 50 --stops 20 --buses 10
+```
+
+`/lineas/index.json` se graba con las asociaciones de `lines.NETWORK_ASSOCIATED`, que incluyen todo lo que tiene la
+respuesta sin ellas, porque el servidor local no distingue parámetros.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_server import DEFAULT_DIRECTORY, stop_records
+
+from arriva_api.known_servers import ARRIVA as BASE_URL
+from arriva_api.transport.lines import NETWORK_ASSOCIATED
+
+
+def record(session: requests.Session, directory: str, endpoint: str, params: dict = None) -> bytes:
+    """
+    Descarga un endpoint y guarda el cuerpo tal cual en `directory`. Devuelve el cuerpo
+    """
+
+    response = session.get(BASE_URL + endpoint, params=params, timeout=120)
+    response.raise_for_status()
+    path = os.path.join(directory, *endpoint.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(response.content)
+    print(f"{endpoint}: {len(response.content)} bytes")
+    return response.content
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Graba respuestas reales de la API para el servidor local")
+    parser.add_argument("directory", nargs="?", default=DEFAULT_DIRECTORY, help="directorio de fixtures")
+    parser.add_argument("--rates", type=int, default=20, help="precios entre paradas al azar a grabar")
+    parser.add_argument("--stops", type=int, default=20, help="salidas de paradas al azar a grabar")
+    parser.add_argument("--buses", type=int, default=10, help="posiciones de buses a grabar")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with requests.Session() as session:
+        catalog = json.loads(record(session, args.directory, "superparadas/index/buscador.json"))
+        record(session, args.directory, "lineas/index.json", {"associated": NETWORK_ASSOCIATED})
+        buses = json.loads(record(session, args.directory, "buses/getGeolocs.json"))
+
+        ids = [stop["parada"] for stop in stop_records(catalog)]
+        for stop_id in rng.sample(ids, min(args.stops, len(ids))):
+            record(session, args.directory, f"superparadas/expediciones-fecha/{stop_id}.json")
+        for _ in range(args.rates if ids else 0):
+            record(session, args.directory, f"buscador/precio/{rng.choice(ids)}/{rng.choice(ids)}.json")
+
+        if isinstance(buses, dict):
+            buses = buses.get("results", buses)
+            buses = buses.get("buses", buses) if isinstance(buses, dict) else buses
+        bus_ids = [bus.get("bus") for bus in buses if isinstance(bus, dict) and bus.get("bus")] if isinstance(buses, list) else []
+        for bus in bus_ids[:args.buses]:
+            record(session, args.directory, f"buses/getGeoloc/{bus}.json")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
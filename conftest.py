@@ -0,0 +1,3 @@
+"""
+Makes `arriva_api` and `benchmarks` importable when running `pytest` from the repository root
+"""
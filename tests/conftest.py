@@ -0,0 +1,32 @@
+import sys
+
+import pytest
+
+from arriva_api.rest_adapter import RestAdapter
+from benchmarks.fake_server import FakeArrivaServer, Fixtures
+
+
+@pytest.fixture
+def server():
+    """
+    A small local fake of the Arriva API
+    """
+
+    with FakeArrivaServer(Fixtures(stops=50, lines=4, expeditions_per_line=6, stops_per_expedition=8, buses=5)) as server:
+        yield server
+
+
+@pytest.fixture
+def api(server, monkeypatch):
+    """
+    Points every transport module at `server` through a fresh `RestAdapter`, which is returned
+    """
+
+    import arriva_api.transport as transport
+
+    adapter = RestAdapter(server.url)
+    monkeypatch.setitem(transport.__dict__, "_rest_adapter", adapter)
+    for name, module in list(sys.modules.items()):
+        if name.startswith("arriva_api.transport.") and hasattr(module, "_rest_adapter") and name != "arriva_api.transport.aio":
+            monkeypatch.setattr(module, "_rest_adapter", adapter)
+    return adapter
@@ -0,0 +1,77 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from arriva_api.async_rest_adapter import AsyncRestAdapter
+from arriva_api.exceptions import TPGalWSAppException, TPGalWSBadJsonException, TPGalWSBlankResponse
+from arriva_api.transport import aio
+from benchmarks.fake_server import FakeArrivaServer, Fixtures
+
+
+def _run(adapter: AsyncRestAdapter, coro):
+    async def _main():
+        async with adapter:
+            return await coro
+
+    return asyncio.run(_main())
+
+
+def test_results_are_unwrapped(server):
+    adapter = AsyncRestAdapter(server.url)
+    assert isinstance(_run(adapter, adapter.get("/lineas/index.json")), list)
+    assert "results" in _run(adapter, adapter.get("/lineas/index.json", results_only=False))
+
+
+def test_errors_are_mapped_to_the_tpgalws_exceptions(tmp_path):
+    os.makedirs(tmp_path / "buscador" / "precio" / "1")
+    (tmp_path / "buscador" / "precio" / "1" / "2.json").write_bytes(b"not json")
+    (tmp_path / "buscador" / "precio" / "1" / "3.json").write_bytes(b"")
+    with FakeArrivaServer(Fixtures(stops=10, lines=2, buses=3, directory=str(tmp_path), generate=False)) as server:
+        adapter = AsyncRestAdapter(server.url)
+        with pytest.raises(TPGalWSBadJsonException):
+            _run(adapter, adapter.get("/buscador/precio/1/2.json"))
+        with pytest.raises(TPGalWSBlankResponse):
+            _run(adapter, adapter.get("/buscador/precio/1/3.json"))
+        with pytest.raises(TPGalWSAppException):
+            _run(adapter, adapter.get("/buscador/precio/1/4.json"))
+
+
+@pytest.mark.parametrize("coroutine", [False, True])
+def test_401_authenticates_and_retries(coroutine):
+    async def _async_token():
+        return "secret"
+
+    with FakeArrivaServer(Fixtures(stops=10, lines=2, buses=3), token="secret") as server:
+        adapter = AsyncRestAdapter(server.url, authentication_function=_async_token if coroutine else lambda: "secret")
+        assert _run(adapter, adapter.get("/lineas/index.json"))
+        assert adapter.token == "secret"
+        assert server.requests == 2
+
+        with pytest.raises(TPGalWSAppException):
+            unauthenticated = AsyncRestAdapter(server.url)
+            _run(unauthenticated, unauthenticated.get("/lineas/index.json"))
+
+
+def test_concurrency_is_bounded(server):
+    server.latency = 0.05
+    adapter = AsyncRestAdapter(server.url, max_concurrency=3)
+
+    async def _many():
+        return await asyncio.gather(*(adapter.get(f"/buscador/precio/1/{i}.json") for i in range(12)))
+
+    assert len(_run(adapter, _many())) == 12
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_the_module_adapter_survives_several_event_loops(server, monkeypatch):
+    adapter = AsyncRestAdapter(server.url)
+    monkeypatch.setattr(aio, "_rest_adapter", adapter)
+    stop_id = 10000
+
+    first = asyncio.run(aio.get_stop_name(stop_id))
+    session = adapter._session
+    assert asyncio.run(aio.get_stop_name(stop_id)) == first
+    assert adapter._session is not session
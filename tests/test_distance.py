@@ -0,0 +1,34 @@
+import pytest
+
+from arriva_api.transport import distance
+from arriva_api.transport.distance import HAS_NUMPY, distance_matrix, haversine, haversine_many, haversine_pairwise
+
+CORUNA = (43.3623, -8.4115)
+SANTIAGO = (42.8782, -8.5448)
+LUGO = (43.0097, -7.5568)
+
+
+def test_haversine_known_distance():
+    assert haversine(*CORUNA, *SANTIAGO) == pytest.approx(55.0, abs=1)
+    assert haversine(*CORUNA, *CORUNA) == 0
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(not HAS_NUMPY, reason="NumPy not installed"))])
+def test_batched_functions_match_haversine(use_numpy):
+    points = [CORUNA, SANTIAGO, LUGO]
+    lats = [lat for lat, _ in points]
+    longs = [long for _, long in points]
+
+    assert list(haversine_many(*CORUNA, lats, longs, use_numpy=use_numpy)) == \
+        pytest.approx([haversine(*CORUNA, *point) for point in points])
+    assert list(haversine_pairwise(lats, longs, lats[::-1], longs[::-1], use_numpy=use_numpy)) == \
+        pytest.approx([haversine(*a, *b) for a, b in zip(points, points[::-1])])
+
+    matrix = distance_matrix(points[:2], points, use_numpy=use_numpy)
+    assert [list(row) for row in matrix] == [pytest.approx([haversine(*a, *b) for b in points]) for a in points[:2]]
+
+
+def test_forcing_numpy_without_it_raises(monkeypatch):
+    monkeypatch.setattr(distance, "HAS_NUMPY", False)
+    with pytest.raises(ImportError):
+        haversine_many(*CORUNA, [0], [0], use_numpy=True)
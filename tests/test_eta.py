@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from arriva_api.transport import eta
+from arriva_api.transport.eta import EtaService
+from arriva_api.transport.expeditions import Expedition, Timetable
+
+WHEN = datetime(2024, 1, 1, 8, 5)
+
+
+def _service() -> EtaService:
+    return EtaService(Timetable([Expedition(1, 10, [(100, 8 * 60), (200, 8 * 60 + 10), (300, 8 * 60 + 20)]),
+                                 Expedition(2, 10, [(100, 9 * 60), (200, 9 * 60 + 10)])]))
+
+
+def test_observations_shift_the_following_stops():
+    service = _service()
+    arrivals = service.observe(1, 100, WHEN, bus="B1")
+    assert [(arrival.stop_id, arrival.predicted) for arrival in arrivals] == [(200, datetime(2024, 1, 1, 8, 15)), (300, datetime(2024, 1, 1, 8, 25))]
+
+    realtime = service.arrivals(200, after=WHEN, include_scheduled=False)
+    assert [(arrival.bus, arrival.delay) for arrival in realtime] == [("B1", timedelta(minutes=5))]
+    # Observations of earlier stops are ignored
+    assert service.observe(1, 100, WHEN + timedelta(minutes=1)) == []
+    # The scheduled expedition fills in
+    assert [arrival.expedition_id for arrival in service.arrivals(200, after=WHEN, limit=2)] == [1, 2]
+
+
+def test_last_stop_responses_without_a_usable_time_are_skipped():
+    service = _service()
+    assert service.observe_last_stop("B1", {"expedicion_id": 1, "parada_id": 100}) == []
+    assert service.observe_last_stop("B1", {"expedicion_id": 1, "parada_id": 100, "fecha": "ayer"}) == []
+    assert service.observe_last_stop("B1", {"expedicion_id": "x", "parada_id": 100, "fecha": WHEN.isoformat()}) == []
+    assert len(service.observe_last_stop("B1", {"expedicion": {"id": 1}, "parada": "100", "fecha": WHEN.isoformat()})) == 2
+
+
+def test_parse_time():
+    assert eta._parse_time(WHEN.isoformat()) == WHEN
+    assert eta._parse_time(WHEN.timestamp()) == WHEN
+    assert eta._parse_time(WHEN.timestamp() * 1000) == WHEN
+    assert eta._parse_time("08:05").time() == WHEN.time()
+    assert eta._parse_time("soon") is None
+    assert eta._parse_time(None) is None
+    assert eta._parse_time(True) is None
+    assert eta._parse_time(1e300) is None
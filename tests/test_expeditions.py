@@ -0,0 +1,50 @@
+from datetime import date, datetime
+
+from arriva_api.transport import expeditions
+from arriva_api.transport.expeditions import ALL_DAYS, Expedition, Timetable, parse_expedition, parse_minutes
+
+MONDAY = date(2024, 1, 1)
+
+
+def test_weekdays_and_seasons_are_parsed():
+    data = {"id": "7", "frecuencias_semanales": {"lunes": True, "miércoles": "1", "sabado": 0},
+            "temporadas_anuales": [{"fecha_inicio": "2024-12-01", "fecha_fin": "2024-02-28"}, {"inicio": "bad"}],
+            "paradas": []}
+    expedition = parse_expedition(data, line_id=3)
+    assert (expedition.id, expedition.line_id) == (7, 3)
+    assert expedition.weekdays == 0b0000101
+    assert expedition.seasons == [(1201, 228)]
+    assert expedition.runs_on(MONDAY)
+    assert not expedition.runs_on(date(2024, 1, 2))
+    assert not expedition.runs_on(date(2024, 6, 3))
+
+
+def test_missing_or_unknown_frequencies_run_every_day(caplog):
+    assert expeditions._parse_weekdays(None) == ALL_DAYS
+    assert expeditions._parse_weekdays([{"lunes": False, "martes": False}]) == 0
+    assert expeditions._parse_weekdays([{"mon": True}], 9) == ALL_DAYS
+    assert "Expedition 9" in caplog.text
+
+
+def test_parse_minutes():
+    assert parse_minutes("07:05:00") == 425
+    assert parse_minutes("25:10") == 1510
+    assert parse_minutes(None) == -1
+    assert parse_minutes("") == -1
+
+
+def test_next_departures_cross_midnight_and_days():
+    timetable = Timetable([Expedition(1, 10, [(100, 23 * 60 + 50), (200, 24 * 60 + 10)]),
+                           Expedition(2, 10, [(100, 8 * 60), (200, -1)], weekdays=0b0000001),
+                           Expedition(3, 11, [(100, 9 * 60)])])
+
+    departures = timetable.next_departures(100, datetime(2024, 1, 1, 8, 30), n=3)
+    assert [(d.expedition_id, d.time) for d in departures] == [(3, datetime(2024, 1, 1, 9, 0)),
+                                                               (1, datetime(2024, 1, 1, 23, 50)),
+                                                               (3, datetime(2024, 1, 2, 9, 0))]
+
+    # The expedition of the previous day passes after midnight
+    assert [d.time for d in timetable.departures_between(200, datetime(2024, 1, 2, 0, 0), datetime(2024, 1, 2, 1, 0))] == \
+        [datetime(2024, 1, 2, 0, 10)]
+    assert [expedition.id for expedition in timetable.stop_expeditions(100, MONDAY)] == [2, 3, 1]
+    assert [expedition.id for expedition in timetable.stop_expeditions(100, date(2024, 1, 2))] == [3, 1]
@@ -0,0 +1,34 @@
+import json
+import os
+
+import requests
+
+from benchmarks.fake_server import FakeArrivaServer, Fixtures
+
+
+def _write(directory, path: str, data):
+    file_path = os.path.join(directory, *path.split("/"))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        json.dump(data, f)
+
+
+def test_recorded_responses_take_precedence_and_feed_derived_routes(tmp_path):
+    _write(tmp_path, "superparadas/index/buscador.json", {"results": {"paradas": [{"parada": "15004", "nombre": "Real", "lat": "43.1", "lon": "-8.2"}]}})
+    fixtures = Fixtures(stops=10, lines=2, buses=3, directory=str(tmp_path))
+
+    assert json.loads(fixtures.get("superparadas/index/buscador.json"))["results"]["paradas"][0]["nombre"] == "Real"
+    assert json.loads(fixtures.get("superparadas/expediciones-fecha/15004.json"))["paradas"][0]["nom_parada"] == "Real"
+    assert fixtures.get("superparadas/expediciones-fecha/10000.json") is None
+    assert fixtures.generated == {"superparadas/expediciones-fecha/15004.json"}
+
+
+def test_generation_can_be_disabled(tmp_path):
+    _write(tmp_path, "buscador/precio/1/2.json", {"effective": 1.5, "credit_card": 1.0, "special_rates": []})
+    fixtures = Fixtures(stops=10, lines=2, buses=3, directory=str(tmp_path), generate=False)
+
+    with FakeArrivaServer(fixtures) as server:
+        assert requests.get(server.url + "buscador/precio/1/2.json").json()["effective"] == 1.5
+        assert requests.get(server.url + "buscador/precio/1/3.json").status_code == 404
+        assert requests.get(server.url + "lineas/index.json").status_code == 404
+    assert fixtures.generated == set()
@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+
+from arriva_api.transport import fleet
+from arriva_api.transport.fleet import FleetTracker, _parse_bus_position
+
+
+def _position(bus, lat, long, line_id=1):
+    return {"bus": bus, "lat": lat, "lon": long, "linea_id": line_id}
+
+
+def test_records_without_a_bus_id_are_rejected():
+    with pytest.raises(ValueError):
+        _parse_bus_position({"lat": 43.0, "lon": -8.0})
+
+    assert _parse_bus_position({"lat": 43.0, "lon": -8.0}, bus="1001").bus == "1001"
+
+
+def test_get_bus_positions_skips_records_without_id(monkeypatch, caplog):
+    class _Adapter:
+        @staticmethod
+        def get(endpoint, shared=True):
+            return {"buses": [_position("1", 43.0, -8.0), {"lat": 43.1, "lon": -8.1}, {"lat": 43.2, "lon": -8.2},
+                              {"bus": "2"}]}
+
+    monkeypatch.setattr(fleet, "_rest_adapter", _Adapter)
+    with caplog.at_level(logging.WARNING, logger=fleet.__name__):
+        positions = fleet.get_bus_positions()
+
+    assert [position.bus for position in positions] == ["1"]
+    assert "Skipped 2 bus records without an id" in caplog.text
+
+
+def test_responses_keyed_by_bus_use_the_key_as_id(monkeypatch):
+    class _Adapter:
+        @staticmethod
+        def get(endpoint, shared=True):
+            return {"1001": {"lat": 43.0, "lon": -8.0}, "1002": {"lat": 43.1, "lon": -8.1}}
+
+    monkeypatch.setattr(fleet, "_rest_adapter", _Adapter)
+
+    assert sorted(position.bus for position in fleet.get_bus_positions()) == ["1001", "1002"]
+
+
+def test_tracker_reports_only_changes():
+    tracker = FleetTracker(min_distance=0.05)
+    first = tracker.update([_parse_bus_position(_position("1", 43.0, -8.0)), _parse_bus_position(_position("2", 43.1, -8.1))])
+    assert sorted(p.bus for p in first.appeared) == ["1", "2"]
+
+    # Bus 1 moves a few metres (below min_distance), bus 2 changes line, bus 3 appears
+    second = tracker.update([_parse_bus_position(_position("1", 43.0001, -8.0)),
+                             _parse_bus_position(_position("2", 43.1, -8.1, line_id=2)),
+                             _parse_bus_position(_position("3", 43.2, -8.2))])
+    assert [p.bus for p in second.appeared] == ["3"]
+    assert [p.bus for p in second.changed] == ["2"]
+    assert second.disappeared == []
+
+    third = tracker.update([_parse_bus_position(_position("3", 43.2, -8.2))])
+    assert sorted(p.bus for p in third.disappeared) == ["1", "2"]
+    assert not third.appeared and not third.changed
+
+
+def test_polling_interval_adapts():
+    tracker = FleetTracker(interval=10, min_interval=5, max_interval=40, factor=2)
+    tracker._adapt(None)
+    assert tracker.interval == 20
+    tracker._adapt(None)
+    tracker._adapt(None)
+    assert tracker.interval == 40
+    tracker._adapt(True)
+    assert tracker.interval == 20
@@ -0,0 +1,97 @@
+import csv
+import os
+from datetime import date
+
+import pytest
+
+from arriva_api.transport import gtfs, lines, stops
+from arriva_api.transport.expeditions import Expedition
+from arriva_api.transport.lines import Line
+from arriva_api.transport.stops import Stop
+
+START = date(2024, 1, 1)
+
+STOPS = [Stop(1, "Uno", lat=43.1, long=-8.1), Stop(2, "Dos", lat=43.2, long=-8.2), Stop(3, "Sin posición"),
+         Stop(4, "Cuatro", lat=43.4, long=-8.4)]
+
+EXPEDITIONS = {
+    1: [Expedition(11, 1, [(1, 480), (3, 490), (2, -1), (4, 500)]),
+        Expedition(12, 1, [(1, -1), (2, 600), (4, 610), (1, -1)], weekdays=0b0011111)],
+    2: [Expedition(21, 2, [(3, 480), (1, 490)]),  # Only one located stop
+        Expedition(22, 2, [(4, 700), (2, 710)], weekdays=0b0011111, seasons=[(601, 915)])],
+    3: [Expedition(31, 3, [(2, 800), (1, 810)])],
+}
+
+
+@pytest.fixture
+def network(monkeypatch):
+    fetched = []
+
+    def fetch(line_id):
+        fetched.append(line_id)
+        return EXPEDITIONS[line_id]
+
+    monkeypatch.setattr(stops, "iter_all_stops", lambda: iter(STOPS))
+    monkeypatch.setattr(lines, "iter_all_lines", lambda: iter([Line(line_id, f"Línea {line_id}") for line_id in EXPEDITIONS]))
+    monkeypatch.setattr(gtfs, "fetch_line_expeditions", fetch)
+    return fetched
+
+
+def _rows(directory, name: str) -> list[dict]:
+    with open(os.path.join(directory, name), newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_export_writes_a_consistent_feed(network, tmp_path):
+    gtfs.export(str(tmp_path), START, date(2024, 12, 31))
+
+    assert [row["stop_id"] for row in _rows(tmp_path, "stops.txt")] == ["1", "2", "4"]
+    assert [(row["route_id"], row["route_short_name"]) for row in _rows(tmp_path, "routes.txt")] == [("1", "1"), ("2", "2"), ("3", "3")]
+    assert [row["trip_id"] for row in _rows(tmp_path, "trips.txt")] == ["11", "12", "22", "31"]
+
+    stop_times = _rows(tmp_path, "stop_times.txt")
+    assert {row["stop_id"] for row in stop_times} <= {"1", "2", "4"}
+    trip_12 = [(row["stop_id"], row["arrival_time"]) for row in stop_times if row["trip_id"] == "12"]
+    assert trip_12 == [("2", "10:00:00"), ("4", "10:10:00")]
+    trip_11 = [(row["stop_id"], row["arrival_time"]) for row in stop_times if row["trip_id"] == "11"]
+    assert trip_11 == [("1", "08:00:00"), ("2", ""), ("4", "08:20:00")]
+
+    services = {row["trip_id"]: row["service_id"] for row in _rows(tmp_path, "trips.txt")}
+    assert services["11"] == services["31"] != services["12"] != services["22"]
+    assert {row["service_id"] for row in _rows(tmp_path, "calendar_dates.txt")} == {services["22"]}
+    assert not os.path.exists(tmp_path / gtfs.CHECKPOINT)
+
+    mask = os.umask(0)
+    os.umask(mask)
+    modes = {name: os.stat(tmp_path / name).st_mode & 0o777 for name in os.listdir(tmp_path)}
+    assert set(modes.values()) == {0o666 & ~mask}, modes
+
+
+def test_an_interrupted_export_resumes_without_duplicates(network, tmp_path, monkeypatch):
+    def failing(line_id):
+        if line_id == 3:
+            raise ConnectionError("down")
+        network.append(line_id)
+        return EXPEDITIONS[line_id]
+
+    monkeypatch.setattr(gtfs, "fetch_line_expeditions", failing)
+    with pytest.raises(ConnectionError):
+        gtfs.export(str(tmp_path), START, max_workers=1)
+    assert os.path.exists(tmp_path / gtfs.CHECKPOINT)
+    # A partial line written after the last checkpoint is discarded on resume
+    with open(tmp_path / "trips.txt", "a", encoding="utf-8") as f:
+        f.write("3,S9,99\n")
+
+    monkeypatch.setattr(gtfs, "fetch_line_expeditions", lambda line_id: network.append(line_id) or EXPEDITIONS[line_id])
+    gtfs.export(str(tmp_path), START, max_workers=1)
+
+    assert network == [1, 2, 3]
+    assert [row["trip_id"] for row in _rows(tmp_path, "trips.txt")] == ["11", "12", "22", "31"]
+    assert len(_rows(tmp_path, "calendar.txt")) == 3
+
+
+def test_trip_ends_need_times():
+    assert gtfs._trip_stop_times(Expedition(1, 1, [(1, -1), (2, 10), (3, -1), (4, 20), (5, -1)]), {1, 2, 3, 4, 5}) == \
+        [(1, 2, 10), (2, 3, -1), (3, 4, 20)]
+    assert gtfs._trip_stop_times(Expedition(1, 1, [(1, 10), (2, -1)]), {1, 2}) == []
+    assert gtfs._trip_stop_times(Expedition(1, 1, [(1, 10), (2, 20)]), {1}) == []
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from arriva_api.http_cache import CacheEntry, DiskCache
+from arriva_api.metrics import MetricsCollector
+from arriva_api.rest_adapter import RestAdapter
+from benchmarks.fake_server import FakeArrivaServer, Fixtures
+
+
+def test_keys_ignore_param_order_and_depend_on_scope():
+    assert DiskCache.key("get", "/a", {"x": 1, "y": 2}) == DiskCache.key("GET", "/a", {"y": 2, "x": 1})
+    assert DiskCache.key("GET", "/a", scope="https://one/") != DiskCache.key("GET", "/a", scope="https://two/")
+
+
+def test_entries_round_trip_and_expire(tmp_path):
+    cache = DiskCache(str(tmp_path), ttls={"/fresh/*": 60, "/stale/*": 0})
+    entry = CacheEntry(b'{"a": 1}', etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    cache.store("k", entry)
+
+    loaded = cache.load("k")
+    assert loaded.body == b'{"a": 1}'
+    assert loaded.conditional_headers() == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert cache.is_fresh("/fresh/x", loaded)
+    assert not cache.is_fresh("/stale/x", loaded)
+    assert cache.ttl("/other") is None
+    assert cache.load("missing") is None
+
+
+def test_an_interrupted_write_leaves_the_previous_entry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.store("k", CacheEntry(b"old"))
+
+    chunks = cache.store_chunks("k", iter([b"new", b"er"]))
+    next(chunks)
+    chunks.close()
+
+    assert cache.load("k").body == b"old"
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".")] == []
+
+
+def test_clear_leaves_files_being_written(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.store("k", CacheEntry(b"{}"))
+    (tmp_path / ".tmp-in-progress").write_bytes(b"partial")
+
+    cache.clear()
+
+    assert os.listdir(tmp_path) == [".tmp-in-progress"]
+
+
+def test_expired_entries_are_revalidated_with_the_etag(server, tmp_path):
+    metrics = MetricsCollector()
+    adapter = RestAdapter(server.url, cache=DiskCache(str(tmp_path), ttls={"/superparadas/*": 0}), hooks=metrics)
+
+    first = adapter.get("/superparadas/index/buscador.json", shared=False)
+    second = adapter.get("/superparadas/index/buscador.json", shared=False)
+
+    assert first == second
+    assert server.requests == 2
+    events = {event: count for (_, _, event), count in metrics.cache_events.items()}
+    assert events == {"miss": 1, "revalidated": 1}
+
+
+def test_fresh_entries_are_served_from_disk(server, tmp_path):
+    adapter = RestAdapter(server.url, cache=DiskCache(str(tmp_path), ttls={"/superparadas/*": 60}))
+
+    adapter.get("/superparadas/index/buscador.json", shared=False)
+    adapter.get("/superparadas/index/buscador.json", shared=False)
+    list(adapter.stream("/superparadas/index/buscador.json", ("paradas",)))
+
+    assert server.requests == 1
+
+
+def test_revalidate_asks_the_server_about_fresh_entries(server, tmp_path):
+    metrics = MetricsCollector()
+    adapter = RestAdapter(server.url, memo_ttl=60, cache=DiskCache(str(tmp_path), ttls={"/superparadas/*": 60}), hooks=metrics)
+
+    first = adapter.get("/superparadas/index/buscador.json")
+    assert adapter.get("/superparadas/index/buscador.json", revalidate=True) == first
+    records = list(adapter.stream("/superparadas/index/buscador.json", ("paradas",), revalidate=True))
+
+    assert records == first["paradas"]
+    assert server.requests == 3
+    events = {event: count for (_, _, event), count in metrics.cache_events.items()}
+    assert events["revalidated"] == 2
+
+
+def test_adapters_for_different_servers_dont_share_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), ttls={"*": 60})
+    with FakeArrivaServer(Fixtures(stops=3, lines=1, buses=1, seed=1)) as one, \
+            FakeArrivaServer(Fixtures(stops=5, lines=1, buses=1, seed=2)) as two:
+        first = RestAdapter(one.url, cache=cache).get("/superparadas/index/buscador.json", shared=False)
+        second = RestAdapter(two.url, cache=cache).get("/superparadas/index/buscador.json", shared=False)
+
+    assert len(first["paradas"]) == 3
+    assert len(second["paradas"]) == 5
+
+
+def test_entries_are_scoped_to_the_token(server, tmp_path):
+    cache = DiskCache(str(tmp_path), ttls={"*": 60})
+    RestAdapter(server.url, token="alice", cache=cache).get("/superparadas/index/buscador.json", shared=False)
+    RestAdapter(server.url, token="bob", cache=cache).get("/superparadas/index/buscador.json", shared=False)
+
+    assert server.requests == 2
+    assert not any(b"alice" in (tmp_path / name).read_bytes() for name in os.listdir(tmp_path))
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.import_time import ROOT, TARGETS
+
+_PROBE = """
+import importlib, json, sys
+importlib.import_module(sys.argv[1])
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _loaded_after(module: str) -> set[str]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    output = subprocess.run([sys.executable, "-c", _PROBE, module], env=env, capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output))
+
+
+@pytest.mark.parametrize("module", sorted(TARGETS))
+def test_imports_dont_load_heavy_modules(module):
+    loaded = _loaded_after(module)
+    assert loaded.isdisjoint(TARGETS[module])
+    # Nor any transport submodule that wasn't asked for
+    assert {name for name in loaded if name.startswith("arriva_api.transport.")} <= {module}
+
+
+def test_lazy_attributes_import_on_first_access():
+    import arriva_api
+    import arriva_api.transport as transport
+
+    assert arriva_api.RestAdapter.__module__ == "arriva_api.rest_adapter"
+    assert transport.stops.__name__ == "arriva_api.transport.stops"
+    with pytest.raises(AttributeError):
+        arriva_api.missing
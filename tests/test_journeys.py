@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from arriva_api.transport.expeditions import Expedition, Timetable
+from arriva_api.transport.journeys import JourneyPlanner
+from arriva_api.transport.stops import Stop, StopTable
+
+
+def _at(hours: int, minutes: int) -> datetime:
+    return datetime(2024, 1, 1, hours, minutes)
+
+
+def _minutes(hours: int, minutes: int) -> int:
+    return hours * 60 + minutes
+
+
+# Stops 3 and 4 are about 200 m apart, the rest are far from each other
+STOPS = StopTable.from_stops([Stop(1, "Uno", lat=43.1, long=-8.0), Stop(2, "Dos", lat=43.2, long=-8.0),
+                              Stop(3, "Tres", lat=43.0, long=-8.0), Stop(4, "Cuatro", lat=43.0018, long=-8.0),
+                              Stop(5, "Cinco", lat=43.3, long=-8.0)])
+
+TIMETABLE = Timetable([
+    Expedition(1, 10, [(1, _minutes(8, 0)), (2, _minutes(8, 10)), (3, _minutes(8, 20))]),
+    Expedition(2, 20, [(2, _minutes(8, 11)), (5, _minutes(8, 20))]),  # Leaves before the transfer time
+    Expedition(3, 20, [(2, _minutes(8, 15)), (5, _minutes(8, 25))]),
+    Expedition(4, 30, [(4, _minutes(8, 30)), (5, _minutes(8, 40))]),
+    Expedition(5, 40, [(1, _minutes(8, 2)), (3, _minutes(8, 15))]),
+    Expedition(6, 10, [(1, _minutes(9, 0)), (2, _minutes(9, 10)), (3, _minutes(9, 20))]),
+    Expedition(7, 50, [(5, _minutes(23, 50)), (1, _minutes(24, 20))]),
+])
+
+
+def _planner(**kwargs) -> JourneyPlanner:
+    return JourneyPlanner(TIMETABLE, STOPS, **kwargs)
+
+
+def test_transfers_respect_the_transfer_time():
+    journey = _planner().earliest_arrival(1, 5, _at(7, 50))
+    assert [(leg.expedition_id, leg.origin_id, leg.destination_id) for leg in journey.legs] == [(1, 1, 2), (3, 2, 5)]
+    assert (journey.departure, journey.arrival, journey.transfers) == (_at(8, 0), _at(8, 25), 1)
+
+    # With no transfer time the earlier bus can be caught
+    assert _planner(transfer_time=0).earliest_arrival(1, 5, _at(7, 50)).arrival == _at(8, 20)
+
+
+def test_walking_legs_between_nearby_stops():
+    journey = _planner().earliest_arrival(1, 4, _at(7, 50))
+    assert [(leg.origin_id, leg.destination_id, leg.walking) for leg in journey.legs] == [(1, 3, False), (3, 4, True)]
+    assert journey.arrival == _at(8, 18)
+
+    assert _planner().footpaths()[3] == [(4, 3)]
+    assert _planner(max_walk=0).earliest_arrival(1, 4, _at(7, 50)) is None
+
+
+def test_profile_keeps_only_optimal_journeys():
+    journeys = _planner().profile(1, 3, _at(7, 0), _at(10, 0))
+    assert [(journey.departure, journey.arrival) for journey in journeys] == [(_at(8, 2), _at(8, 15)), (_at(9, 0), _at(9, 20))]
+
+
+def test_trips_after_midnight_and_unreachable_stops():
+    journey = _planner().earliest_arrival(5, 1, _at(23, 0))
+    assert (journey.departure, journey.arrival) == (_at(23, 50), datetime(2024, 1, 2, 0, 20))
+    # Just after midnight the bus of the day before has already left, the next one is that night's
+    journey = _planner().earliest_arrival(5, 1, datetime(2024, 1, 2, 0, 0))
+    assert (journey.departure, journey.arrival) == (datetime(2024, 1, 2, 23, 50), datetime(2024, 1, 3, 0, 20))
+    # A first walking leg is made just before the first bus
+    journey = _planner().earliest_arrival(3, 1, _at(7, 0))
+    assert [(leg.origin_id, leg.departure, leg.line_id) for leg in journey.legs] == [(3, _at(8, 27), None), (4, _at(8, 30), 30), (5, _at(23, 50), 50)]
+    assert _planner().earliest_arrival(1, 99, _at(7, 0)) is None
+    assert _planner().earliest_arrival(1, 1, _at(7, 0)) is None
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from arriva_api.json_stream import iter_array_items
+from arriva_api.transport import lines, stops
+
+
+def _chunks(document, size: int = 1):
+    body = json.dumps(document).encode()
+    return (body[i:i + size] for i in range(0, len(body), size))
+
+
+ITEMS = [{"parada": 1, "nombre": 'Rúa "A", [1]'}, {"parada": 2, "nombre": "}{,:\\"}, [], 3, "x"]
+
+
+@pytest.mark.parametrize("size", [1, 3, 65536])
+def test_items_are_parsed_across_chunk_boundaries(size):
+    assert list(iter_array_items(_chunks({"a": 1, "paradas": ITEMS}, size), ("paradas",))) == ITEMS
+
+
+def test_root_arrays_and_nested_paths():
+    assert list(iter_array_items(_chunks(ITEMS), ())) == ITEMS
+    assert list(iter_array_items(_chunks(ITEMS), ("paradas",), root_array_ok=True)) == ITEMS
+    assert list(iter_array_items(_chunks({"x": {"paradas": []}, "a": {"b": ITEMS}}), ("a", "b"))) == ITEMS
+
+
+def test_the_wrapper_is_followed_when_present():
+    wrapped = {"status": "ok", "results": {"other": [0], "paradas": ITEMS}}
+    assert list(iter_array_items(_chunks(wrapped), ("paradas",), wrapper="results")) == ITEMS
+    assert list(iter_array_items(_chunks({"paradas": ITEMS}), ("paradas",), wrapper="results")) == ITEMS
+    assert list(iter_array_items(_chunks({"results": ITEMS}), (), wrapper="results")) == ITEMS
+    # A wrapper without the path: the path is still looked for at the top level
+    assert list(iter_array_items(_chunks({"results": {"x": 1}, "paradas": ITEMS}), ("paradas",), wrapper="results")) == ITEMS
+
+
+def test_missing_or_mistyped_arrays_raise():
+    with pytest.raises(ValueError):
+        list(iter_array_items(_chunks({"a": ITEMS}), ("paradas",)))
+    with pytest.raises(ValueError):
+        list(iter_array_items(_chunks({"paradas": {"a": 1}}), ("paradas",)))
+    with pytest.raises(ValueError):
+        list(iter_array_items(_chunks(ITEMS), ("paradas",)))
+
+
+def test_streamed_stops_and_lines_match_the_parsed_responses(api, server):
+    # `get` parses the whole body with the json module, without going through the streaming parser
+    assert list(stops.iter_stop_records()) == api.get("/superparadas/index/buscador.json", shared=False)["paradas"]
+    assert list(lines.iter_network_records()) == \
+        api.get("/lineas/index.json", ep_params={"associated": lines.NETWORK_ASSOCIATED}, shared=False)
+    assert [line.id for line in lines.iter_all_lines()] == \
+        [record["linea"]["id"] for record in api.get("/lineas/index.json", shared=False)]
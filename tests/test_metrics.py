@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from arriva_api.http_cache import DiskCache
+from arriva_api.metrics import MetricsCollector, endpoint_template, escape_label_value
+from arriva_api.rest_adapter import RestAdapter
+
+
+def _events(metrics: MetricsCollector) -> dict:
+    return {event: count for (_, _, event), count in metrics.cache_events.items()}
+
+
+def test_endpoint_templates():
+    assert endpoint_template("/buscador/precio/15004/15018.json") == "/buscador/precio/{id}/{id}.json"
+    assert endpoint_template("/buses/getGeoloc/1234") == "/buses/getGeoloc/{id}"
+
+
+def test_shared_lookups_record_misses_and_rates_per_layer(server, tmp_path):
+    metrics = MetricsCollector()
+    adapter = RestAdapter(server.url, memo_ttl=60, cache=DiskCache(str(tmp_path), ttls={"/superparadas/*": 60}), hooks=metrics)
+
+    adapter.get("/superparadas/index/buscador.json")
+    adapter.get("/superparadas/index/buscador.json")
+    adapter.clear_memo()
+    adapter.get("/superparadas/index/buscador.json")
+
+    assert _events(metrics) == {"fetched": 2, "memo": 1, "miss": 1, "hit": 1}
+    assert metrics.cache_hit_rate("shared") == pytest.approx(1 / 3)
+    assert metrics.cache_hit_rate("disk") == pytest.approx(1 / 2)
+    assert metrics.cache_hit_rate() == pytest.approx(2 / 5)
+    assert MetricsCollector().cache_hit_rate() is None
+
+
+def test_hooks_run_outside_the_shared_lock(server):
+    adapter = RestAdapter(server.url, memo_ttl=60)
+    held = []
+
+    class Probe(MetricsCollector):
+        def cache_event(self, method, endpoint, event):
+            held.append(adapter._shared_lock.locked())
+            super().cache_event(method, endpoint, event)
+
+    adapter.hooks = Probe()
+    adapter.get("/superparadas/index/buscador.json")
+    adapter.get("/superparadas/index/buscador.json")
+
+    assert held == [False, False]
+
+
+def test_coalesced_requests_are_counted(server):
+    metrics = MetricsCollector()
+    adapter = RestAdapter(server.url, hooks=metrics)
+    server.latency = 0.1
+    threads = [threading.Thread(target=adapter.get, args=("/lineas/index.json",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    events = _events(metrics)
+    assert events["fetched"] + events.get("coalesced", 0) == 4
+    assert events["fetched"] == server.requests
+
+
+def test_prometheus_label_values_are_escaped():
+    assert escape_label_value('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+
+    metrics = MetricsCollector()
+    metrics.cache_event("GET", '/odd"path\n', "hit")
+    text = metrics.to_prometheus()
+    assert 'endpoint="/odd\\"path\\n"' in text
+    assert all(line.startswith(("#", "arriva_")) for line in text.splitlines())
@@ -0,0 +1,52 @@
+import pytest
+
+from arriva_api.transport import expeditions, lines, snapshot
+
+
+@pytest.fixture
+def network_cache(monkeypatch):
+    monkeypatch.setattr(lines, "_network", None)
+    monkeypatch.setattr(lines, "_network_loaded_at", None)
+    monkeypatch.setattr(expeditions, "_timetable", (None, None))
+
+
+def test_network_timetable_and_snapshot_share_one_download(api, server, network_cache, tmp_path):
+    before = server.requests
+    network = lines.get_network()
+    timetable = expeditions.get_timetable()
+    snapshot.build(str(tmp_path / "red.bin"))
+    # The stop catalog and the network
+    assert server.requests - before == 2
+
+    assert len(network) == 4
+    assert set(timetable.expeditions) == {expedition.id for expedition in network.expeditions}
+    with snapshot.Snapshot(str(tmp_path / "red.bin")) as built:
+        assert built.line_count() == len(network)
+        assert built.expedition_count() == len(network.expeditions)
+        for line_id in network.lines:
+            assert built.line_stops(int(line_id)) == network.stops_of_line(line_id)
+
+
+def test_line_stops_follow_the_first_expedition_through_each_stop(api, server, network_cache):
+    network = lines.get_network()
+    for line_id, stop_ids in network.line_stops.items():
+        expected = {}
+        for expedition in network.expeditions:
+            if expedition.line_id == int(line_id):
+                for stop_id, _ in expedition.stop_times:
+                    expected.setdefault(stop_id, None)
+        assert stop_ids == list(expected)
+        for stop_id in stop_ids:
+            assert line_id in network.stop_lines[stop_id]
+
+
+def test_the_timetable_follows_network_refreshes(api, server, network_cache):
+    timetable = expeditions.get_timetable()
+    assert expeditions.get_timetable() is timetable
+    lines.get_network(refresh=True)
+    assert expeditions.get_timetable() is not timetable
+
+    installed = expeditions.Timetable([])
+    expeditions.set_timetable(installed)
+    lines.get_network(refresh=True)
+    assert expeditions.get_timetable() is installed
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from arriva_api.transport import rates
+
+
+@pytest.fixture(autouse=True)
+def clean_memo():
+    rates.clear_rate_cache()
+    yield
+    rates.clear_rate_cache()
+
+
+def test_get_rates_deduplicates_and_remembers(api, server):
+    found, errors = rates.get_rates([(10001, 10002), (10001, 10002), (10003, 10004)])
+
+    assert errors == {}
+    assert set(found) == {(10001, 10002), (10003, 10004)}
+    assert server.requests == 2
+
+    rates.get_rate(10001, 10002)
+    assert server.requests == 2
+
+
+def test_get_rates_reports_failures_per_pair(api, server):
+    found, errors = rates.get_rates([(10001, 10002), (1, "missing")])
+
+    assert list(found) == [(10001, 10002)]
+    assert list(errors) == [(1, "missing")]
+
+
+def test_rate_matrix_has_none_where_a_pair_failed(api):
+    matrix = rates.get_rate_matrix([10001, 10002], [10003, "missing"])
+
+    assert matrix[10001, 10003] is not None
+    assert matrix[10002, "missing"] is None
+    assert set(matrix.errors) == {(10001, "missing"), (10002, "missing")}
+    assert set(matrix.to_dict()) == {(10001, 10003), (10002, 10003)}
+
+
+def test_the_memo_is_bounded(api, monkeypatch):
+    monkeypatch.setattr(rates, "RATE_CACHE_SIZE", 2)
+    for destination in (10002, 10003, 10004):
+        rates.get_rate(10001, destination)
+
+    assert list(rates._memo) == [(10001, 10003), (10001, 10004)]
+
+
+def test_expired_rates_are_evicted(api, server, monkeypatch):
+    monkeypatch.setattr(rates, "RATE_TTL", 0)
+    rates.get_rate(10001, 10002)
+
+    assert rates._cached_rate((10001, 10002)) is None
+    assert len(rates._memo) == 0
+
+
+def test_async_get_rates_returns_the_same_tuple(api, server, monkeypatch):
+    pytest.importorskip("aiohttp")
+    from arriva_api.async_rest_adapter import AsyncRestAdapter
+    from arriva_api.transport import aio
+
+    monkeypatch.setattr(aio, "_rest_adapter", AsyncRestAdapter(server.url))
+    found, errors = asyncio.run(aio.get_rates([(10001, 10002), (10001, 10002), (1, "missing")]))
+
+    assert list(found) == [(10001, 10002)]
+    assert list(errors) == [(1, "missing")]
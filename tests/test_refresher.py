@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from arriva_api.http_cache import DiskCache
+from arriva_api.transport import refresher, stops
+from arriva_api.transport.refresher import Refresher
+from arriva_api.transport.stops import StopCatalog
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = StopCatalog()
+    monkeypatch.setattr(stops, "catalog", catalog)
+    return catalog
+
+
+def test_stale_values_are_served_while_they_are_refreshed():
+    values = iter(range(10))
+    release = threading.Event()
+    warmer = Refresher(jitter=0)
+    warmer.add("n", lambda: release.wait(5) and next(values), ttl=0)
+
+    release.set()
+    assert warmer.get("n") == 0
+    release.clear()
+    assert warmer.get("n") == 0  # Stale, the refresh waits in the background
+    release.set()
+    assert warmer.refresh("n") in (1, 2)
+    assert warmer.stats()["n"]["refreshes"] >= 2
+    warmer.stop()
+
+
+def test_failed_refreshes_are_reported_and_keep_the_previous_value():
+    loads = iter([1])
+    warmer = Refresher()
+    warmer.add("n", lambda: next(loads), ttl=60)
+
+    assert warmer.warm() == {}
+    errors = warmer.warm()
+    assert isinstance(errors["n"], StopIteration)
+    assert warmer.get("n") == 1
+    assert warmer.stats()["n"]["failures"] == 1
+    warmer.stop()
+
+
+def test_refreshes_revalidate_the_disk_cache(api, server, catalog, tmp_path):
+    api.cache = DiskCache(str(tmp_path), ttls={"/superparadas/*": 24 * 3600})
+    stop_id = next(stops.iter_stop_records())["parada"]
+    warmer = refresher.transport_refresher(hot_stops=[stop_id], lines=False, alerts=False)
+
+    assert warmer.warm() == {}
+    before = server.requests
+    warmer.refresh("stops")
+    warmer.refresh(f"/superparadas/expediciones-fecha/{stop_id}.json")
+    # Both are fresh on disk, but a refresh must ask the API
+    assert server.requests - before == 2
+    assert catalog.get() is warmer.get("stops")
+    warmer.stop()
+
+
+def test_stale_while_revalidate_is_opt_in_and_restored_on_stop(api, server, catalog):
+    warmer = refresher.transport_refresher(lines=False, alerts=False)
+    warmer.start()
+    assert not catalog.stale_while_revalidate
+    warmer.stop()
+
+    warmer = refresher.transport_refresher(lines=False, alerts=False, stale_while_revalidate=True)
+    assert not catalog.stale_while_revalidate
+    warmer.start()
+    assert catalog.stale_while_revalidate
+    warmer.stop()
+    assert not catalog.stale_while_revalidate
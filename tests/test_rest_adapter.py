@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+import requests
+
+from arriva_api import rest_adapter
+from arriva_api.exceptions import TPGalWSAppException
+from arriva_api.rest_adapter import RestAdapter
+
+
+def test_requests_reuse_one_pooled_connection(server):
+    with RestAdapter(server.url) as adapter:
+        for _ in range(5):
+            adapter.get("/lineas/index.json", shared=False)
+        assert server.requests == 5
+        assert server.connections == 1
+    assert adapter._session is None
+
+
+def test_close_releases_the_pool_and_a_later_request_reopens_it(server):
+    adapter = RestAdapter(server.url)
+    adapter.get("/lineas/index.json", shared=False)
+    session = adapter.session
+
+    adapter.close()
+    assert adapter._session is None
+    adapter.get("/lineas/index.json", shared=False)
+    assert adapter.session is not session
+    assert server.connections == 2
+
+
+def test_without_keep_alive_each_request_opens_a_connection(server):
+    adapter = RestAdapter(server.url, keep_alive=False)
+    for _ in range(3):
+        adapter.get("/lineas/index.json", shared=False)
+    assert server.connections == 3
+
+
+def test_the_timeout_is_applied(server):
+    server.latency = 0.5
+    adapter = RestAdapter(server.url, timeout=(1, 0.05))
+    with pytest.raises(requests.exceptions.Timeout):
+        adapter.get("/lineas/index.json", shared=False)
+
+
+def test_concurrent_identical_gets_share_one_request(server):
+    server.latency = 0.1
+    adapter = RestAdapter(server.url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(adapter.get("/lineas/index.json"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.requests == 1
+    assert len(results) == 8 and all(result is results[0] for result in results)
+
+
+def test_memoised_responses_expire_after_memo_ttl(server, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rest_adapter.time, "monotonic", lambda: now[0])
+    adapter = RestAdapter(server.url, memo_ttl=10)
+
+    first = adapter.get("/lineas/index.json")
+    now[0] += 9
+    assert adapter.get("/lineas/index.json") is first
+    assert server.requests == 1
+    now[0] += 2
+    assert adapter.get("/lineas/index.json") is not first
+    assert server.requests == 2
+
+
+def test_the_memo_evicts_the_least_recently_used(server):
+    adapter = RestAdapter(server.url, memo_ttl=60, memo_size=2)
+    for endpoint in ("/buscador/precio/1/2.json", "/buscador/precio/1/3.json", "/buscador/precio/1/2.json", "/buscador/precio/1/4.json"):
+        adapter.get(endpoint)
+    assert server.requests == 3
+
+    adapter.get("/buscador/precio/1/2.json")
+    assert server.requests == 3
+    adapter.get("/buscador/precio/1/3.json")  # Evicted by 1/4
+    assert server.requests == 4
+
+
+def test_errors_are_not_memoised(server):
+    adapter = RestAdapter(server.url, memo_ttl=60)
+    for _ in range(2):
+        with pytest.raises(TPGalWSAppException):
+            adapter.get("/missing.json")
+    assert server.requests == 2
+    assert not adapter._inflight
+
+
+def test_unshared_gets_bypass_the_memo_and_prime_fills_it(server):
+    adapter = RestAdapter(server.url, memo_ttl=60)
+    first = adapter.get("/lineas/index.json")
+    assert adapter.get("/lineas/index.json", shared=False) is not first
+    assert server.requests == 2
+
+    adapter.prime("/lineas/index.json", ["primed"], ttl=60)
+    assert adapter.get("/lineas/index.json") == ["primed"]
+    adapter.clear_memo()
+    assert adapter.get("/lineas/index.json") != ["primed"]
+    assert server.requests == 3
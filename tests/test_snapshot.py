@@ -0,0 +1,109 @@
+import math
+import os
+import types
+
+import pytest
+
+from arriva_api.transport import expeditions, lines, snapshot, stops
+from arriva_api.transport.snapshot import Snapshot
+
+
+@pytest.fixture
+def built(api, server, monkeypatch, tmp_path):
+    """
+    A snapshot of the fake server's network, and the stop records it was built from
+    """
+
+    monkeypatch.setattr(lines, "_network", None)
+    monkeypatch.setattr(lines, "_network_loaded_at", None)
+    monkeypatch.setattr(expeditions, "_timetable", (None, None))
+    path = str(tmp_path / "red.bin")
+    snapshot.build(path)
+    return path, {record["parada"]: record for record in stops.iter_stop_records()}
+
+
+def test_records_are_sorted_by_id_and_strings_are_stored_once(built):
+    path, records = built
+    with open(path, "rb") as f:
+        data = f.read()
+    fields = snapshot._HEADER.unpack_from(data, 0)
+    assert fields[:2] == (snapshot.MAGIC, snapshot.VERSION)
+    stop_count, stop_offset = fields[2:4]
+    strings = fields[-1]
+    assert stop_count == len(records)
+
+    ids = [snapshot._STOP.unpack_from(data, stop_offset + i * snapshot._STOP.size)[0] for i in range(stop_count)]
+    assert ids == sorted(records)
+
+    stop_id, name, _, peso, lat, long = snapshot._STOP.unpack_from(data, stop_offset)
+    length = snapshot._STRING_LENGTH.unpack_from(data, strings + name)[0]
+    start = strings + name + snapshot._STRING_LENGTH.size
+    assert data[start:start + length].decode() == records[stop_id]["nombre"]
+    assert (peso, lat, long) == (records[stop_id]["peso"], records[stop_id]["lat"], records[stop_id]["lon"])
+
+    # Every distinct string is stored once, however many records point to it
+    distinct = {value for stop in records.values() for value in (stop["nombre"], stop["nom_web"]) if value is not None}
+    distinct |= {line.name for line in lines.get_network().lines.values()}
+    assert len(distinct) < 2 * len(records)
+    assert len(data) - strings == sum(snapshot._STRING_LENGTH.size + len(value.encode()) for value in distinct)
+
+
+def test_stops_and_lines_are_built_on_access(built):
+    path, records = built
+    stop_id = min(records)
+    with Snapshot(path) as network:
+        assert isinstance(network.stops(), types.GeneratorType)
+        assert isinstance(network.lines(), types.GeneratorType)
+        stop = network.stop(stop_id)
+        assert (stop.id, stop.name, stop.name_council, stop.peso) == \
+            (stop_id, records[stop_id]["nombre"], records[stop_id]["nom_web"], records[stop_id]["peso"])
+        assert math.isclose(stop.location.lat, records[stop_id]["lat"])
+        assert network.stop(stop_id) is not stop
+        assert network.stop(-1) is None
+
+        line = next(network.lines())
+        assert network.line(line.id).name == line.name
+        assert network.line(-1) is None and network.line_stops(-1) == []
+        assert [stop.id for stop in network.stops()] == sorted(records)
+
+
+def test_the_file_can_be_opened_by_other_users(built):
+    path, _ = built
+    mask = os.umask(0)
+    os.umask(mask)
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~mask
+    assert [name for name in os.listdir(os.path.dirname(path)) if name.startswith(".tmp-")] == []
+
+
+@pytest.mark.parametrize("size", [0, 4, snapshot._HEADER.size, -1])
+def test_truncated_files_are_rejected(built, tmp_path, size):
+    path, _ = built
+    with open(path, "rb") as f:
+        data = f.read()
+    truncated = tmp_path / "truncated.bin"
+    truncated.write_bytes(data[:size] if size >= 0 else data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        Snapshot(str(truncated))
+
+
+def test_corrupt_files_are_rejected(built, tmp_path):
+    path, _ = built
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+
+    other_version = tmp_path / "version.bin"
+    other_version.write_bytes(snapshot._HEADER.pack(snapshot.MAGIC, snapshot.VERSION + 1, *snapshot._HEADER.unpack_from(data, 0)[2:]) + data[snapshot._HEADER.size:])
+    with pytest.raises(ValueError):
+        Snapshot(str(other_version))
+
+    # A stop whose name points past the end of the file
+    fields = snapshot._HEADER.unpack_from(data, 0)
+    stop_offset = fields[3]
+    record = list(snapshot._STOP.unpack_from(data, stop_offset))
+    record[1] = len(data)
+    snapshot._STOP.pack_into(data, stop_offset, *record)
+    corrupt = tmp_path / "corrupt.bin"
+    corrupt.write_bytes(bytes(data))
+    with Snapshot(str(corrupt)) as network:
+        with pytest.raises(ValueError):
+            network.stop(record[0])
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from arriva_api.transport.distance import haversine
+from arriva_api.transport.spatial import GridIndex
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = random.Random(4)
+    return [(rng.uniform(42.0, 43.8), rng.uniform(-9.3, -7.0)) for _ in range(800)]
+
+
+def _brute_force(points, lat, long):
+    return sorted((haversine(lat, long, point_lat, point_long), i) for i, (point_lat, point_long) in enumerate(points))
+
+
+@pytest.mark.parametrize("cell_size", [0.005, 0.02, 0.5])
+def test_nearest_matches_brute_force(points, cell_size):
+    index = GridIndex(points, cell_size=cell_size)
+    rng = random.Random(5)
+    # Queries inside the area, on its edge and far outside of it
+    queries = [(rng.uniform(42.0, 43.8), rng.uniform(-9.3, -7.0)) for _ in range(20)] + [(42.0, -9.3), (40.4, -3.7)]
+    for lat, long in queries:
+        for k in (1, 7):
+            expected = _brute_force(points, lat, long)[:k]
+            found = index.nearest(lat, long, k)
+            assert [i for _, i in found] == [i for _, i in expected]
+            assert [distance for distance, _ in found] == pytest.approx([distance for distance, _ in expected])
+
+
+def test_within_matches_brute_force(points):
+    index = GridIndex(points, items=[f"p{i}" for i in range(len(points))])
+    lat, long = 43.0, -8.0
+    for radius in (0.5, 5, 40):
+        expected = [(distance, f"p{i}") for distance, i in _brute_force(points, lat, long) if distance <= radius]
+        assert [item for _, item in index.within(lat, long, radius)] == [item for _, item in expected]
+
+
+def test_small_and_empty_indexes():
+    assert GridIndex([]).nearest(43, -8) == []
+    assert GridIndex([]).within(43, -8, 10) == []
+    index = GridIndex([(43.0, -8.0), (43.0, -8.1)])
+    assert [i for _, i in index.nearest(43.0, -8.09, k=5)] == [1, 0]
+    assert index.nearest(43.0, -8.0, k=0) == []
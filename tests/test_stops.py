@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from arriva_api.transport import stops
+from arriva_api.transport.stops import StopCatalog, StopTable
+
+RECORDS = [
+    {"parada": 1, "nombre": "A Coruña", "nom_web": "A Coruña (A Coruña)", "peso": 5, "lat": 43.36, "lon": -8.41},
+    {"parada": 2, "nombre": "Santiago de Compostela", "nom_web": "Santiago (Santiago)", "peso": 9, "lat": 42.88, "lon": -8.54},
+    {"parada": 3, "nombre": "Lugo", "nom_web": None, "peso": None, "lat": None, "lon": None},
+]
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """
+    Counts the catalog downloads, which take a little while so that concurrent callers overlap
+    """
+
+    calls = []
+
+    def _iter_stop_records():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return iter(RECORDS)
+
+    monkeypatch.setattr(stops, "iter_stop_records", _iter_stop_records)
+    return calls
+
+
+def test_concurrent_gets_share_one_download(loads):
+    catalog = StopCatalog()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert all(table is results[0] for table in results)
+
+
+def test_expired_catalog_is_downloaded_again(loads):
+    catalog = StopCatalog(ttl=0)
+    catalog.get()
+    catalog.get()
+
+    assert len(loads) == 2
+
+
+def test_put_table_waits_for_the_download_in_progress(loads):
+    catalog = StopCatalog()
+    loader = threading.Thread(target=catalog.get)
+    loader.start()
+    while not loads:
+        time.sleep(0.001)
+
+    installed = StopTable.from_records(RECORDS[:1])
+    catalog.put_table(installed)
+    loader.join()
+
+    # The explicit table is installed after the download, not overwritten by it
+    assert catalog.get() is installed
+
+
+def test_stale_while_revalidate_serves_the_previous_table(loads):
+    catalog = StopCatalog(ttl=3600, stale_while_revalidate=True)
+    first = catalog.get()
+    catalog.ttl = 0
+
+    assert catalog.get() is first
+    deadline = time.monotonic() + 2
+    while len(loads) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(loads) == 2
+
+
+def test_stop_table_builds_stops_lazily_from_columns():
+    table = StopTable.from_records(RECORDS)
+
+    assert len(table) == 3
+    assert table.get(2).name == "Santiago de Compostela"
+    assert table.get(2).location.lat == 42.88
+    assert table.get(3).location is None and table.get(3).peso is None
+    assert table.located_rows() == [0, 1]
+    assert table.get(99) is None
+
+
+def test_stop_table_converts_string_ids():
+    table = StopTable.from_records([dict(RECORDS[0], parada="15004")])
+
+    assert table.get(15004).id == 15004
+
+
+def test_stop_table_rejects_ids_that_are_not_numbers():
+    with pytest.raises(ValueError, match="Invalid stop id"):
+        StopTable.from_records([dict(RECORDS[0], parada="15004-1")])
+
+
+def test_indexes_always_match_their_table(monkeypatch):
+    small = StopTable.from_records(RECORDS[:1])
+    large = StopTable.from_records(RECORDS * 50)
+    catalog = StopCatalog(ttl=None)
+    catalog.put_table(large)
+    monkeypatch.setattr(stops, "catalog", catalog)
+
+    stop = threading.Event()
+
+    def _swap():
+        while not stop.is_set():
+            catalog.put_table(small)
+            catalog.put_table(large)
+
+    swapper = threading.Thread(target=_swap)
+    swapper.start()
+    try:
+        for _ in range(300):
+            stops.search_stops("santiago")
+            stops.location_search_stops(lat=42.88, long=-8.54, radius=100)
+            stops.nearest_stops(lat=43.36, long=-8.41, k=3)
+    finally:
+        stop.set()
+        swapper.join()
+
+
+def test_hydrate_stops_skips_and_logs_failed_lookups(api, server, monkeypatch, caplog):
+    catalog = StopCatalog(ttl=None)
+    catalog.put_table(StopTable.from_records([]))
+    monkeypatch.setattr(stops, "catalog", catalog)
+    known = next(stops.iter_stop_records())
+
+    hydrated = stops.hydrate_stops([stops.Stop(known["parada"]), stops.Stop(999999)])
+    assert hydrated[0].name == known["nombre"]
+    assert hydrated[1].name is None
+    assert "999999" in caplog.text
+
+    # Anything that isn't a failed request or an unexpected response is a bug and isn't hidden
+    monkeypatch.setattr(stops, "_hydrate_from_response", lambda *args: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        stops.hydrate_stops([stops.Stop(known["parada"])])
+
+
+def test_hydrate_stops_finds_string_ids_in_the_table(monkeypatch):
+    catalog = StopCatalog(ttl=None)
+    catalog.put_table(StopTable.from_records(RECORDS))
+    monkeypatch.setattr(stops, "catalog", catalog)
+
+    class NoApi():
+        def get(self, *args, **kwargs):
+            raise AssertionError("the stop is in the table")
+
+    monkeypatch.setattr(stops, "_rest_adapter", NoApi())
+    stop, = stops.hydrate_stops([stops.Stop("2")])
+    assert (stop.name, stop.name_council, stop.peso) == ("Santiago de Compostela", "Santiago (Santiago)", 9)
+    assert (catalog.get().name_council(0), catalog.get().name_council(2)) == ("A Coruña (A Coruña)", None)
@@ -0,0 +1,59 @@
+from arriva_api.transport.text_search import TextIndex, fold, tokenize
+
+NAMES = ["A Coruña", "Santiago de Compostela", "Santa Cruz", "Coruxo", "Lugo (Estación)", "Ourense"]
+
+
+def test_fold_removes_accents_case_and_punctuation():
+    assert fold("A Coruña (Estación)") == "a coruna estacion"
+    assert tokenize("Lugo (Estación)") == ["lugo", "estacion"]
+
+
+def test_prefix_search_is_accent_and_case_insensitive():
+    index = TextIndex(NAMES)
+
+    # Names starting with the first word go first
+    assert [NAMES[i] for i in index.search("CORU")] == ["Coruxo", "A Coruña"]
+    assert [NAMES[i] for i in index.search("estacion")] == ["Lugo (Estación)"]
+
+
+def test_every_query_word_has_to_match():
+    index = TextIndex(NAMES)
+
+    assert [NAMES[i] for i in index.search("sant comp")] == ["Santiago de Compostela"]
+
+
+def test_infix_queries_fall_back_to_substring_matching():
+    index = TextIndex(NAMES)
+
+    assert [NAMES[i] for i in index.search("ruña")] == ["A Coruña"]
+    # Shorter than a trigram: the vocabulary is scanned; shorter names go first
+    assert [NAMES[i] for i in index.search("ru")] == ["Coruxo", "A Coruña", "Santa Cruz"]
+    assert index.search("postel") == [1]
+
+
+def test_fuzzy_search_tolerates_typos():
+    index = TextIndex(NAMES)
+
+    assert index.search("santigo", fuzzy=False) == []
+    assert index.search("santigo")[0] == 1
+
+
+def test_ties_are_broken_by_weight():
+    index = TextIndex(["Santa Cruz", "Santa Rita"], weights=[1, 9])
+
+    assert index.search("sant") == [1, 0]
+    # Without weights, the tie is broken by length and then by position
+    assert index.search("sant", weighted=False) == [0, 1]
+
+
+def test_string_weights_are_converted():
+    index = TextIndex(["Santa Cruz", "Santa Rita"], weights=["1", "9"])
+
+    assert index.search("sant") == [1, 0]
+
+
+def test_empty_query_returns_everything_up_to_limit():
+    index = TextIndex(NAMES, items=list("abcdef"))
+
+    assert index.search("") == list("abcdef")
+    assert index.search("", limit=2) == ["a", "b"]
@@ -0,0 +1,133 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from arriva_api.exceptions import TPGalWSAppException
+from arriva_api.rest_adapter import RestAdapter
+from arriva_api.throttling import Backoff, CircuitBreaker, CircuitOpenError, TokenBucket, parse_retry_after
+
+
+@pytest.fixture
+def failing_server():
+    """
+    A server that answers every request with a 503, counting them by method
+    """
+
+    calls = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _fail(self):
+            calls[self.command] = calls.get(self.command, 0) + 1
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.send_response(503)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        do_GET = do_POST = do_PATCH = do_PUT = _fail
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/", calls
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_token_bucket_allows_bursts_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_waits_for_tokens():
+    bucket = TokenBucket(rate=100, capacity=1)
+    bucket.acquire()
+    started = time.monotonic()
+    bucket.acquire()
+
+    assert time.monotonic() - started >= 0.005
+
+
+def test_token_bucket_rejects_more_tokens_than_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+
+    with pytest.raises(ValueError):
+        bucket.acquire(3)
+    with pytest.raises(ValueError):
+        bucket.try_acquire(3)
+
+
+def test_backoff_is_capped_and_honours_retry_after():
+    backoff = Backoff(base=1, cap=5)
+
+    assert all(0 <= backoff.delay(attempt) <= 5 for attempt in range(10))
+    assert backoff.delay(0, "3") == 3
+    assert backoff.delay(0, "60") == 5
+    assert parse_retry_after("not a date") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+def test_backoff_only_retries_idempotent_methods_by_default():
+    assert Backoff().retries("get") and Backoff().retries("PUT")
+    assert not Backoff().retries("POST") and not Backoff().retries("PATCH")
+    assert Backoff(methods=frozenset({"POST"})).retries("post")
+
+
+def test_circuit_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    breaker.before_request()  # The trial
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()  # Only one at a time
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_post_is_not_retried_unless_opted_in(failing_server):
+    url, calls = failing_server
+    adapter = RestAdapter(url, retry=Backoff(max_retries=2, base=0))
+
+    with pytest.raises(TPGalWSAppException):
+        adapter.post("/x", data={"a": 1})
+    with pytest.raises(TPGalWSAppException):
+        adapter.get("/x", shared=False)
+    assert calls == {"POST": 1, "GET": 3}
+
+    opted_in = RestAdapter(url, retry=Backoff(max_retries=2, base=0, methods=frozenset({"POST"})))
+    with pytest.raises(TPGalWSAppException):
+        opted_in.post("/x", data={"a": 1})
+    assert calls["POST"] == 4
+
+
+def test_the_breaker_counts_one_failure_per_request(failing_server):
+    url, calls = failing_server
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    adapter = RestAdapter(url, retry=Backoff(max_retries=3, base=0), circuit_breaker=breaker)
+
+    with pytest.raises(TPGalWSAppException):
+        adapter.get("/x", shared=False)
+    assert calls["GET"] == 4
+    assert not breaker.is_open
+
+    with pytest.raises(TPGalWSAppException):
+        adapter.get("/x", shared=False)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        adapter.get("/x", shared=False)
+    assert calls["GET"] == 8
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from arriva_api.exceptions import TPGalWSException
+from arriva_api.transport import warning_alerts
+from arriva_api.transport.warning_alerts import AlertStore
+
+
+class FakeApi():
+    """
+    Serves `/comunicaciones` from `alerts` (id -> record) and counts the alerts that are asked for
+    """
+
+    def __init__(self, alerts: dict):
+        self.alerts = alerts
+        self.failing = set()
+        self.viewed = []
+
+    def get(self, endpoint: str, shared: bool = True, revalidate: bool = False):
+        if endpoint == "/comunicaciones/index.json":
+            return {"comunicaciones": [{"id": alert_id, "modified": record["modified"]} for alert_id, record in self.alerts.items()]}
+        alert_id = int(endpoint.rsplit("/", 1)[1].split(".")[0])
+        self.viewed.append(alert_id)
+        if alert_id in self.failing:
+            raise TPGalWSException("down")
+        return {"comunicacion": {"id": alert_id, **self.alerts[alert_id]}}
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeApi({1: {"modified": "a", "titulo": "Obras", "lineas": [10], "paradas": [100]},
+                   2: {"modified": "a", "titulo": "Huelga"},
+                   3: {"modified": "a", "titulo": "Desvío", "linea_id": 20, "fecha_fin": "2000-01-01T00:00:00"}})
+    monkeypatch.setattr(warning_alerts, "_rest_adapter", api)
+    return api
+
+
+def _ids(alerts) -> list[int]:
+    return sorted(alert.id for alert in alerts)
+
+
+def test_sync_only_downloads_new_and_modified_alerts(fake_api):
+    store = AlertStore()
+    delta = store.sync()
+    assert (_ids(delta.added), delta.updated, delta.removed) == ([1, 2, 3], [], [])
+    assert _ids(store.for_line(10)) == [1]
+    assert _ids(store.for_stop(100, include_general=True)) == [1, 2]
+    assert store.for_line(20) == [] and _ids(store.for_line(20, when=datetime(1999, 1, 1))) == [3]
+
+    fake_api.viewed.clear()
+    assert not store.sync()
+    assert fake_api.viewed == []
+
+    fake_api.alerts[1] = {"modified": "b", "titulo": "Obras", "lineas": [11]}
+    del fake_api.alerts[2]
+    delta = store.sync()
+    assert (_ids(delta.added), _ids(delta.updated), _ids(delta.removed)) == ([], [1], [2])
+    assert fake_api.viewed == [1]
+    assert store.for_line(10) == [] and _ids(store.for_line(11)) == [1]
+    assert store.for_stop(100, include_general=True) == []
+
+
+def test_a_failed_alert_does_not_abort_the_sync(fake_api):
+    store = AlertStore()
+    store.sync()
+
+    fake_api.alerts[1]["modified"] = "b"
+    fake_api.alerts[4] = {"modified": "a", "titulo": "Nueva"}
+    fake_api.failing = {1}
+    delta = store.sync()
+    assert (_ids(delta.added), delta.updated, delta.failed) == ([4], [], [1])
+    assert store.get(1).title == "Obras"
+
+    fake_api.failing = set()
+    fake_api.viewed.clear()
+    assert _ids(store.sync().updated) == [1]
+    assert fake_api.viewed == [1]